@@ -8,6 +8,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from models.tank_model import WaterTank
 from models.ai_decision import AIDecisionMaker
 from utils.data_logger import DataLogger
+from utils.ring_buffer import to_dicts
 
 tank_bp = Blueprint('tank', __name__)
 
@@ -27,7 +28,7 @@ def get_tank_history():
     """الحصول على تاريخ قراءات الخزان"""
     limit = request.args.get('limit', default=100, type=int)
     history = tank.get_history(limit)
-    return jsonify(history)
+    return jsonify(to_dicts(history))
 
 @tank_bp.route('/update', methods=['POST'])
 def update_tank():
@@ -36,9 +37,9 @@ def update_tank():
     dt = data.get('dt', 1.0)
     
     # تحديث الفيزياء
-    tank.update_physics(dt)
+    tank.update_physics(dt, integrator=data.get('integrator'), target_level=data.get('target_level'))
     
     # تسجيل البيانات
     data_logger.log_tank_data(tank.get_state())
     
-    return jsonify({"success": True, "state": tank.get_state()})
\ No newline at end of file
+    return jsonify({"success": True, "state": tank.get_state(), "events": tank.last_events})
\ No newline at end of file
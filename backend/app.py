@@ -3,12 +3,15 @@ import sys
 import logging
 from flask import Flask, jsonify, request  
 from flask_cors import CORS
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, emit, join_room, leave_room
 import gevent
 from gevent import monkey
 from gevent.pywsgi import WSGIServer
 from geventwebsocket.handler import WebSocketHandler
+import math
 import time
+import uuid
+from datetime import datetime
 
 # ⚠️ IMPORTANT: monkey.patch_all() يجب أن يكون قبل أي استيراد آخر
 monkey.patch_all()
@@ -25,9 +28,27 @@ socketio = SocketIO(app, cors_allowed_origins="*", async_mode='gevent')
 # استيراد النماذج والأدوات
 try:
     from models.tank_model import WaterTank
-    from models.ai_decision import AIDecisionMaker
+    from models.ai_decision import AIDecisionMaker, AIConfig, CODE_ACTIONS
+    from models.physics_simulator import DiagnosticsCache
     from utils.data_logger import DataLogger
     from utils.alert_system import AlertSystem
+    from utils.state_snapshot import StateSnapshotter
+    from utils.ring_buffer import to_dicts
+    from utils.tick_scheduler import TickScheduler
+    from utils.telemetry_window import TelemetryWindow
+    from utils.config_loader import load_config
+    from utils.stats_service import StatsService
+    from utils.response_cache import ResponseCache
+    from utils.rollups import MinuteRollups, downsampled_readings
+    from utils.downsample import downsample
+    from utils.aggregate_query import Aggregate, run_aggregate_query
+    from utils.delta_stream import DeltaEncoder
+    from utils.broadcast_hub import BroadcastHub
+    from utils.subscriptions import DEFAULT_TANK, Subscriptions
+    from utils.wire_format import (
+        HTTP_MIMETYPES, available_formats, encode_event, encode_records,
+        negotiate, negotiate_http, packb, record_layout
+    )
     
     logger.info("✅ Models imported successfully")
 except ImportError as e:
@@ -35,10 +56,31 @@ except ImportError as e:
     sys.exit(1)
 
 # إنشاء مثيلات عالمية
+config = load_config()
 tank_model = WaterTank()
-ai_system = AIDecisionMaker()
+ai_system = AIDecisionMaker(AIConfig(**{
+    key: value for key, value in config.get('ai', {}).items()
+    if key in AIConfig.__dataclass_fields__
+}))
 data_logger = DataLogger()
 alert_system = AlertSystem(data_logger)
+stats_service = StatsService(data_logger)
+rollups = MinuteRollups(data_logger)
+responses = ResponseCache()
+subscriptions = Subscriptions()
+# البث عبر طوابير محدودة لكل عميل بدلاً من socketio.emit المباشر
+hub = BroadcastHub(
+    socketio,
+    max_queue=config.get('simulation', {}).get('client_queue_size', 8),
+    max_inflight=config.get('simulation', {}).get('client_max_inflight', 16)
+)
+delta_encoder = DeltaEncoder(config.get('simulation', {}).get('keyframe_interval', 30))
+ai_system.estimator.capacity = tank_model.config.max_capacity
+diagnostics = DiagnosticsCache(dt=config.get('simulation', {}).get('update_interval', 1.0))
+snapshotter = StateSnapshotter(interval=config.get('simulation', {}).get('snapshot_interval', 30.0))
+
+# استئناف الحالة من آخر لقطة محفوظة
+snapshotter.load(tank_model, ai_system, alert_system)
 
 # حالة المحاكاة
 simulation_running = False
@@ -64,15 +106,26 @@ def index():
         'endpoints': {
             'tank_state': '/api/tank/state',
             'tank_history': '/api/tank/history',
+            'tank_readings': '/api/tank/readings',
+            'tank_metrics': '/api/tank/metrics',
+            'tank_diagnostics': '/api/tank/diagnostics',
+            'tank_predict': '/api/tank/predict',
             'control_fill': '/api/control/fill',
             'control_drain': '/api/control/drain',
             'control_stop': '/api/control/stop',
             'alerts': '/api/alerts',
+            'alert_rules': '/api/alerts/rules',
             'system_stats': '/api/system/stats',
+            'system_broadcast': '/api/system/broadcast',
             'consumption_analysis': '/api/analysis/consumption',
             'consumption_report': '/api/analysis/report',
+            'readings_aggregate': '/api/analysis/aggregate',
+            'policy_replay': '/api/analysis/replay',
+            'policy_tuning': '/api/analysis/tune',
             'simulation_start': '/api/simulation/start',
-            'simulation_stop': '/api/simulation/stop'
+            'simulation_stop': '/api/simulation/stop',
+            'simulation_fork': '/api/simulation/fork',
+            'system_snapshot': '/api/system/snapshot'
         },
         'websocket': 'ws://localhost:5000'
     })
@@ -83,10 +136,9 @@ def index():
 def get_tank_state():
     """الحصول على حالة الخزان الحالية"""
     try:
-        state = tank_model.get_state()
-        return jsonify({
+        return responses.respond(tank_model.state_version(), lambda: {
             'success': True,
-            'data': state
+            'data': tank_model.get_state()
         })
     except Exception as e:
         logger.error(f"Error getting tank state: {e}")
@@ -100,14 +152,130 @@ def get_tank_history():
     """الحصول على تاريخ قراءات الخزان"""
     try:
         limit = request.args.get('limit', default=100, type=int)
-        history = tank_model.get_history(limit)
+        max_points = request.args.get('max_points', type=int)
+        method = request.args.get('method', default='lttb')
+        fmt = negotiate_http(request.accept_mimetypes)
+        
+        def build():
+            window = tank_model.get_history(limit)
+            if max_points:
+                window = window[downsample(window['timestamp'], window['water_level'], max_points, method)]
+            if fmt == 'struct':
+                # السجلات الخام بتخطيط HISTORY_DTYPE (الوصف في X-Record-Layout)
+                return encode_records(window)
+            history = to_dicts(window)
+            payload = {
+                'success': True,
+                'data': history,
+                'count': len(history)
+            }
+            return packb(payload) if fmt == 'msgpack' else payload
+        
+        response = responses.respond(
+            f"{tank_model.tick}.{tank_model.revision}", build,
+            key=f"{request.full_path}|{fmt}", mimetype=HTTP_MIMETYPES[fmt]
+        )
+        response.vary.add('Accept')
+        if fmt == 'struct':
+            response.headers['X-Record-Layout'] = record_layout(tank_model.history.dtype)
+        return response
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error getting tank history: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/tank/readings', methods=['GET'])
+def get_tank_readings():
+    """القراءات المحفوظة بنطاق زمني وإسقاط حقول وترقيم بالمؤشرات"""
+    try:
+        fields = request.args.get('fields')
+        fields = [name.strip() for name in fields.split(',')] if fields else None
+        max_points = request.args.get('max_points', type=int)
+        if max_points:
+            # وضع الرسوم: النطاق كاملاً مقللاً إلى max_points نقطة (بدون صفحات)
+            result = downsampled_readings(
+                data_logger, rollups,
+                start=request.args.get('start'),
+                end=request.args.get('end'),
+                fields=fields,
+                max_points=max(2, min(max_points, 10000)),
+                method=request.args.get('method', default='lttb')
+            )
+            return jsonify({
+                'success': True,
+                'data': result['data'],
+                'count': len(result['data']),
+                'source': result['source'],
+                'method': result['method'],
+                'source_points': result['source_points'],
+                'next_cursor': None
+            })
+        
+        rows, next_cursor = data_logger.query_readings(
+            start=request.args.get('start'),
+            end=request.args.get('end'),
+            fields=fields,
+            limit=max(1, min(request.args.get('limit', default=500, type=int), 5000)),
+            cursor=request.args.get('cursor')
+        )
         return jsonify({
             'success': True,
-            'data': history,
-            'count': len(history)
+            'data': rows,
+            'count': len(rows),
+            'next_cursor': next_cursor
         })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
-        logger.error(f"Error getting tank history: {e}")
+        logger.error(f"Error querying readings: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/tank/metrics', methods=['GET'])
+@app.route('/api/tank/diagnostics', methods=['GET'])
+def get_tank_diagnostics():
+    """التشخيصات الفيزيائية (تُحسب مرة واحدة على الأكثر لكل نبضة)"""
+    try:
+        sections = request.args.get('sections')
+        sections = [name.strip() for name in sections.split(',')] if sections else None
+        return responses.respond(tank_model.state_version(), lambda: {
+            'success': True,
+            'data': diagnostics.get(tank_model, sections)
+        })
+    except Exception as e:
+        logger.error(f"Error getting diagnostics: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/tank/predict', methods=['GET'])
+def predict_tank_level():
+    """التنبؤ بمستوى المياه من المقدّر المتدفق المشترك"""
+    try:
+        steps = request.args.get('steps', default=10, type=int)
+        dt = request.args.get('dt', default=1.0, type=float)
+        # الهدف يدخل في time_to_target فيُغيّر النسخة عند تعديله
+        version = (f"{tank_model.tick}.{tank_model.revision}.{ai_system.estimator.updates}."
+                   f"{ai_system.config.target_level}")
+        return responses.respond(version, lambda: {
+            'success': True,
+            'data': ai_system.predict_trend(tank_model.get_history(20), steps, dt)
+        })
+    except Exception as e:
+        logger.error(f"Error predicting tank level: {e}")
         return jsonify({
             'success': False,
             'error': str(e)
@@ -119,17 +287,25 @@ def update_tank():
     try:
         data = request.json or {}
         dt = data.get('dt', 1.0)
+        integrator = data.get('integrator')
+        target_level = data.get('target_level')
         
         # تحديث الفيزياء
-        tank_model.update_physics(dt)
+        tank_model.update_physics(dt, integrator=integrator, target_level=target_level)
         
         # تسجيل البيانات
         data_logger.log_tank_data(tank_model.get_state())
         
         return jsonify({
             'success': True,
-            'state': tank_model.get_state()
+            'state': tank_model.get_state(),
+            'events': tank_model.last_events
         })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         logger.error(f"Error updating tank: {e}")
         return jsonify({
@@ -251,6 +427,48 @@ def get_ai_decision():
             'error': str(e)
         }), 500
 
+@app.route('/api/control/ai/batch', methods=['POST'])
+def get_ai_batch_decisions():
+    """قرارات الذكاء الاصطناعي لأسطول خزانات (مصفوفات أعمدة)"""
+    try:
+        data = request.json or {}
+        levels = data.get('water_level', [])
+        if not isinstance(levels, list):
+            raise ValueError("water_level must be an array")
+        n = len(levels)
+        # كل الأعمدة بطول water_level (target_level قد يكون قيمة واحدة للجميع)
+        for name in ('is_filling', 'is_draining', 'leak_detected', 'tank_ids', 'target_level'):
+            column = data.get(name)
+            if name == 'target_level' and not isinstance(column, list):
+                continue
+            if column is not None and (not isinstance(column, list) or len(column) != n):
+                raise ValueError(f"{name} must be an array of length {n}")
+        codes, messages = ai_system.decide_batch(
+            levels,
+            data.get('is_filling', [False] * n),
+            data.get('is_draining', [False] * n),
+            data.get('leak_detected', [False] * n),
+            targets=data.get('target_level'),
+            tank_ids=data.get('tank_ids')
+        )
+        return jsonify({
+            'success': True,
+            'actions': codes.tolist(),
+            'action_names': {code: action.value for code, action in CODE_ACTIONS.items()},
+            'messages': {str(key): message for key, message in messages.items()}
+        })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error getting batch AI decisions: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 # ==================== Consumption Analysis ====================
 
 @app.route('/api/analysis/consumption', methods=['GET'])
@@ -260,12 +478,11 @@ def get_consumption_analysis():
         from utils.consumption_analyzer import ConsumptionAnalyzer
         
         days = request.args.get('days', default=7, type=int)
-        analyzer = ConsumptionAnalyzer()
-        analysis = analyzer.analyze_consumption_patterns(days)
         
-        return jsonify({
+        # التحليل لا يتغير إلا بإضافة قراءات جديدة
+        return responses.respond(stats_service.tank_readings_count, lambda: {
             'success': True,
-            'data': analysis
+            'data': ConsumptionAnalyzer().analyze_consumption_patterns(days)
         })
     except Exception as e:
         logger.error(f"Error analyzing consumption: {e}")
@@ -280,19 +497,15 @@ def get_consumption_report():
     """توليد تقرير استهلاك نصي"""
     try:
         from utils.consumption_analyzer import ConsumptionAnalyzer
-        from flask import Response
         
         days = request.args.get('days', default=7, type=int)
-        analyzer = ConsumptionAnalyzer()
-        report = analyzer.generate_report(days)
-        
-        return Response(
-            report,
-            mimetype='text/plain',
-            headers={
-                'Content-Disposition': f'attachment; filename=consumption_report_{days}d.txt'
-            }
+        response = responses.respond(
+            stats_service.tank_readings_count,
+            lambda: ConsumptionAnalyzer().generate_report(days),
+            mimetype='text/plain'
         )
+        response.headers['Content-Disposition'] = f'attachment; filename=consumption_report_{days}d.txt'
+        return response
     except Exception as e:
         logger.error(f"Error generating report: {e}")
         return jsonify({
@@ -300,67 +513,192 @@ def get_consumption_report():
             'error': str(e)
         }), 500
 
-# ==================== System Stats ====================
+@app.route('/api/analysis/aggregate', methods=['GET'])
+def aggregate_readings():
+    """تجميع القراءات بدلاء زمنية: ?bucket=3600&aggregates=temperature:avg,pressure:max,water_level:p95"""
+    try:
+        specs = request.args.get('aggregates', '')
+        result = run_aggregate_query(
+            data_logger, rollups,
+            bucket=request.args.get('bucket', default=3600, type=int),
+            aggregates=[Aggregate.parse(spec) for spec in specs.split(',') if spec.strip()],
+            start=request.args.get('start'),
+            end=request.args.get('end')
+        )
+        return jsonify({
+            'success': True,
+            **result
+        })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error aggregating readings: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
 
-@app.route('/api/system/stats', methods=['GET'])
-def system_stats():
-    """إحصائيات النظام"""
+@app.route('/api/analysis/replay', methods=['POST'])
+def replay_policies():
+    """مقارنة سياسات قرار بإعادة تشغيل البيانات التاريخية أو سيناريو"""
     try:
-        # استخدام DataLogger للحصول على الإحصائيات
-        import sqlite3
-        from datetime import datetime, timedelta
-        
-        conn = sqlite3.connect(data_logger.db_path)
-        cursor = conn.cursor()
-        
-        # عدد القراءات
-        cursor.execute('SELECT COUNT(*) FROM tank_readings')
-        total_readings = cursor.fetchone()[0]
-        
-        # آخر قراءة
-        cursor.execute('SELECT timestamp FROM tank_readings ORDER BY timestamp DESC LIMIT 1')
-        last_reading_row = cursor.fetchone()
-        last_reading = last_reading_row[0] if last_reading_row else None
+        from utils.policy_tuner import scenario_path
+        from utils.replay_evaluator import ReplayTrace, ReplayEvaluator
         
-        # أول قراءة
-        cursor.execute('SELECT timestamp FROM tank_readings ORDER BY timestamp ASC LIMIT 1')
-        first_reading_row = cursor.fetchone()
-        first_reading = first_reading_row[0] if first_reading_row else None
+        data = request.json or {}
+        policies = data.get('policies') or [{}]
+        capacity = tank_model.config.max_capacity
         
-        # متوسط مستوى المياه في آخر 24 ساعة
-        yesterday = (datetime.now() - timedelta(hours=24)).isoformat()
-        cursor.execute('''
-            SELECT AVG(water_level) 
-            FROM tank_readings 
-            WHERE timestamp >= ?
-        ''', (yesterday,))
-        avg_level_row = cursor.fetchone()
-        avg_water_level_24h = avg_level_row[0] if avg_level_row[0] else 0
+        if data.get('scenario'):
+            trace = ReplayTrace.from_scenario(scenario_path(data['scenario']), capacity)
+        else:
+            trace = ReplayTrace.from_database(
+                data_logger.db_path, data.get('start_time'), data.get('end_time'), capacity
+            )
         
-        # التنبيهات النشطة
-        cursor.execute('SELECT COUNT(*) FROM alerts WHERE resolved = FALSE')
-        active_alerts = cursor.fetchone()[0]
+        started = time.perf_counter()
+        results = ReplayEvaluator(trace).evaluate(policies)
+        return jsonify({
+            'success': True,
+            'data': results,
+            'steps': len(trace),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+        })
+    except (ValueError, FileNotFoundError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error replaying policies: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+# مهام الضبط تعمل في الخلفية (مهمة واحدة في كل مرة، وتُحفظ آخر MAX_TUNING_JOBS)
+MAX_TUNING_JOBS = 10
+tuning_jobs = {}
+
+def _run_tuning_job(job_id, tuner, grid):
+    """تنفيذ مهمة ضبط خارج الطلب وتطبيق نقطة التسوية عند الطلب"""
+    from utils.policy_tuner import check_parameter
+    
+    job = tuning_jobs[job_id]
+    try:
+        if tuner.workers > 1:
+            # انتظار مجمع العمليات تعاوني تحت gevent
+            report = tuner.run(grid)
+        else:
+            # التقييم التسلسلي حسابي بحت فيُنقل إلى خيط أصلي
+            report = gevent.get_hub().threadpool.apply(tuner.run, (grid,))
+        job['report'] = report
+        if job['apply'] and report['recommended']:
+            applied = {}
+            for key, value in report['recommended']['config'].items():
+                if key in AIConfig.__dataclass_fields__:
+                    applied[key] = check_parameter(key, value)
+            for key, value in applied.items():
+                setattr(ai_system.config, key, value)
+            job['applied'] = applied
+        job['status'] = 'done'
+    except Exception as e:
+        logger.error(f"Error in tuning job {job_id}: {e}")
+        job['status'] = 'failed'
+        job['error'] = str(e)
+    job['finished_at'] = datetime.now().isoformat()
+    
+    finished = [key for key, item in tuning_jobs.items() if item['status'] != 'running']
+    for key in finished[:max(0, len(tuning_jobs) - MAX_TUNING_JOBS)]:
+        del tuning_jobs[key]
+
+@app.route('/api/analysis/tune', methods=['POST'])
+def tune_policies():
+    """بدء مهمة ضبط معاملات الذكاء الاصطناعي في الخلفية (النتيجة عبر /api/analysis/tune/<job_id>)"""
+    try:
+        from utils.policy_tuner import DEFAULT_GRID, PolicyTuner, check_grid
         
-        # سجلات الذكاء الاصطناعي
-        cursor.execute('SELECT COUNT(*) FROM ai_logs')
-        ai_logs_count = cursor.fetchone()[0]
+        if any(job['status'] == 'running' for job in tuning_jobs.values()):
+            return jsonify({
+                'success': False,
+                'error': 'A tuning job is already running'
+            }), 409
         
-        conn.close()
+        data = request.json or {}
+        tuning = config.get('tuning', {})
+        tuner = PolicyTuner(
+            data.get('scenarios', tuning.get('scenarios')),
+            capacity=tank_model.config.max_capacity,
+            workers=data.get('workers', tuning.get('workers'))
+        )
+        grid = check_grid(data.get('grid') or tuning.get('grid') or DEFAULT_GRID)
         
-        stats = {
-            'tank_readings_count': total_readings,
-            'first_reading': first_reading,
-            'last_reading': last_reading,
-            'active_alerts': active_alerts,
-            'ai_logs_count': ai_logs_count,
-            'avg_water_level_24h': round(avg_water_level_24h, 2) if avg_water_level_24h else 0,
-            'simulation_running': simulation_running,
-            'current_state': tank_model.get_state()
+        job_id = uuid.uuid4().hex[:12]
+        tuning_jobs[job_id] = {
+            'id': job_id,
+            'status': 'running',
+            'apply': bool(data.get('apply')),
+            'workers': tuner.workers,
+            'started_at': datetime.now().isoformat(),
+            'finished_at': None,
+            'report': None,
+            'applied': None,
+            'error': None
         }
-        
+        gevent.spawn(_run_tuning_job, job_id, tuner, grid)
         return jsonify({
             'success': True,
-            'data': stats
+            'job': tuning_jobs[job_id]
+        }), 202
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error tuning policies: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/analysis/tune/<job_id>', methods=['GET'])
+def get_tuning_job(job_id):
+    """حالة مهمة ضبط ونتيجتها"""
+    job = tuning_jobs.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': f'Unknown tuning job: {job_id}'
+        }), 404
+    return jsonify({
+        'success': True,
+        'job': job
+    })
+
+# ==================== System Stats ====================
+
+@app.route('/api/system/stats', methods=['GET'])
+def system_stats():
+    """إحصائيات النظام"""
+    try:
+        # العدادات محفوظة في الذاكرة وتُحدّث مع كل كتابة
+        version = (
+            f"{stats_service.tank_readings_count}.{stats_service.ai_logs_count}."
+            f"{alert_system.active.revision}.{tank_model.state_version()}."
+            f"{simulation_running}.{int(time.time() // 60)}"
+        )
+        return responses.respond(version, lambda: {
+            'success': True,
+            'data': dict(
+                stats_service.get_stats(),
+                active_alerts=len(alert_system.active),
+                simulation_running=simulation_running,
+                current_state=tank_model.get_state()
+            )
         })
     except Exception as e:
         logger.error(f"Error getting system stats: {e}")
@@ -369,6 +707,45 @@ def system_stats():
             'error': str(e)
         }), 500
 
+@app.route('/api/system/broadcast', methods=['GET'])
+def broadcast_metrics():
+    """مقاييس البث: أعماق طوابير العملاء والإطارات المسقطة ونسبة الدلتا"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': {
+                'hub': hub.get_metrics(),
+                'delta': delta_encoder.get_stats(),
+                'subscriptions': {
+                    'clients': len(subscriptions.clients),
+                    'rooms': len(subscriptions.members)
+                }
+            }
+        })
+    except Exception as e:
+        logger.error(f"Error getting broadcast metrics: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/system/snapshot', methods=['POST'])
+def save_snapshot():
+    """حفظ لقطة فورية لحالة التوأم الرقمي"""
+    try:
+        size = snapshotter.save(tank_model, ai_system, alert_system)
+        return jsonify({
+            'success': True,
+            'path': str(snapshotter.path),
+            'size_bytes': size
+        })
+    except Exception as e:
+        logger.error(f"Error saving snapshot: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 # ==================== Alerts ====================
 
 @app.route('/api/alerts', methods=['GET'])
@@ -378,13 +755,24 @@ def get_alerts():
         unresolved_only = request.args.get('unresolved_only', 'true').lower() == 'true'
         limit = request.args.get('limit', default=100, type=int)
         severity = request.args.get('severity', type=str)
+        alert_type = request.args.get('type', type=str)
         
-        alerts = data_logger.get_alerts(unresolved_only, limit, severity)
-        return jsonify({
-            'success': True,
-            'data': alerts,
-            'count': len(alerts)
-        })
+        def build():
+            # النشطة من الفهرس في الذاكرة، والسجل الكامل من قاعدة البيانات
+            if unresolved_only:
+                alerts = alert_system.get_active_alerts(limit, severity, alert_type)
+            else:
+                alerts = data_logger.get_alerts(unresolved_only, limit, severity)
+            return {
+                'success': True,
+                'data': alerts,
+                'count': len(alerts)
+            }
+        
+        # العرض النشط يتغير مع الفهرس؛ السجل الكامل يتغير مع أي كتابة في جدول التنبيهات
+        # (بما فيها تحديثات التنبيهات المُعترف بها التي لم تعد في الفهرس)
+        version = f"{alert_system.active.revision}.{data_logger.alerts_revision}"
+        return responses.respond(version, build)
     except Exception as e:
         logger.error(f"Error getting alerts: {e}")
         return jsonify({
@@ -396,7 +784,11 @@ def get_alerts():
 def acknowledge_alert(alert_id):
     """التعرف على تنبيه"""
     try:
-        alert_system.acknowledge_alert(alert_id)
+        if not alert_system.acknowledge_alert(alert_id):
+            return jsonify({
+                'success': False,
+                'error': f'Alert {alert_id} is not active'
+            }), 404
         return jsonify({
             'success': True,
             'message': f'Alert {alert_id} acknowledged'
@@ -408,20 +800,65 @@ def acknowledge_alert(alert_id):
             'error': str(e)
         }), 500
 
+@app.route('/api/alerts/acknowledge', methods=['POST'])
+def acknowledge_alerts():
+    """التعرف على عدة تنبيهات دفعة واحدة"""
+    try:
+        data = request.json or {}
+        ids = [int(alert_id) for alert_id in data.get('ids', [])]
+        count = alert_system.acknowledge_alerts(ids)
+        return jsonify({
+            'success': True,
+            'message': f'{count} alerts acknowledged',
+            'count': count
+        })
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error acknowledging alerts: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/alerts/rules', methods=['GET'])
+def get_alert_rules():
+    """قواعد التنبيه المحمّلة حالياً"""
+    return jsonify({
+        'success': True,
+        'data': alert_system.get_rules()
+    })
+
+@app.route('/api/alerts/rules/reload', methods=['POST'])
+def reload_alert_rules():
+    """إعادة تحميل قواعد التنبيه من alert_rules.yaml دون إعادة التشغيل"""
+    try:
+        count = alert_system.reload_rules()
+        return jsonify({
+            'success': True,
+            'message': f'{count} alert rules loaded',
+            'count': count
+        })
+    except Exception as e:
+        logger.error(f"Error reloading alert rules: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
 @app.route('/api/alerts/clear', methods=['POST'])
 def clear_alerts():
     """حذف جميع التنبيهات"""
     try:
-        import sqlite3
-        conn = sqlite3.connect(data_logger.db_path)
-        cursor = conn.cursor()
-        cursor.execute('UPDATE alerts SET resolved = TRUE')
-        conn.commit()
-        conn.close()
+        count = alert_system.clear_all_alerts()
         
         return jsonify({
             'success': True,
-            'message': 'All alerts cleared'
+            'message': 'All alerts cleared',
+            'count': count
         })
     except Exception as e:
         logger.error(f"Error clearing alerts: {e}")
@@ -435,15 +872,8 @@ def clear_alerts():
 @app.route('/api/simulation/start', methods=['POST'])
 def start_simulation():
     """بدء المحاكاة"""
-    global simulation_running
-    
     if not simulation_running:
-        simulation_running = True
-        
-        # بدء حلقة المحاكاة في thread منفصل
-        import threading
-        thread = threading.Thread(target=tank_simulation_loop, daemon=True)
-        thread.start()
+        start_scheduler()
         
         data_logger.log_ai_message("🚀 بدء محاكاة التوأم الرقمي", "system")
         logger.info("✅ Simulation started")
@@ -461,9 +891,7 @@ def start_simulation():
 @app.route('/api/simulation/stop', methods=['POST'])
 def stop_simulation():
     """إيقاف المحاكاة"""
-    global simulation_running
-    
-    simulation_running = False
+    stop_scheduler()
     data_logger.log_ai_message("⏹ إيقاف محاكاة التوأم الرقمي", "system")
     logger.info("⏹ Simulation stopped")
     
@@ -480,119 +908,316 @@ def simulation_status():
         'data': {
             'running': simulation_running,
             'tank_state': tank_model.get_state(),
-            'ai_mode': tank_model.ai_mode
+            'ai_mode': tank_model.ai_mode,
+            'ai_learning': {
+                'tolerance': round(ai_system.config.tolerance, 3),
+                'stats': ai_system.learner.get_stats()
+            },
+            'scheduler': scheduler.get_stats()
         }
     })
 
+# أقصى عدد خطوات لمحاكاة متفرعة (تعمل داخل عامل gevent الوحيد)
+MAX_FORK_STEPS = 100000
+
+@app.route('/api/simulation/fork', methods=['POST'])
+def fork_simulation():
+    """تشغيل سيناريو انطلاقاً من نسخة من الحالة الحية"""
+    try:
+        data = request.json or {}
+        duration = float(data.get('duration', 3600))
+        dt = float(data.get('dt', 60))
+        leak = data.get('leak')
+        if not (math.isfinite(duration) and duration > 0 and math.isfinite(dt) and dt > 0):
+            raise ValueError("duration and dt must be positive finite numbers")
+        if duration / dt > MAX_FORK_STEPS:
+            raise ValueError(f"Too many steps (duration / dt must not exceed {MAX_FORK_STEPS})")
+        
+        tank_copy, ai_copy = snapshotter.clone(tank_model, ai_system)
+        if leak is not None:
+            tank_copy.simulate_leak(bool(leak))
+        if 'target_level' in data:
+            ai_copy.config.target_level = data['target_level']
+        
+        events = []
+        elapsed = 0.0
+        while elapsed < duration:
+            step = min(dt, duration - elapsed)
+            target = ai_copy.config.target_level if tank_copy.ai_mode else None
+            tank_copy.update_physics(step, integrator='exact', target_level=target)
+            elapsed += step
+            events.extend(dict(e, time=round(elapsed - step + e['time'], 3)) for e in tank_copy.last_events)
+            
+            if tank_copy.ai_mode:
+                action, _, _ = ai_copy.analyze(tank_copy.get_state(), tank_copy.get_history(20))
+                tank_copy.set_fill(action.value == "fill")
+                tank_copy.set_drain(action.value == "drain")
+        
+        return jsonify({
+            'success': True,
+            'duration': duration,
+            'final_state': tank_copy.get_state(),
+            'events': events
+        })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error running forked simulation: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 # ==================== محاكاة الخزان ====================
 
-def tank_simulation_loop():
-    """حلقة محاكاة الخزان في الوقت الحقيقي"""
-    global simulation_running
+# نافذة القياسات المشتركة: تنشر فيها مرحلة الفيزياء وتقرأ منها بقية المراحل
+telemetry = TelemetryWindow(config.get('simulation', {}).get('telemetry_window', 1000))
+telemetry.publish(tank_model.get_state(), tank_model.tick)
+
+def physics_stage(dt):
+    """مرحلة الفيزياء: تقدم الزمن ونشر الحالة"""
+    state = tank_model.update_physics(dt=dt)
+    telemetry.publish(state, tank_model.tick)
+
+def persistence_stage(dt):
+    """مرحلة التخزين: تسجيل القراءة وحفظ اللقطات الدورية"""
+    data_logger.log_tank_data(telemetry.latest())
+    snapshotter.maybe_save(tank_model, ai_system, alert_system)
+
+def alerting_stage(dt):
+    """مرحلة التنبيهات"""
+    state = telemetry.latest()
+    if ai_system.estimator.track_leak and ai_system.estimator.updates >= 5:
+        state = dict(state, estimated_leak_rate=round(ai_system.estimator.leak_rate, 5))
+    # تُرجع الانتقالات فقط (إطلاق، إعادة إشعار، إلغاء)
+    for alert in alert_system.check_alerts(state):
+        event = 'alert_cleared' if alert['state'] == 'cleared' else 'alert'
+        subscriptions.emit(hub, event, alert, tank=alert.get('tank_id', DEFAULT_TANK),
+                           severity=alert.get('severity'))
+
+def broadcast_stage(dt):
+    """مرحلة البث عبر WebSocket"""
+    state = telemetry.latest()
+    hub.flush_all()
+    subscriptions.emit(hub, 'tank_update', state, delta=delta_encoder.next(state))
+
+# آخر رقم تسلسل تعلّم منه الذكاء الاصطناعي في نافذة القياسات
+ai_observed_sequence = telemetry.sequence
+
+def ai_stage(dt):
+    """مرحلة قرارات الذكاء الاصطناعي"""
+    global ai_observed_sequence
     
-    logger.info("🚀 Simulation loop started")
+    # التعلم المباشر من القراءات الجديدة منذ آخر قرار
+    sequence, window = telemetry.read(telemetry.sequence - ai_observed_sequence)
+    ai_system.observe_window(window)
+    ai_observed_sequence = sequence
     
-    while simulation_running:
-        try:
-            # تحديث الفيزياء
-            tank_model.update_physics(dt=1.0)
-            
-            # تسجيل البيانات
-            current_state = tank_model.get_state()
-            data_logger.log_tank_data(current_state)
-            
-            # كشف التنبيهات
-            alerts = alert_system.check_alerts(current_state)
-            if alerts:
-                for alert in alerts:
-                    socketio.emit('alert', alert)
-                    logger.warning(f"🚨 Alert: {alert.get('message', 'Unknown')}")
-            
-            # إرسال تحديث عبر WebSocket
-            socketio.emit('tank_update', current_state)
-            
-            # قرارات الذكاء الاصطناعي
-            if tank_model.ai_mode:
-                history = data_logger.get_tank_data(limit=20)
-                action, message, details = ai_system.analyze(current_state, history)
-                
-                # تنفيذ القرار
-                if action.value == "fill":
-                    tank_model.set_fill(True)
-                    tank_model.set_drain(False)
-                elif action.value == "drain":
-                    tank_model.set_fill(False)
-                    tank_model.set_drain(True)
-                elif action.value == "stop":
-                    tank_model.set_fill(False)
-                    tank_model.set_drain(False)
-                
-                if message:
-                    data_logger.log_ai_message(message, 'ai_decision', details)
-                    socketio.emit('ai_log', {
-                        'message': message,
-                        'type': 'ai_decision',
-                        'details': details,
-                        'timestamp': time.time()
-                    })
-            
-            # انتظار ثانية واحدة
-            time.sleep(1)
-            
-        except Exception as e:
-            logger.error(f"❌ Error in simulation loop: {e}")
-            time.sleep(1)
+    if not tank_model.ai_mode:
+        return
+    
+    # نافذة بالترتيب الزمني من الذاكرة، بدون أي استعلام لقاعدة البيانات
+    action, message, details = ai_system.analyze(telemetry.latest(), telemetry.window(20))
+    
+    # تنفيذ القرار
+    if action.value == "fill":
+        tank_model.set_fill(True)
+        tank_model.set_drain(False)
+    elif action.value == "drain":
+        tank_model.set_fill(False)
+        tank_model.set_drain(True)
+    elif action.value == "stop":
+        tank_model.set_fill(False)
+        tank_model.set_drain(False)
+    
+    # وضع MPC يختار معدل التدفق أيضاً
+    if details.get('mode') == 'mpc' and action.value in ("fill", "drain"):
+        tank_model.set_flow_rate(details['flow_rate'])
     
-    logger.info("⏹ Simulation loop stopped")
+    if message:
+        data_logger.log_ai_message(message, 'ai_decision', details)
+        subscriptions.emit(hub, 'ai_log', {
+            'message': message,
+            'type': 'ai_decision',
+            'details': details,
+            'timestamp': time.time()
+        })
+
+def build_scheduler() -> TickScheduler:
+    """إنشاء مجدول المراحل بمعدلات config.yaml"""
+    sim_config = config.get('simulation', {})
+    ai_config = config.get('ai', {})
+    update_interval = sim_config.get('update_interval', 1.0)
+    
+    # الإزاحات تضمن أن المراحل اللاحقة تقرأ حالة النبضة الحالية
+    scheduler = TickScheduler()
+    scheduler.add_stage('physics', update_interval, physics_stage)
+    scheduler.add_stage('persistence', sim_config.get('persist_interval', update_interval),
+                        persistence_stage, offset=0.1 * update_interval)
+    scheduler.add_stage('alerting', sim_config.get('alert_interval', update_interval),
+                        alerting_stage, offset=0.1 * update_interval)
+    scheduler.add_stage('broadcast', sim_config.get('broadcast_interval', update_interval),
+                        broadcast_stage, offset=0.2 * update_interval)
+    scheduler.add_stage('ai', ai_config.get('decision_interval', 2.0),
+                        ai_stage, offset=0.3 * update_interval)
+    return scheduler
+
+scheduler = build_scheduler()
+
+def start_scheduler():
+    """بدء مجدول المحاكاة"""
+    global simulation_running
+    simulation_running = True
+    scheduler.start()
+    logger.info("🚀 Simulation scheduler started")
+
+def stop_scheduler():
+    """إيقاف مجدول المحاكاة"""
+    global simulation_running
+    simulation_running = False
+    scheduler.stop()
+    logger.info("⏹ Simulation scheduler stopped")
 
 # ==================== WebSocket Events ====================
 
+def _flag(value) -> bool:
+    """قيمة منطقية من معامل اتصال أو حقل حدث"""
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+def _names(value):
+    """قائمة أسماء من نص مفصول بفواصل أو قائمة (None = بدون تغيير)"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [name.strip() for name in value.split(',') if name.strip()]
+    return [str(name) for name in value]
+
+def _subscribe(**changes):
+    """تعديل اشتراك العميل الحالي ونقله بين الغرف"""
+    leave, join, sub = subscriptions.update(request.sid, **changes)
+    for room in leave:
+        leave_room(room)
+    for room in join:
+        join_room(room)
+    return sub
+
+def _send_state(sub):
+    """إرسال الحالة الكاملة للعميل الحالي فقط (إطار مفتاحي في وضع الدلتا)"""
+    if sub.delta:
+        frame = delta_encoder.keyframe(tank_model.get_state())
+        emit('tank_update_delta', encode_event('tank_update_delta', frame, sub.fmt))
+    else:
+        emit('tank_update', encode_event('tank_update', tank_model.get_state(), sub.fmt))
+
 @socketio.on('connect')
 def handle_connect():
     """عند اتصال عميل جديد"""
     logger.info('🔌 Client connected')
-    socketio.emit('connected', {
+    # الاشتراك يُحدد في معاملات الاتصال (?format=msgpack&delta=1&tanks=main&events=alert&min_severity=high)
+    # أو لاحقاً بأحداث subscribe/unsubscribe/set_format
+    args = request.args
+    try:
+        sub = _subscribe(
+            fmt=negotiate(args.get('format')),
+            delta=_flag(args.get('delta')),
+            tanks=_names(args.get('tanks')),
+            events=_names(args.get('events')),
+            min_severity=args.get('min_severity')
+        )
+    except ValueError as e:
+        emit('error', {'message': str(e)})
+        sub = _subscribe(fmt=negotiate(args.get('format')))
+    emit('connected', {
         'message': 'Connected to Water Tank Digital Twin',
         'timestamp': time.time(),
-        'simulation_running': simulation_running
+        'simulation_running': simulation_running,
+        'formats': list(available_formats()),
+        **sub.to_dict()
     })
     
     # إرسال الحالة الأولية
-    state = tank_model.get_state()
-    socketio.emit('tank_update', state)
+    if 'tank_update' in sub.events:
+        _send_state(sub)
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """عند قطع اتصال عميل"""
     logger.info('🔌 Client disconnected')
+    subscriptions.discard(request.sid)
+    hub.discard(request.sid)
+
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """تعديل الاشتراك: {tanks, events, min_severity} (الحقول الغائبة لا تتغير)"""
+    data = data or {}
+    try:
+        before = subscriptions.get(request.sid)
+        sub = _subscribe(
+            tanks=_names(data.get('tanks')),
+            events=_names(data.get('events')),
+            min_severity=data.get('min_severity')
+        )
+        emit('subscribed', sub.to_dict())
+        # حالة أولية عند الاشتراك الجديد في التحديثات أو في خزان جديد
+        if 'tank_update' in sub.events and ('tank_update' not in before.events or sub.tanks - before.tanks):
+            _send_state(sub)
+    except ValueError as e:
+        emit('error', {'message': str(e)})
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data):
+    """إلغاء الاشتراك في خزانات أو أنواع أحداث"""
+    data = data or {}
+    current = subscriptions.get(request.sid)
+    tanks = set(_names(data.get('tanks')) or [])
+    events = set(_names(data.get('events')) or [])
+    sub = _subscribe(tanks=current.tanks - tanks, events=current.events - events)
+    emit('subscribed', sub.to_dict())
+
+@socketio.on('set_format')
+def handle_set_format(data):
+    """تغيير صيغة النقل أو وضع الدلتا للعميل الحالي"""
+    data = data or {}
+    was_delta = subscriptions.get(request.sid).delta
+    sub = _subscribe(
+        fmt=negotiate(data['format']) if 'format' in data else None,
+        delta=_flag(data['delta']) if 'delta' in data else None
+    )
+    emit('format_set', {'format': sub.fmt, 'delta': sub.delta, 'formats': list(available_formats())})
+    if sub.delta and not was_delta:
+        _send_state(sub)
+
+@socketio.on('resync')
+def handle_resync(data=None):
+    """طلب إطار مفتاحي بعد اكتشاف فجوة في ترقيم إطارات الدلتا"""
+    sub = subscriptions.get(request.sid)
+    frame = delta_encoder.keyframe(tank_model.get_state())
+    emit('tank_update_delta', encode_event('tank_update_delta', frame, sub.fmt))
 
 @socketio.on('request_update')
 def handle_request_update(data):
-    """طلب تحديث البيانات"""
-    component = data.get('component', 'tank')
+    """طلب تحديث البيانات (الرد للعميل الطالب فقط)"""
+    component = (data or {}).get('component', 'tank')
+    sub = subscriptions.get(request.sid)
     
     try:
-        if component == 'tank':
-            state = tank_model.get_state()
-            socketio.emit('tank_update', state)
+        if component in ('tank', 'all'):
+            _send_state(sub)
         
-        elif component == 'alerts':
-            alerts = data_logger.get_alerts(unresolved_only=True, limit=10)
-            socketio.emit('alerts_update', alerts)
+        if component in ('alerts', 'all'):
+            alerts = alert_system.get_active_alerts(limit=10)
+            emit('alerts_update', encode_event('alerts_update', alerts, sub.fmt))
         
-        elif component == 'ai_logs':
+        if component in ('ai_logs', 'all'):
             logs = ai_system.get_recent_logs(10)
-            socketio.emit('ai_logs_update', logs)
-        
-        elif component == 'all':
-            # إرسال كل البيانات
-            socketio.emit('tank_update', tank_model.get_state())
-            socketio.emit('alerts_update', data_logger.get_alerts(unresolved_only=True, limit=10))
-            socketio.emit('ai_logs_update', ai_system.get_recent_logs(10))
+            emit('ai_logs_update', encode_event('ai_logs_update', logs, sub.fmt))
             
     except Exception as e:
         logger.error(f"Error handling request_update: {e}")
-        socketio.emit('error', {'message': str(e)})
+        emit('error', {'message': str(e)})
 
 # ==================== معالج الأخطاء ====================
 
@@ -635,11 +1260,9 @@ if __name__ == '__main__':
     logger.info("=" * 60)
     
     # بدء المحاكاة تلقائياً
-    simulation_running = True
-    import threading
-    sim_thread = threading.Thread(target=tank_simulation_loop, daemon=True)
-    sim_thread.start()
-    logger.info("✅ Auto-started simulation thread")
+    if config.get('simulation', {}).get('auto_start', True):
+        start_scheduler()
+        logger.info("✅ Auto-started simulation scheduler")
     
     # تشغيل الخادم
     try:
@@ -649,8 +1272,9 @@ if __name__ == '__main__':
         server.serve_forever()
     except KeyboardInterrupt:
         logger.info("\n👋 Shutting down server...")
-        simulation_running = False
+        stop_scheduler()
+        snapshotter.save(tank_model, ai_system, alert_system)
         logger.info("✅ Server stopped successfully")
     except Exception as e:
         logger.error(f"❌ Server error: {e}")
-        simulation_running = False
\ No newline at end of file
+        stop_scheduler()
\ No newline at end of file
@@ -2,9 +2,13 @@ import numpy as np
 from typing import Dict, Any, Optional, Tuple
 from datetime import datetime
 import logging
-from dataclasses import dataclass
+import time
+from dataclasses import dataclass, asdict
 from enum import Enum
 
+from models.online_learner import OnlineLearner
+from models.level_estimator import LevelEstimator
+
 logger = logging.getLogger(__name__)
 
 class AIAction(Enum):
@@ -19,9 +23,37 @@ class AIConfig:
     target_level: float = 80.0
     tolerance: float = 1.0  # نسبة مئوية
     decision_interval: float = 2.0  # ثانية
-    leak_threshold: float = 0.3  # انخفاض/ثانية
+    leak_threshold: float = 0.3  # انخفاض غير مفسر بالصمامات (%/ثانية)
     prediction_horizon: int = 10  # خطوات تنبؤ
     learning_rate: float = 0.01
+    learning_enabled: bool = True
+    min_tolerance: float = 0.5
+    max_tolerance: float = 2.0
+    track_leak: bool = True  # تقدير معدل التسرب في مرشح كالمان
+    decision_mode: str = "threshold"  # threshold | mpc
+    mpc_flow_rates: Tuple[float, ...] = (10.0, 20.0, 35.0, 50.0)  # لتر/دقيقة
+    mpc_budget_ms: float = 1.0  # الحد الأقصى لزمن القرار
+    mpc_switch_weight: float = 0.5  # تكلفة كل تبديل صمام
+    mpc_energy_weight: float = 0.001  # تكلفة كل لتر يُضخ
+    mpc_overshoot_weight: float = 10.0  # تكلفة تجاوز الهدف
+
+# حقول AIConfig التي تتغير أثناء التشغيل (هدف المشغل، التسامح المتعلم، الضبط التلقائي)
+# وتُستعاد من اللقطة؛ بقية الحقول إعدادات ثابتة تبقى من config.yaml
+RUNTIME_CONFIG_FIELDS = (
+    'target_level', 'tolerance', 'leak_threshold', 'prediction_horizon',
+    'decision_interval', 'decision_mode'
+)
+
+# رموز الإجراءات في الحسابات المتجهة
+ACTION_CODES = {AIAction.STOP: 0, AIAction.FILL: 1, AIAction.DRAIN: 2}
+CODE_ACTIONS = {code: action for action, code in ACTION_CODES.items()}
+
+def _level_series(historical_data) -> np.ndarray:
+    """سلسلة مستويات المياه بالترتيب الزمني (عرض بدون نسخ للمصفوفات المهيكلة)"""
+    if isinstance(historical_data, np.ndarray):
+        return historical_data['water_level']
+    return np.fromiter((d['water_level'] for d in historical_data), dtype=float,
+                       count=len(historical_data))
 
 class AIDecisionMaker:
     """صانع قرارات الذكاء الاصطناعي"""
@@ -32,6 +64,9 @@ class AIDecisionMaker:
         self.patterns_learned = []
         self.last_action = None
         self.action_history = []
+        self._mpc_candidates = {}
+        self.learner = OnlineLearner(alpha=self.config.learning_rate)
+        self.estimator = LevelEstimator(track_leak=self.config.track_leak)
         
     def analyze(self, tank_state: Dict[str, Any], historical_data: list) -> Tuple[AIAction, str, dict]:
         """تحليل حالة الخزان واتخاذ القرار"""
@@ -48,6 +83,9 @@ class AIDecisionMaker:
             self._add_log(log_msg, "emergency")
             return AIAction.STOP, log_msg, {"emergency": True}
         
+        if self.config.decision_mode == "mpc":
+            return self._analyze_mpc(tank_state)
+        
         # حساب الفرق عن الهدف
         level_diff = current_level - self.config.target_level
         
@@ -70,7 +108,7 @@ class AIDecisionMaker:
                 }
             else:
                 # التحقق من كفاءة الملء
-                efficiency = self._check_fill_efficiency(historical_data)
+                efficiency = self._check_fill_efficiency(historical_data, flow_rate)
                 if efficiency < 0.5:
                     log_msg = f"⚠️ كفاءة الملء منخفضة ({efficiency:.0%})"
                     self._add_log(log_msg, "warning")
@@ -93,12 +131,172 @@ class AIDecisionMaker:
         
         return AIAction.STOP, "لا إجراء", {"status": "idle"}
     
-    def predict_trend(self, historical_data: list, steps: int = 10) -> Dict[str, Any]:
+    def decide_batch(self, levels, is_filling, is_draining, leak_detected,
+                     targets=None, tank_ids=None, tolerances=None,
+                     with_messages: bool = True) -> Tuple[np.ndarray, Dict[Any, str]]:
+        """قرارات متجهة لأسطول كامل من الخزانات في تمريرة NumPy واحدة
+
+        المدخلات مصفوفات أعمدة بطول عدد الخزانات. تُرجع رموز الإجراءات
+        (ACTION_CODES) ورسائل نصية فقط للخزانات التي تغير إجراؤها.
+        with_messages=False (للإعادة المضادة للواقع) يتخطى الرسائل والسجلات.
+        """
+        levels = np.asarray(levels, dtype=float)
+        is_filling = np.asarray(is_filling, dtype=bool)
+        is_draining = np.asarray(is_draining, dtype=bool)
+        leak_detected = np.asarray(leak_detected, dtype=bool)
+        targets = np.broadcast_to(
+            np.asarray(self.config.target_level if targets is None else targets, dtype=float),
+            levels.shape
+        )
+        
+        tolerances = self.config.tolerance if tolerances is None else np.asarray(tolerances, dtype=float)
+        
+        # نفس منطق analyze: تسرب أو ضمن التسامح -> توقف، أقل -> ملء، أعلى -> تفريغ
+        diff = levels - targets
+        codes = np.select(
+            [leak_detected, np.abs(diff) <= tolerances, diff < 0],
+            [ACTION_CODES[AIAction.STOP], ACTION_CODES[AIAction.STOP], ACTION_CODES[AIAction.FILL]],
+            default=ACTION_CODES[AIAction.DRAIN]
+        ).astype(np.int8)
+        if not with_messages:
+            return codes, {}
+        
+        current = np.where(is_filling, ACTION_CODES[AIAction.FILL],
+                           np.where(is_draining, ACTION_CODES[AIAction.DRAIN], ACTION_CODES[AIAction.STOP]))
+        changed = np.flatnonzero(codes != current)
+        
+        # الرسائل تُبنى فقط للخزانات التي تغير إجراؤها
+        messages = {}
+        for i in changed:
+            key = tank_ids[i] if tank_ids is not None else int(i)
+            code = codes[i]
+            if leak_detected[i]:
+                messages[key] = "🚨 حالة طوارئ: تسرب مياه مكتشف!"
+            elif code == ACTION_CODES[AIAction.FILL]:
+                messages[key] = f"📈 بدء الملء من {levels[i]:.1f}% إلى {targets[i]}%"
+            elif code == ACTION_CODES[AIAction.DRAIN]:
+                messages[key] = f"📉 بدء التفريغ من {levels[i]:.1f}% إلى {targets[i]}%"
+            else:
+                messages[key] = f"⏹ الوصول للمستوى المطلوب ({levels[i]:.1f}%)"
+        
+        if messages:
+            self._add_log(f"🧮 قرارات دفعية: {len(messages)} تغيير من {len(levels)} خزان", "action")
+        
+        return codes, messages
+    
+    def _get_mpc_candidates(self) -> Tuple[np.ndarray, np.ndarray]:
+        """تسلسلات الإجراءات المرشحة: (رموز الإجراءات، التدفق الموقّع) بشكل (N, H)
+
+        كل مرشح يشغّل صماماً واحداً بمعدل ثابت لعدد من الخطوات ثم يتوقف،
+        بالإضافة إلى مرشح التوقف الكامل.
+        """
+        horizon = max(1, int(self.config.prediction_horizon))
+        rates = tuple(float(r) for r in self.config.mpc_flow_rates)
+        key = (horizon, rates)
+        if key not in self._mpc_candidates:
+            rate_arr = np.asarray(rates)
+            durations = np.arange(1, horizon + 1)
+            codes, signs = np.array([1, 2]), np.array([1.0, -1.0])
+            
+            # شبكة (إجراء × معدل × مدة)
+            c, r, d = np.meshgrid(np.arange(2), rate_arr, durations, indexing='ij')
+            c, r, d = c.ravel(), r.ravel(), d.ravel()
+            active = np.arange(horizon)[None, :] < d[:, None]
+            action_codes = np.where(active, codes[c][:, None], 0)
+            flows = np.where(active, (signs[c] * r)[:, None], 0.0)
+            
+            # المرشح الأول هو التوقف الكامل
+            action_codes = np.vstack([np.zeros((1, horizon), dtype=action_codes.dtype), action_codes])
+            flows = np.vstack([np.zeros((1, horizon)), flows])
+            self._mpc_candidates = {key: (action_codes, flows)}
+        return self._mpc_candidates[key]
+    
+    def _analyze_mpc(self, tank_state: Dict[str, Any]) -> Tuple[AIAction, str, dict]:
+        """تحكم تنبؤي: تقييم كل التسلسلات المرشحة في تدحرج NumPy واحد"""
+        started = time.perf_counter()
+        budget = self.config.mpc_budget_ms / 1000
+        action_codes, flows = self._get_mpc_candidates()
+        
+        level = tank_state['water_level']
+        target = self.config.target_level
+        capacity = tank_state.get('capacity', 1000.0)
+        dt = self.config.decision_interval
+        if tank_state['is_filling']:
+            current_code = ACTION_CODES[AIAction.FILL]
+        elif tank_state['is_draining']:
+            current_code = ACTION_CODES[AIAction.DRAIN]
+        else:
+            current_code = ACTION_CODES[AIAction.STOP]
+        
+        # التقييم على دفعات لاحترام ميزانية الزمن
+        best_cost, best_index, best_levels = np.inf, 0, None
+        chunk = 64
+        evaluated = 0
+        for start in range(0, len(flows), chunk):
+            if evaluated and time.perf_counter() - started > budget:
+                break
+            u = flows[start:start + chunk]
+            codes = action_codes[start:start + chunk]
+            
+            # تدحرج ديناميكيات الخزان: المستوى بعد كل خطوة
+            levels = np.clip(level + np.cumsum(u / 60 * dt / capacity * 100, axis=1), 0, 100)
+            error = levels - target
+            tracking = np.mean(error ** 2, axis=1)
+            side = 1.0 if level < target else -1.0
+            overshoot = np.max(np.maximum(0.0, side * error - self.config.tolerance), axis=1)
+            # التبديلات تشمل الإغلاق النهائي بعد الأفق حتى لا يُفضَّل ترك الصمام مفتوحاً
+            switches = ((codes[:, 0] != current_code).astype(float)
+                        + np.count_nonzero(np.diff(codes, axis=1), axis=1)
+                        + (codes[:, -1] != 0))
+            energy = np.sum(np.abs(u), axis=1) / 60 * dt
+            
+            cost = (tracking
+                    + self.config.mpc_overshoot_weight * overshoot
+                    + self.config.mpc_switch_weight * switches
+                    + self.config.mpc_energy_weight * energy)
+            i = int(np.argmin(cost))
+            if cost[i] < best_cost:
+                best_cost, best_index, best_levels = float(cost[i]), start + i, levels[i]
+            evaluated += len(u)
+        
+        code = int(action_codes[best_index, 0])
+        action = CODE_ACTIONS[code]
+        flow_rate = float(abs(flows[best_index, 0])) or tank_state['flow_rate']
+        details = {
+            "mode": "mpc",
+            "flow_rate": flow_rate,
+            "cost": round(best_cost, 4),
+            "predicted_levels": [round(float(v), 2) for v in best_levels],
+            "evaluated": evaluated,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+        
+        if code == current_code:
+            if action == AIAction.FILL:
+                return action, "متابعة الملء", dict(details, status="continuing")
+            if action == AIAction.DRAIN:
+                return action, "متابعة التفريغ", dict(details, status="continuing")
+            return action, "مستقر", dict(details, status="stable")
+        
+        if action == AIAction.FILL:
+            log_msg = f"📈 MPC: بدء الملء بمعدل {flow_rate:.0f} ل/د من {level:.1f}% نحو {target}%"
+        elif action == AIAction.DRAIN:
+            log_msg = f"📉 MPC: بدء التفريغ بمعدل {flow_rate:.0f} ل/د من {level:.1f}% نحو {target}%"
+        else:
+            log_msg = f"⏹ MPC: إيقاف عند {level:.1f}%"
+        self._add_log(log_msg, "action")
+        return action, log_msg, details
+    
+    def predict_trend(self, historical_data: list, steps: int = 10, dt: float = 1.0) -> Dict[str, Any]:
         """التنبؤ باتجاه مستوى المياه"""
+        # المقدّر المتدفق يجيب في O(1) إذا كان يُغذّى بالقراءات
+        if self.estimator.updates >= 5:
+            return self.estimator_prediction(steps, dt)
+        
         if len(historical_data) < 5:
             return {"prediction": "insufficient_data", "confidence": 0}
         
-        levels = [d['water_level'] for d in historical_data[-20:]]
+        levels = _level_series(historical_data)[-20:]
         
         # تحليل بسيط للمتجهات
         if len(levels) >= 2:
@@ -111,20 +309,33 @@ class AIDecisionMaker:
             
             for i in range(steps):
                 current += avg_change
-                predicted_levels.append(max(0, min(100, current)))
+                predicted_levels.append(float(max(0, min(100, current))))
             
             confidence = max(0, min(1, 1 - abs(avg_change)/10))
             
             return {
                 "predicted_levels": predicted_levels,
                 "trend": "increasing" if avg_change > 0 else "decreasing",
-                "rate_of_change": round(avg_change, 3),
-                "confidence": round(confidence, 2),
-                "time_to_target": self._estimate_time_to_target(levels[-1], avg_change)
+                "rate_of_change": round(float(avg_change), 3),
+                "confidence": round(float(confidence), 2),
+                "time_to_target": self._estimate_time_to_target(float(levels[-1]), float(avg_change))
             }
         
         return {"prediction": "no_trend", "confidence": 0}
     
+    def estimator_prediction(self, steps: int = 10, dt: float = 1.0) -> Dict[str, Any]:
+        """التنبؤ من مرشح كالمان: الاتجاه والزمن للهدف والثقة"""
+        result = self.estimator.trend()
+        result.update(self.estimator.predict(steps, dt))
+        result['estimated_level'] = round(self.estimator.level, 3)
+        
+        eta = self.estimator.time_to_target(self.config.target_level)
+        result['time_to_target'] = eta['seconds'] if eta else None
+        result['time_to_target_std'] = eta['std_seconds'] if eta else None
+        if self.estimator.track_leak:
+            result['leak_rate'] = round(self.estimator.leak_rate, 6)
+        return result
+    
     def _estimate_time_to_target(self, current: float, rate: float) -> Optional[float]:
         """تقدير الوقت للوصول للهدف"""
         if abs(rate) < 0.001:
@@ -135,33 +346,73 @@ class AIDecisionMaker:
         
         return round(time_seconds, 1)
     
-    def _check_fill_efficiency(self, historical_data: list) -> float:
+    def _check_fill_efficiency(self, historical_data: list, flow_rate: float = None) -> float:
         """فحص كفاءة عملية الملء"""
         if len(historical_data) < 10:
             return 1.0
         
-        recent = historical_data[-10:]
-        levels = [d['water_level'] for d in recent]
+        levels = _level_series(historical_data)[-10:]
         
         if len(levels) >= 2:
             actual_change = levels[-1] - levels[0]
-            expected_change = 1.0  # تغيير متوقع في 10 قراءات
+            expected_change = 1.0  # تغيير متوقع في 10 قراءات (قبل التعلم)
+            
+            # التغير المتوقع من معدل الملء المتعلم خلال زمن النافذة
+            expected_rate = self.learner.expected_fill_rate(flow_rate) if flow_rate else None
+            if expected_rate and isinstance(historical_data, np.ndarray):
+                timestamps = historical_data['timestamp'][-10:]
+                span = timestamps[-1] - timestamps[0]
+                if span > 0:
+                    expected_change = expected_rate * span
             
             efficiency = min(1.0, max(0, actual_change / expected_change))
             return efficiency
         
         return 1.0
     
+    def observe(self, tank_state: Dict[str, Any], timestamp: float = None, tank_id: str = "main"):
+        """تعلم مباشر من قراءة واحدة وتكييف التسامح بتكلفة O(1)"""
+        self.learner.observe(
+            tank_state['water_level'],
+            tank_state['is_filling'],
+            tank_state['is_draining'],
+            tank_state['flow_rate'],
+            timestamp if timestamp is not None else time.time(),
+            self.config.target_level,
+            self.config.tolerance,
+            tank_id
+        )
+        self.estimator.update(
+            tank_state['water_level'],
+            timestamp if timestamp is not None else time.time(),
+            tank_state['is_filling'],
+            tank_state['is_draining'],
+            tank_state['flow_rate']
+        )
+        if not self.config.learning_enabled:
+            return
+        
+        suggested = self.learner.suggest_tolerance(
+            tank_state['flow_rate'], self.config.decision_interval, tank_id
+        )
+        if suggested is not None:
+            suggested = min(self.config.max_tolerance, max(self.config.min_tolerance, suggested))
+            self.config.tolerance += self.config.learning_rate * (suggested - self.config.tolerance)
+    
+    def observe_window(self, window: np.ndarray, tank_id: str = "main"):
+        """تعلم من مجموعة قراءات مهيكلة (مثل نافذة القياسات)"""
+        for row in window:
+            self.observe(row, float(row['timestamp']), tank_id)
+    
     def detect_anomalies(self, tank_state: Dict[str, Any], historical_data: list) -> list:
         """كشف الشذوذ والأنماط غير الطبيعية"""
         anomalies = []
         
         # كشف تغيرات مفاجئة
         if len(historical_data) >= 3:
-            recent = historical_data[-3:]
-            changes = [recent[i+1]['water_level'] - recent[i]['water_level'] for i in range(len(recent)-1)]
+            changes = np.diff(_level_series(historical_data)[-3:])
             
-            if any(abs(change) > 5 for change in changes):  # تغير أكثر من 5%
+            if np.any(np.abs(changes) > 5):  # تغير أكثر من 5%
                 anomalies.append({
                     "type": "sudden_change",
                     "severity": "high",
@@ -186,28 +437,14 @@ class AIDecisionMaker:
         
         return anomalies
     
-    def optimize_parameters(self, performance_data: list) -> Dict[str, float]:
-        """تحسين معاملات التحكم بناءً على الأداء السابق"""
-        if not performance_data:
-            return {}
-        
-        # تحليل بسيط للأداء
-        avg_error = np.mean([d.get('error', 0) for d in performance_data])
-        avg_response_time = np.mean([d.get('response_time', 0) for d in performance_data])
-        
-        optimizations = {}
-        
-        # ضبط التسامح بناءً على الأداء
-        if avg_error < 0.5:
-            optimizations['tolerance'] = max(0.5, self.config.tolerance * 0.9)
-        else:
-            optimizations['tolerance'] = min(2.0, self.config.tolerance * 1.1)
-        
-        # ضبط معدل التدفق المقترح
-        if avg_response_time > 60:  # إذا كان وقت الاستجابة طويلاً
-            optimizations['suggested_flow_rate'] = min(50, self.config.target_level + 10)
+    def optimize_parameters(self, scenarios: Optional[list] = None, grid: Optional[dict] = None,
+                            workers: Optional[int] = None) -> Dict[str, Any]:
+        """ضبط المعاملات بمحاكاة دفعية للسيناريوهات وإرجاع نقطة التسوية من مجموعة باريتو"""
+        from utils.policy_tuner import PolicyTuner
         
-        return optimizations
+        report = PolicyTuner(scenarios, workers=workers).run(grid)
+        recommended = report['recommended']
+        return recommended['config'] if recommended else {}
     
     def _add_log(self, message: str, log_type: str = "info"):
         """إضافة سجل"""
@@ -224,4 +461,45 @@ class AIDecisionMaker:
     
     def get_recent_logs(self, count: int = 10) -> list:
         """الحصول على أحدث السجلات"""
-        return self.logs[-count:] if self.logs else []
\ No newline at end of file
+        return self.logs[-count:] if self.logs else []
+    
+    def export_state(self) -> Dict[str, Any]:
+        """تصدير حالة صانع القرار (لللقطات والاستنساخ)"""
+        return {
+            'config': asdict(self.config),
+            'logs': list(self.logs),
+            'patterns_learned': list(self.patterns_learned),
+            'last_action': self.last_action.value if isinstance(self.last_action, AIAction) else self.last_action,
+            'action_history': [
+                a.value if isinstance(a, AIAction) else a for a in self.action_history
+            ],
+            'learner': self.learner.export_state(),
+            'estimator': self.estimator.export_state()
+        }
+    
+    def load_state(self, state: Dict[str, Any]):
+        """استعادة حالة صانع القرار
+
+        الإعدادات الثابتة تبقى من config.yaml (التكوين الحالي)؛ تُستعاد الحالة
+        التشغيلية: حقول RUNTIME_CONFIG_FIELDS (بعد التحقق منها)، والمتعلم،
+        والمقدّر، والسجلات.
+        """
+        from utils.policy_tuner import check_parameter
+        
+        config = state.get('config', {})
+        for name in RUNTIME_CONFIG_FIELDS:
+            if name not in config:
+                continue
+            try:
+                setattr(self.config, name, check_parameter(name, config[name]))
+            except ValueError as e:
+                logger.warning(f"Ignoring saved {name}: {e}")
+        self.logs = list(state.get('logs', []))
+        self.patterns_learned = list(state.get('patterns_learned', []))
+        last_action = state.get('last_action')
+        self.last_action = AIAction(last_action) if last_action else None
+        self.action_history = [AIAction(a) for a in state.get('action_history', [])]
+        self.learner = OnlineLearner(alpha=self.config.learning_rate)
+        self.learner.load_state(state.get('learner', {}))
+        self.estimator = LevelEstimator(self.estimator.capacity, self.config.track_leak)
+        self.estimator.load_state(state.get('estimator', {}))
\ No newline at end of file
@@ -0,0 +1,162 @@
+import numpy as np
+from math import erf, sqrt
+from typing import Dict, Any, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _normal_cdf(z: float) -> float:
+    """دالة التوزيع التراكمي للتوزيع الطبيعي المعياري"""
+    return 0.5 * (1 + erf(z / sqrt(2)))
+
+class LevelEstimator:
+    """مرشح كالمان متدفق لمستوى المياه ومعدل تغيره
+
+    الوضع الافتراضي نموذج سرعة ثابتة بالحالة [المستوى، المعدل].
+    مع track_leak تصبح الحالة [المستوى، معدل التسرب] ويُستخدم تدفق
+    الصمامات المعروف كمدخل، فيكون المعدل = التدفق المأمور - التسرب.
+    كل قراءة تحدّث المرشح مرة واحدة وكل الاستعلامات O(1).
+    """
+
+    def __init__(self, capacity: float = 1000.0, track_leak: bool = False,
+                 measurement_noise: float = 1e-4, process_noise: float = 1e-6):
+        self.capacity = capacity
+        self.track_leak = track_leak
+        self.r = measurement_noise  # تباين قياس المستوى (%²)
+        self.q = process_noise  # شدة ضجيج العملية
+        self.reset()
+
+    def reset(self):
+        """إعادة ضبط المرشح"""
+        self.x = np.zeros(2)
+        self.P = np.diag([1e4, 1.0])
+        self.u = 0.0  # المعدل المأمور من الصمامات (%/ث)
+        self.last_time: Optional[float] = None
+        self.updates = 0
+
+    def _commanded_rate(self, is_filling: bool, is_draining: bool, flow_rate: float) -> float:
+        """المعدل الناتج عن الصمامات (%/ث)"""
+        if is_filling:
+            return flow_rate / 60 / self.capacity * 100
+        if is_draining:
+            return -flow_rate / 60 / self.capacity * 100
+        return 0.0
+
+    def update(self, level: float, timestamp: float, is_filling: bool = False,
+               is_draining: bool = False, flow_rate: float = 0.0):
+        """تحديث المرشح بقراءة واحدة"""
+        if self.last_time is None:
+            self.x[0] = level
+            self.P[0, 0] = self.r
+            self.last_time = timestamp
+            self.u = self._commanded_rate(is_filling, is_draining, flow_rate)
+            self.updates = 1
+            return
+
+        dt = timestamp - self.last_time
+        if dt <= 0:
+            return
+
+        # التنبؤ
+        if self.track_leak:
+            F = np.array([[1.0, -dt], [0.0, 1.0]])
+            self.x = F @ self.x + np.array([self.u * dt, 0.0])
+        else:
+            F = np.array([[1.0, dt], [0.0, 1.0]])
+            self.x = F @ self.x
+        Q = self.q * np.array([[dt ** 3 / 3, dt ** 2 / 2], [dt ** 2 / 2, dt]])
+        self.P = F @ self.P @ F.T + Q
+
+        # التصحيح بالقياس (H = [1, 0])
+        innovation = level - self.x[0]
+        s = self.P[0, 0] + self.r
+        k = self.P[:, 0] / s
+        self.x = self.x + k * innovation
+        self.P = self.P - np.outer(k, self.P[0, :])
+
+        self.last_time = timestamp
+        self.u = self._commanded_rate(is_filling, is_draining, flow_rate)
+        self.updates += 1
+
+    @property
+    def level(self) -> float:
+        return float(self.x[0])
+
+    @property
+    def rate(self) -> float:
+        """المعدل المقدّر (%/ث)"""
+        if self.track_leak:
+            return float(self.u - self.x[1])
+        return float(self.x[1])
+
+    @property
+    def rate_std(self) -> float:
+        return float(np.sqrt(max(self.P[1, 1], 0.0)))
+
+    @property
+    def leak_rate(self) -> Optional[float]:
+        """معدل التسرب المقدّر (%/ث) في وضع تتبع التسرب"""
+        return float(self.x[1]) if self.track_leak else None
+
+    def trend(self) -> Dict[str, Any]:
+        """الاتجاه مع ثقة إحصائية (احتمال صحة إشارة المعدل)"""
+        rate, std = self.rate, self.rate_std
+        z = abs(rate) / std if std > 0 else float('inf')
+        confidence = 2 * _normal_cdf(z) - 1
+        if z < 2:
+            direction = "stable"
+        else:
+            direction = "increasing" if rate > 0 else "decreasing"
+        return {
+            'trend': direction,
+            'rate_of_change': round(rate, 5),
+            'rate_std': round(std, 6),
+            'confidence': round(confidence, 3)
+        }
+
+    def time_to_target(self, target: float) -> Optional[Dict[str, float]]:
+        """الزمن المتوقع للوصول للهدف (ثوانٍ) مع انحرافه المعياري"""
+        rate = self.rate
+        diff = target - self.level
+        if abs(rate) < 1e-9 or diff * rate <= 0:
+            return None
+        t = diff / rate
+        # انتشار الخطأ من تباين المستوى والمعدل
+        rel_var = self.P[0, 0] / diff ** 2 + self.P[1, 1] / rate ** 2
+        return {
+            'seconds': round(t, 1),
+            'std_seconds': round(abs(t) * float(np.sqrt(max(rel_var, 0.0))), 1)
+        }
+
+    def predict(self, steps: int = 10, dt: float = 1.0) -> Dict[str, list]:
+        """المستويات المتوقعة مع انحرافها المعياري"""
+        horizon = np.arange(1, steps + 1) * dt
+        levels = np.clip(self.level + self.rate * horizon, 0, 100)
+        # في وضع التسرب المستوى يتناقص مع الحالة الثانية
+        sign = -1.0 if self.track_leak else 1.0
+        var = self.P[0, 0] + 2 * sign * horizon * self.P[0, 1] + horizon ** 2 * self.P[1, 1]
+        var = np.maximum(var, 0.0)
+        return {
+            'predicted_levels': [round(float(v), 3) for v in levels],
+            'predicted_std': [round(float(v), 4) for v in np.sqrt(var)]
+        }
+
+    def export_state(self) -> Dict[str, Any]:
+        """تصدير الحالة للّقطات"""
+        return {
+            'x': self.x.tolist(),
+            'P': self.P.tolist(),
+            'u': self.u,
+            'last_time': self.last_time,
+            'updates': self.updates
+        }
+
+    def load_state(self, state: Dict[str, Any]):
+        """استعادة الحالة"""
+        if not state:
+            return
+        self.x = np.array(state['x'], dtype=float)
+        self.P = np.array(state['P'], dtype=float)
+        self.u = state.get('u', 0.0)
+        self.last_time = state.get('last_time')
+        self.updates = state.get('updates', 0)
@@ -0,0 +1,120 @@
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class TankLearningState:
+    """إحصائيات متعلمة لخزان واحد (متوسطات موزونة أسياً)"""
+    fill_gain: float = 0.0  # (%/ث) لكل (لتر/دقيقة) أثناء الملء
+    drain_gain: float = 0.0  # (%/ث) لكل (لتر/دقيقة) أثناء التفريغ
+    fill_samples: int = 0
+    drain_samples: int = 0
+    settling_time: float = 0.0  # ثانية من فتح الصمام حتى دخول نطاق الهدف
+    settling_samples: int = 0
+    overshoot: float = 0.0  # نسبة مئوية تجاوز الهدف عند الإيقاف
+    overshoot_samples: int = 0
+
+    # حالة العبور الحالية
+    last_level: Optional[float] = None
+    last_time: Optional[float] = None
+    phase: int = 0  # 0 خامل، 1 ملء، -1 تفريغ
+    phase_start: Optional[float] = None
+    settled: bool = True
+
+class OnlineLearner:
+    """متعلم مباشر لمعاملات التحكم بتكلفة O(1) لكل قراءة"""
+
+    def __init__(self, alpha: float = 0.01, min_samples: int = 10):
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.tanks: Dict[str, TankLearningState] = {}
+
+    def _ewma(self, mean: float, count: int, value: float) -> float:
+        """تحديث متوسط موزون أسياً (متوسط عادي في البداية لتسريع التقارب)"""
+        weight = max(self.alpha, 1.0 / (count + 1))
+        return mean + weight * (value - mean)
+
+    def observe(self, level: float, is_filling: bool, is_draining: bool, flow_rate: float,
+                timestamp: float, target: float, tolerance: float, tank_id: str = "main"):
+        """تحديث الإحصائيات بقراءة واحدة"""
+        st = self.tanks.setdefault(tank_id, TankLearningState())
+        phase = 1 if is_filling else -1 if is_draining else 0
+
+        # معدلات الملء/التفريغ الفعلية منسوبة لمعدل التدفق
+        if st.last_time is not None and timestamp > st.last_time and flow_rate > 0:
+            rate = (level - st.last_level) / (timestamp - st.last_time)
+            if phase == 1 and st.phase == 1:
+                st.fill_gain = self._ewma(st.fill_gain, st.fill_samples, rate / flow_rate)
+                st.fill_samples += 1
+            elif phase == -1 and st.phase == -1:
+                st.drain_gain = self._ewma(st.drain_gain, st.drain_samples, -rate / flow_rate)
+                st.drain_samples += 1
+
+        # بداية عبور جديد
+        if phase != 0 and st.phase != phase:
+            st.phase_start = timestamp
+            st.settled = False
+
+        # زمن الاستقرار: من فتح الصمام حتى دخول نطاق الهدف
+        if not st.settled and st.phase_start is not None and abs(level - target) <= tolerance:
+            st.settling_time = self._ewma(st.settling_time, st.settling_samples, timestamp - st.phase_start)
+            st.settling_samples += 1
+            st.settled = True
+
+        # التجاوز: مقدار عبور الهدف لحظة إيقاف الصمام
+        if phase == 0 and st.phase != 0:
+            excursion = max(0.0, (level - target) * st.phase)
+            st.overshoot = self._ewma(st.overshoot, st.overshoot_samples, excursion)
+            st.overshoot_samples += 1
+
+        st.phase = phase
+        st.last_level = level
+        st.last_time = timestamp
+
+    def expected_fill_rate(self, flow_rate: float, tank_id: str = "main") -> Optional[float]:
+        """معدل الملء المتوقع (%/ث) أو None قبل توفر عينات كافية"""
+        st = self.tanks.get(tank_id)
+        if st is None or st.fill_samples < self.min_samples:
+            return None
+        return st.fill_gain * flow_rate
+
+    def suggest_tolerance(self, flow_rate: float, decision_interval: float,
+                          tank_id: str = "main") -> Optional[float]:
+        """التسامح المقترح: نصف خطوة المستوى بين قرارين مضافاً إليها التجاوز المعتاد"""
+        st = self.tanks.get(tank_id)
+        if st is None or (st.fill_samples + st.drain_samples) < self.min_samples:
+            return None
+        step = max(st.fill_gain, st.drain_gain) * flow_rate * decision_interval
+        return 0.5 * step + st.overshoot
+
+    def get_stats(self, tank_id: str = "main") -> Dict[str, Any]:
+        """الإحصائيات المتعلمة"""
+        st = self.tanks.get(tank_id)
+        if st is None:
+            return {}
+        return {
+            'fill_gain': round(float(st.fill_gain), 6),
+            'drain_gain': round(float(st.drain_gain), 6),
+            'settling_time': round(float(st.settling_time), 1),
+            'overshoot': round(float(st.overshoot), 3),
+            'samples': {
+                'fill': st.fill_samples,
+                'drain': st.drain_samples,
+                'settling': st.settling_samples,
+                'overshoot': st.overshoot_samples
+            }
+        }
+
+    def export_state(self) -> Dict[str, Any]:
+        """تصدير الحالة للّقطات"""
+        return {tank_id: asdict(st) for tank_id, st in self.tanks.items()}
+
+    def load_state(self, state: Dict[str, Any]):
+        """استعادة الحالة"""
+        fields = TankLearningState.__dataclass_fields__
+        self.tanks = {
+            tank_id: TankLearningState(**{k: v for k, v in values.items() if k in fields})
+            for tank_id, values in state.items()
+        }
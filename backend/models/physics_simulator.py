@@ -76,14 +76,15 @@ class PhysicsSimulator:
         # فرق درجة الحرارة
         delta_t = tank_state['temperature'] - self.ambient_temperature
         
-        # حساب فقدان الحرارة عبر العزل
-        if abs(delta_t) > 0.1:
+        water_mass = tank_state['water_volume']  # kg (1 liter ≈ 1 kg)
+        
+        # حساب فقدان الحرارة عبر العزل (الخزان الفارغ لا ماء فيه يتغير حرارياً)
+        if abs(delta_t) > 0.1 and water_mass > 0:
             # مقاومة حرارية
             r_insulation = insulation_thickness / (insulation_k * surface_area)
             heat_loss = delta_t / r_insulation  # Watts
             
             # تغير درجة الحرارة مع الوقت
-            water_mass = tank_state['water_volume']  # kg (1 liter ≈ 1 kg)
             temp_change = -heat_loss * dt / (water_mass * self.specific_heat_water)
             
             results['heat_loss_rate'] = round(heat_loss, 2)  # W
@@ -216,8 +217,12 @@ class PhysicsSimulator:
             'water_quality': self.simulate_water_quality(tank_state, dt),
             'structural_integrity': self.simulate_structural_integrity(tank_state)
         }
+        results.update(self.assess_risk(results))
         
-        # حساب درجة المخاطر الإجمالية
+        return results
+    
+    def assess_risk(self, results: Dict[str, Any]) -> Dict[str, Any]:
+        """حساب درجة المخاطر الإجمالية من نتائج الأقسام"""
         risk_factors = []
         
         # مخاطر ديناميكية السوائل
@@ -246,10 +251,10 @@ class PhysicsSimulator:
         else:
             overall_risk = 0.1  # خطر منخفض
         
-        results['overall_risk_score'] = round(overall_risk * 100, 1)
-        results['risk_level'] = self._get_risk_level(overall_risk)
-        
-        return results
+        return {
+            'overall_risk_score': round(overall_risk * 100, 1),
+            'risk_level': self._get_risk_level(overall_risk)
+        }
     
     def _get_risk_level(self, risk_score: float) -> str:
         """تحديد مستوى الخطر"""
@@ -262,4 +267,83 @@ class PhysicsSimulator:
         elif risk_score >= 0.1:
             return "منخفض"
         else:
-            return "مقبول"
\ No newline at end of file
+            return "مقبول"
+
+
+class DiagnosticsCache:
+    """تشخيصات فيزيائية كسولة مخزنة لكل نبضة محاكاة
+    
+    كل قسم يُحسب مرة واحدة على الأكثر لكل نبضة وعند الطلب فقط، ويُعاد
+    استخدام نتيجته إذا لم تتغير مدخلاته منذ آخر حساب.
+    """
+    
+    # مدخلات كل قسم من حالة الخزان
+    SECTIONS = {
+        'fluid_dynamics': ('flow_rate', 'water_volume'),
+        'heat_transfer': ('temperature', 'water_volume'),
+        'water_quality': ('temperature', 'turbidity', 'ph_level'),
+        'structural_integrity': ('pressure',),
+    }
+    
+    def __init__(self, simulator: PhysicsSimulator = None, dt: float = 1.0):
+        self.simulator = simulator or PhysicsSimulator()
+        self.dt = dt
+        self._tick = None
+        self._state = None
+        self._results = {}  # القسم -> (نبضة الحساب، المدخلات، النتيجة)
+        self._versions = {name: 0 for name in self.SECTIONS}  # يزداد عند كل إعادة حساب
+        self._risk = (None, None)
+        self.stats = {'requests': 0, 'computed': 0, 'unchanged': 0, 'cached': 0}
+    
+    def _compute_section(self, name: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        """حساب قسم واحد"""
+        if name == 'fluid_dynamics':
+            return self.simulator.simulate_fluid_dynamics(state, self.dt)
+        if name == 'heat_transfer':
+            return self.simulator.simulate_heat_transfer(state, self.dt)
+        if name == 'water_quality':
+            return self.simulator.simulate_water_quality(state, self.dt)
+        return self.simulator.simulate_structural_integrity(state)
+    
+    def _section(self, name: str, tank, tick: int) -> Dict[str, Any]:
+        """نتيجة قسم للنبضة الحالية"""
+        cached = self._results.get(name)
+        if cached and cached[0] == tick:
+            self.stats['cached'] += 1
+            return cached[2]
+        
+        if self._tick != tick:
+            self._tick = tick
+            self._state = tank.get_state()
+        
+        inputs = tuple(self._state[field] for field in self.SECTIONS[name])
+        if cached and cached[1] == inputs:
+            self.stats['unchanged'] += 1
+            result = cached[2]
+        else:
+            self.stats['computed'] += 1
+            result = self._compute_section(name, self._state)
+            self._versions[name] += 1
+        
+        self._results[name] = (tick, inputs, result)
+        return result
+    
+    def get(self, tank, sections=None) -> Dict[str, Any]:
+        """الحصول على التشخيصات (كل الأقسام أو بعضها) للنبضة الحالية"""
+        self.stats['requests'] += 1
+        tick = tank.tick
+        names = [n for n in (sections or self.SECTIONS) if n in self.SECTIONS]
+        
+        results = {'tick': tick}
+        for name in names:
+            results[name] = self._section(name, tank, tick)
+        
+        # المخاطر تحتاج كل الأقسام، وتُعاد فقط إذا تغير أحدها
+        if sections is None or 'risk' in sections:
+            section_results = {name: self._section(name, tank, tick) for name in self.SECTIONS}
+            key = tuple(self._versions.values())
+            if self._risk[0] != key:
+                self._risk = (key, self.simulator.assess_risk(section_results))
+            results.update(self._risk[1])
+        
+        return results
@@ -1,11 +1,30 @@
 import numpy as np
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import logging
+import time
+
+from utils.ring_buffer import RingBuffer
 
 logger = logging.getLogger(__name__)
 
+# ثوابت النموذج الفيزيائي
+AMBIENT_TEMPERATURE = 20.0  # °C
+THERMAL_COEFFICIENT = 0.01  # 1/ث
+EVAPORATION_COEFFICIENT = 0.05 / 30 / 3600  # لتر/(ث·°C)
+LEAK_RATE = 5.0 / 60  # لتر/ث
+
+# هيكل سجل التاريخ (الوقت بثواني epoch)
+HISTORY_DTYPE = np.dtype([
+    ('timestamp', 'f8'),
+    ('water_level', 'f8'),
+    ('temperature', 'f8'),
+    ('pressure', 'f8'),
+    ('ph_level', 'f8'),
+    ('turbidity', 'f8'),
+])
+
 @dataclass
 class TankConfig:
     """تكوين الخزان"""
@@ -16,6 +35,9 @@ class TankConfig:
     height: float = 2.0  # متر
     material: str = "steel"
     insulation_factor: float = 0.8
+    integrator: str = "euler"  # euler | exact
+    max_event_segments: int = 8  # أقصى عدد أحداث في خطوة واحدة
+    history_size: int = 1000  # سعة المخزن الحلقي للتاريخ
 
 class WaterTank:
     """نموذج الخزان المادي"""
@@ -36,7 +58,10 @@ class WaterTank:
         self.flow_rate = 20.0  # لتر/دقيقة
         
         # سجلات
-        self.history = []
+        self.history = RingBuffer(HISTORY_DTYPE, self.config.history_size)
+        self.last_events = []
+        self.tick = 0  # عداد خطوات المحاكاة
+        self.revision = 0  # يزيد عند تغيير الحالة خارج النبضات (إعادة الضبط/الاستعادة)
         self.last_update = datetime.now()
         self.ai_mode = True
         
@@ -48,32 +73,17 @@ class WaterTank:
         """تحويل الحجم المطلق إلى مستوى نسبي"""
         return (volume / self.config.max_capacity) * 100
     
-    def update_physics(self, dt: float = 1.0):
+    def update_physics(self, dt: float = 1.0, integrator: Optional[str] = None,
+                       target_level: Optional[float] = None):
         """تحديث الفيزياء مع مرور الوقت"""
-        # تأثيرات الحرارة
-        ambient_temp = 20.0
-        temp_diff = ambient_temp - self.temperature
-        self.temperature += temp_diff * 0.01 * dt
-        
-        # تأثير التبخر
-        evaporation_rate = 0.05 * (self.temperature / 30)  # لتر/ساعة
-        volume_loss = (evaporation_rate / 3600) * dt
-        
-        # تأثير التسرب إذا كان موجوداً
-        if self.leak_detected:
-            leak_rate = 5.0  # لتر/دقيقة
-            volume_loss += (leak_rate / 60) * dt
-        
-        # تحديث الحجم
-        if self.is_filling:
-            fill_rate = self.flow_rate / 60  # لتر/ثانية
-            self.water_volume += fill_rate * dt
-        elif self.is_draining:
-            drain_rate = self.flow_rate / 60
-            self.water_volume -= drain_rate * dt
-        
-        # تطبيق الخسائر
-        self.water_volume = max(0, self.water_volume - volume_loss)
+        integrator = integrator or self.config.integrator
+        if integrator == "exact":
+            self.last_events = self._advance_exact(dt, target_level)
+        elif integrator == "euler":
+            self._advance_euler(dt)
+            self.last_events = []
+        else:
+            raise ValueError(f"Unknown integrator: {integrator}")
         
         # تحديث المستوى
         self.water_level = self._volume_to_level(self.water_volume)
@@ -91,23 +101,161 @@ class WaterTank:
         self.turbidity += np.random.uniform(-0.1, 0.1)
         self.turbidity = max(0, min(100, self.turbidity))
         
-        # حفظ التاريخ
-        self.history.append({
-            'timestamp': datetime.now(),
-            'water_level': self.water_level,
-            'temperature': self.temperature,
-            'pressure': self.pressure,
-            'ph_level': self.ph_level,
-            'turbidity': self.turbidity
-        })
-        
-        # الاحتفاظ بآخر 1000 قراءة فقط
-        if len(self.history) > 1000:
-            self.history = self.history[-1000:]
+        # حفظ التاريخ (المخزن الحلقي يحتفظ بآخر history_size قراءة)
+        self.history.append((
+            time.time(),
+            self.water_level,
+            self.temperature,
+            self.pressure,
+            self.ph_level,
+            self.turbidity
+        ))
         
+        self.tick += 1
         self.last_update = datetime.now()
         return self.get_state()
     
+    def _advance_euler(self, dt: float):
+        """خطوة أويلر الصريحة (السلوك الأصلي)"""
+        # تأثيرات الحرارة
+        temp_diff = AMBIENT_TEMPERATURE - self.temperature
+        self.temperature += temp_diff * THERMAL_COEFFICIENT * dt
+        
+        # تأثير التبخر
+        volume_loss = EVAPORATION_COEFFICIENT * self.temperature * dt
+        
+        # تأثير التسرب إذا كان موجوداً
+        if self.leak_detected:
+            volume_loss += LEAK_RATE * dt
+        
+        # تحديث الحجم
+        if self.is_filling:
+            self.water_volume += self.flow_rate / 60 * dt
+        elif self.is_draining:
+            self.water_volume -= self.flow_rate / 60 * dt
+        
+        # تطبيق الخسائر
+        self.water_volume = max(0, self.water_volume - volume_loss)
+    
+    def _advance_exact(self, dt: float, target_level: Optional[float] = None) -> List[Dict[str, Any]]:
+        """تقدم بالحل التحليلي الدقيق مع كشف الأحداث (امتلاء/فراغ/عبور الهدف)
+        
+        الحرارة تتبع T(t) = Ta + (T0 - Ta)·e^(-kt) والحجم تكامله مغلق الصيغة،
+        لذلك خطوة واحدة تغطي ساعات دون تراكم خطأ. عند كل حدث يُغلق الصمام
+        المعني ويُستكمل باقي الفترة بالحالة الجديدة.
+        """
+        events = []
+        target_volume = self._level_to_volume(target_level) if target_level is not None else None
+        elapsed = 0.0
+        
+        for _ in range(self.config.max_event_segments):
+            remaining = dt - elapsed
+            if remaining <= 0:
+                break
+            
+            # خزان ممتلئ مع استمرار الملء: يُغلق الصمام فوراً
+            if self.is_filling and self.water_volume >= self.config.max_capacity:
+                self.is_filling = False
+                events.append({'event': 'full', 'time': round(elapsed, 3)})
+            
+            q = self._net_inflow()
+            candidates = []
+            if self.is_filling:
+                candidates.append(('full', self.config.max_capacity))
+            if self.water_volume > 0:
+                candidates.append(('empty', 0.0))
+            if target_volume is not None and (self.is_filling or self.is_draining):
+                candidates.append(('target_reached', target_volume))
+            
+            hit = None
+            for name, boundary in candidates:
+                t_hit = self._first_crossing(q, boundary, remaining)
+                if t_hit is not None and (hit is None or t_hit < hit[1]):
+                    hit = (name, t_hit, boundary)
+            
+            step = hit[1] if hit else remaining
+            self.water_volume = self._volume_at(q, step)
+            self.temperature = self._temperature_at(step)
+            elapsed += step
+            
+            if hit is None:
+                break
+            
+            name, _, boundary = hit
+            self.water_volume = boundary
+            if name == 'full':
+                self.is_filling = False
+            elif name == 'empty':
+                self.is_draining = False
+            else:
+                self.is_filling = False
+                self.is_draining = False
+            events.append({'event': name, 'time': round(elapsed, 3)})
+        
+        self.water_volume = max(0.0, min(self.config.max_capacity, self.water_volume))
+        return events
+    
+    def _net_inflow(self) -> float:
+        """صافي التدفق الثابت (لتر/ث) بدون التبخر"""
+        q = 0.0
+        if self.is_filling:
+            q += self.flow_rate / 60
+        elif self.is_draining:
+            q -= self.flow_rate / 60
+        if self.leak_detected:
+            q -= LEAK_RATE
+        return q
+    
+    def _temperature_at(self, t: float) -> float:
+        """درجة الحرارة بعد زمن t"""
+        return AMBIENT_TEMPERATURE + (self.temperature - AMBIENT_TEMPERATURE) * np.exp(-THERMAL_COEFFICIENT * t)
+    
+    def _volume_at(self, q: float, t: float) -> float:
+        """الحجم بعد زمن t (تكامل التدفق ناقص التبخر)"""
+        decay = (1 - np.exp(-THERMAL_COEFFICIENT * t)) / THERMAL_COEFFICIENT
+        temp_integral = AMBIENT_TEMPERATURE * t + (self.temperature - AMBIENT_TEMPERATURE) * decay
+        return self.water_volume + q * t - EVAPORATION_COEFFICIENT * temp_integral
+    
+    def _first_crossing(self, q: float, boundary: float, horizon: float) -> Optional[float]:
+        """أول زمن يعبر فيه الحجم قيمة معينة خلال الأفق، أو None"""
+        g0 = self.water_volume - boundary
+        if g0 == 0:
+            return None
+        
+        # المشتقة q - c·T(t) رتيبة، لذا للحجم نقطة انعطاف واحدة على الأكثر
+        breakpoints = [0.0]
+        temp_offset = self.temperature - AMBIENT_TEMPERATURE
+        stationary_temp = q / EVAPORATION_COEFFICIENT
+        if temp_offset != 0:
+            ratio = (stationary_temp - AMBIENT_TEMPERATURE) / temp_offset
+            if 0 < ratio < 1:
+                t_star = -np.log(ratio) / THERMAL_COEFFICIENT
+                if t_star < horizon:
+                    breakpoints.append(t_star)
+        breakpoints.append(horizon)
+        
+        for lo, hi in zip(breakpoints[:-1], breakpoints[1:]):
+            g_lo = self._volume_at(q, lo) - boundary
+            g_hi = self._volume_at(q, hi) - boundary
+            if g_lo == 0:
+                if lo > 0:
+                    return lo
+                continue
+            if g_lo * g_hi > 0:
+                continue
+            # تنصيف داخل مقطع رتيب
+            for _ in range(60):
+                mid = 0.5 * (lo + hi)
+                g_mid = self._volume_at(q, mid) - boundary
+                if g_mid * g_lo > 0:
+                    lo, g_lo = mid, g_mid
+                else:
+                    hi = mid
+                if hi - lo < 1e-6:
+                    break
+            return hi
+        return None
+    
     def set_fill(self, fill: bool):
         """تفعيل/إلغاء الملء"""
         self.is_filling = fill
@@ -144,6 +292,12 @@ class WaterTank:
         self.is_filling = False
         self.is_draining = False
         self.leak_detected = False
+        self.revision += 1
+    
+    def state_version(self) -> str:
+        """نسخة الحالة للطلبات الشرطية: تتغير مع كل نبضة أو أمر تحكم"""
+        controls = (self.is_filling, self.is_draining, self.leak_detected, self.flow_rate, self.ai_mode)
+        return f"{self.tick}.{self.revision}.{hash(controls) & 0xffffffff:x}"
     
     def get_state(self) -> Dict[str, Any]:
         """الحصول على حالة الخزان الحالية"""
@@ -162,8 +316,38 @@ class WaterTank:
             'last_update': self.last_update.isoformat()
         }
     
-    def get_history(self, limit: int = 100) -> list:
-        """الحصول على التاريخ"""
-        return self.history[-limit:] if self.history else []
+    def get_history(self, limit: int = 100) -> np.ndarray:
+        """الحصول على التاريخ (عرض مهيكل بالترتيب الزمني بدون نسخ)"""
+        return self.history.window(limit)
+    
+    # حقول الحالة التي تُحفظ في اللقطات
+    SNAPSHOT_FIELDS = (
+        'water_level', 'water_volume', 'temperature', 'pressure', 'ph_level',
+        'turbidity', 'is_filling', 'is_draining', 'leak_detected', 'flow_rate', 'ai_mode'
+    )
+    
+    def export_state(self, history_window: int = 1000) -> Dict[str, Any]:
+        """تصدير الحالة الكاملة للخزان (لللقطات والاستنساخ)"""
+        return {
+            'fields': {name: getattr(self, name) for name in self.SNAPSHOT_FIELDS},
+            'last_update': self.last_update.timestamp(),
+            'tick': self.tick,
+            'history': self.history.window(history_window)
+        }
+    
+    def load_state(self, state: Dict[str, Any]):
+        """استعادة الحالة من تصدير سابق"""
+        for name, value in state.get('fields', {}).items():
+            if name in self.SNAPSHOT_FIELDS:
+                setattr(self, name, value)
+        if 'last_update' in state:
+            self.last_update = datetime.fromtimestamp(state['last_update'])
+        # استمرار عداد الخطوات حتى لا تتكرر أرقام نسخ الحالة بعد الاستئناف
+        self.tick = int(state.get('tick', self.tick))
+        self.history.clear()
+        history = state.get('history')
+        if history is not None and len(history):
+            self.history.extend(history)
+        self.revision += 1
     
     
\ No newline at end of file
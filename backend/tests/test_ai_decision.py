@@ -0,0 +1,38 @@
+"""
+اختبارات حفظ واستعادة حالة AIDecisionMaker
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from models.ai_decision import AIConfig, AIDecisionMaker  # noqa: E402
+
+
+def test_load_state_restores_runtime_fields_only():
+    running = AIDecisionMaker(AIConfig())
+    running.config.target_level = 65.0
+    running.config.tolerance = 1.5
+    running.config.decision_mode = 'mpc'
+    running.config.learning_rate = 0.5
+    state = running.export_state()
+
+    # بعد إعادة التشغيل: config.yaml قد غيّر إعداداً ثابتاً
+    restarted = AIDecisionMaker(AIConfig(learning_rate=0.05))
+    restarted.load_state(state)
+    assert restarted.config.target_level == 65.0
+    assert restarted.config.tolerance == 1.5
+    assert restarted.config.decision_mode == 'mpc'
+    assert restarted.config.learning_rate == 0.05
+
+
+def test_load_state_ignores_invalid_saved_values():
+    state = AIDecisionMaker(AIConfig()).export_state()
+    state['config']['target_level'] = 'high'
+    state['config']['prediction_horizon'] = 0
+
+    restarted = AIDecisionMaker(AIConfig(target_level=75.0))
+    restarted.load_state(state)
+    assert restarted.config.target_level == 75.0
+    assert restarted.config.prediction_horizon == AIConfig().prediction_horizon
@@ -0,0 +1,32 @@
+"""
+اختبارات آلة حالة التنبيهات (AlertSystem)
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.alert_system import AlertSystem  # noqa: E402
+from utils.data_logger import DataLogger  # noqa: E402
+
+
+def test_clears_when_source_column_disappears(tmp_path):
+    """تنبيه قائم يُلغى عند غياب عمود مصدره (مستشعر توقف عن الإبلاغ)"""
+    alerts = AlertSystem(DataLogger(str(tmp_path / "alerts.db")))
+    start = 1000.0
+    raised = []
+    for k in range(15):
+        raised += alerts.check_alerts_batch({
+            'water_level': np.array([50.0]),
+            'estimated_leak_rate': np.array([0.01])
+        }, now=start + k)
+    assert [(a['type'], a['state']) for a in raised] == [('estimated_leak', 'raised')]
+
+    cleared = []
+    for k in range(15, 40):
+        cleared += alerts.check_alerts_batch({'water_level': np.array([50.0])}, now=start + k)
+    assert [(a['type'], a['state'], a['value']) for a in cleared] == [('estimated_leak', 'cleared', None)]
+    assert not alerts.states
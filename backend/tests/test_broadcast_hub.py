@@ -0,0 +1,99 @@
+"""
+اختبارات BroadcastHub مقابل نسخ python-socketio/python-engineio المثبتة
+تُشغّل بعد تثبيت requirements.txt: python -m pytest -q (من مجلد backend)
+"""
+
+import sys
+from pathlib import Path
+
+import engineio
+import socketio as python_socketio
+from flask import Flask
+from flask_socketio import SocketIO, join_room
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.broadcast_hub import BroadcastHub  # noqa: E402
+
+
+def make_server():
+    """تطبيق Flask-SocketIO بنفس إعداد app.py مع غرفة للاختبار"""
+    app = Flask(__name__)
+    socketio = SocketIO(app, async_mode='gevent')
+
+    @socketio.on('connect')
+    def on_connect():
+        join_room('tank_update:main|json')
+
+    return app, socketio
+
+
+def received(client, event):
+    return [message['args'][0] for message in client.get_received() if message['name'] == event]
+
+
+def test_pinned_versions_expose_internals():
+    """الإرسال المباشر متاح بالنسخ المثبتة (وإلا فالتحديث كسر الواجهات الداخلية)"""
+    _, socketio = make_server()
+    hub = BroadcastHub(socketio)
+    assert hub.capabilities == {name: True for name in hub.capabilities}
+    assert hub.direct
+    assert hub.get_metrics()['mode'] == 'direct'
+
+
+def test_direct_delivery_to_room():
+    app, socketio = make_server()
+    hub = BroadcastHub(socketio)
+    client = socketio.test_client(app)
+    other = socketio.test_client(app)
+    other.get_received()
+    client.get_received()
+
+    hub.emit('tank_update', {'water_level': 42.0}, to=['tank_update:main|json'])
+    hub.emit('tank_update', {'water_level': 43.0}, to='other-room')
+
+    assert received(client, 'tank_update') == [{'water_level': 42.0}]
+    assert hub.get_metrics()['deliveries'] == 2
+    assert hub.get_metrics()['encodes'] == 1
+
+
+def test_bounded_queue_drops_oldest():
+    app, socketio = make_server()
+    hub = BroadcastHub(socketio, max_queue=2, max_inflight=0)
+    client = socketio.test_client(app)
+    client.get_received()
+
+    for level in range(5):
+        hub.emit('tank_update', {'water_level': level}, to='tank_update:main|json')
+    metrics = hub.get_metrics()
+    assert metrics['queued_frames'] == 2
+    assert metrics['dropped'] == 3
+
+    # تعافي الرابط: تُسلّم أحدث الإطارات فقط
+    hub.max_inflight = 16
+    hub.flush_all()
+    assert received(client, 'tank_update') == [{'water_level': 3}, {'water_level': 4}]
+
+
+def test_falls_back_to_emit_without_send(monkeypatch):
+    app, socketio = make_server()
+    monkeypatch.delattr(python_socketio.Server, '_send_eio_packet', raising=False)
+    monkeypatch.delattr(engineio.Server, 'send_packet')
+    hub = BroadcastHub(socketio)
+    assert not hub.capabilities['send_eio_packet']
+    assert hub.get_metrics()['mode'] == 'emit'
+    monkeypatch.undo()
+
+    client = socketio.test_client(app)
+    client.get_received()
+    hub.emit('tank_update', {'water_level': 7.0}, to=['tank_update:main|json'])
+    assert received(client, 'tank_update') == [{'water_level': 7.0}]
+    assert hub.get_metrics()['deliveries'] == 0
+
+
+def test_falls_back_to_emit_without_socket_queue(monkeypatch):
+    _, socketio = make_server()
+    monkeypatch.setattr(engineio.socket.Socket, '__init__', lambda self, server, sid: None)
+    hub = BroadcastHub(socketio)
+    assert not hub.capabilities['socket_queue']
+    assert not hub.direct
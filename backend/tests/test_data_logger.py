@@ -0,0 +1,34 @@
+"""
+اختبارات ترقيم القراءات في DataLogger
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.data_logger import DataLogger, decode_cursor, encode_cursor  # noqa: E402
+
+
+def test_cursor_round_trip():
+    state = {'after': 10, 'until': 20, 'fields': ['water_level']}
+    assert decode_cursor(encode_cursor(state)) == state
+
+
+@pytest.mark.parametrize('state', [
+    [1, 2],
+    None,
+    {'after': 1},
+    {'after': '1', 'until': 2, 'fields': ['water_level']},
+    {'after': True, 'until': 2, 'fields': ['water_level']},
+    {'after': -1, 'until': 2, 'fields': ['water_level']},
+    {'after': 1, 'until': 2, 'fields': 'water_level'},
+    {'after': 1, 'until': 2, 'fields': []},
+    {'after': 1, 'until': 2, 'fields': ['unknown']},
+])
+def test_malformed_cursor_is_rejected(tmp_path, state):
+    data_logger = DataLogger(str(tmp_path / "readings.db"))
+    with pytest.raises(ValueError):
+        data_logger.query_readings(cursor=encode_cursor(state))
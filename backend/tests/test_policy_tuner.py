@@ -0,0 +1,58 @@
+"""
+اختبارات مهمة الضبط الشبكي (PolicyTuner)
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils import policy_tuner  # noqa: E402
+from utils.policy_tuner import PolicyTuner  # noqa: E402
+
+
+def test_default_grid_runs():
+    report = PolicyTuner(workers=1, cache_path=None).run()
+    assert report['failed'] == []
+    assert report['evaluated'] == report['unique_points']
+    assert report['recommended'] is not None
+
+
+def test_failed_point_does_not_drop_job(monkeypatch):
+    evaluate = policy_tuner._evaluate_point
+
+    def flaky(point, scenario_paths, capacity):
+        if point['tolerance'] == 2.0:
+            raise RuntimeError("boom")
+        return evaluate(point, scenario_paths, capacity)
+
+    monkeypatch.setattr(policy_tuner, '_evaluate_point', flaky)
+    report = PolicyTuner(workers=1, cache_path=None).run({
+        'tolerance': [1.0, 2.0],
+        'decision_mode': ['threshold']
+    })
+    assert [r['config']['tolerance'] for r in report['results']] == [1.0]
+    assert report['failed'] == [{'config': {'decision_mode': 'threshold', 'tolerance': 2.0}, 'error': 'boom'}]
+
+
+@pytest.mark.parametrize('grid', [
+    {'tolerance': ['x']},
+    {'tolerance': [float('nan')]},
+    {'target_level': [150]},
+    {'prediction_horizon': [2.5]},
+    {'learning_rate': [0.1]},
+    {'decision_mode': ['random']},
+    {'tolerance': []},
+    {'tolerance': [1.0] * 50, 'target_level': [80.0] * 50},
+])
+def test_invalid_grid_is_rejected(grid):
+    with pytest.raises(ValueError):
+        PolicyTuner(workers=1, cache_path=None).run(grid)
+
+
+def test_workers_are_capped():
+    assert PolicyTuner(workers=10 ** 6, cache_path=None).workers == policy_tuner.MAX_WORKERS
+    with pytest.raises(ValueError):
+        PolicyTuner(workers=0, cache_path=None)
@@ -0,0 +1,60 @@
+"""
+اختبارات محرك إعادة التشغيل (ReplayEvaluator)
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from models.ai_decision import AIConfig, AIDecisionMaker  # noqa: E402
+from utils.policy_tuner import scenario_path  # noqa: E402
+from utils.replay_evaluator import ReplayEvaluator, ReplayTrace  # noqa: E402
+
+
+def synthetic_trace(n=2000, seed=0):
+    """مسار بطلب عشوائي ومستوى يبدأ بعيداً عن الهدف"""
+    rng = np.random.default_rng(seed)
+    demand = -(5 + rng.random(n) * 10) / 60 / 1000 * 100
+    return ReplayTrace(np.ones(n), demand, np.full(n, 20.0), np.zeros(n, bool), 60.0)
+
+
+def test_policy_without_switches():
+    """سياسة لا تبدّل أبداً (الإصدار السابق كان يرمي IndexError)"""
+    trace = ReplayTrace.from_scenario(scenario_path('leak_scenario'))
+    result = ReplayEvaluator(trace).evaluate_policy({'tolerance': 5.0})
+    assert result['switches'] == 0
+    assert result['reaction_time'] == {'count': 0, 'mean': None, 'max': None}
+
+
+def test_vectorized_matches_stepwise():
+    trace = synthetic_trace()
+    evaluator = ReplayEvaluator(trace)
+    for tolerance, stride in ((0.5, 1), (2.0, 1), (2.0, 3)):
+        ai = AIDecisionMaker(AIConfig(tolerance=tolerance, learning_enabled=False))
+        leaks = evaluator.detected_leaks(ai.config.leak_threshold)
+        fast = evaluator._replay_vectorized(ai, stride, leaks)
+        slow = evaluator._replay_stepwise(ai, stride, leaks)
+        assert fast['switches'] == slow['switches']
+        assert np.isclose(fast['final_level'], slow['final_level'])
+        assert np.isclose(fast['in_band_time'], slow['in_band_time'])
+        assert np.allclose(fast['reactions'], slow['reactions'])
+
+
+def test_saturation_clamps_level():
+    n = 500
+    trace = ReplayTrace(np.ones(n), np.full(n, -1.0), np.full(n, 20.0), np.zeros(n, bool), 5.0)
+    result = ReplayEvaluator(trace).evaluate_policy({})
+    assert 0.0 <= result['final_level'] <= 100.0
+
+
+def test_leak_threshold_drives_detection():
+    """leak_threshold يحدد ما يراه صانع القرار تسرباً (لا العلم المسجل)"""
+    evaluator = ReplayEvaluator(ReplayTrace.from_scenario(scenario_path('leak_scenario')))
+    sensitive = evaluator.evaluate_policy({'leak_threshold': 0.01})
+    blind = evaluator.evaluate_policy({'leak_threshold': 1.0})
+    assert sensitive['leak_detection']['missed'] < 0.5
+    assert blind['leak_detection']['missed'] == 1.0
+    assert blind['leak_detection']['false_alarm'] == 0.0
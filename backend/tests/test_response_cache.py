@@ -0,0 +1,60 @@
+"""
+اختبارات الطلبات الشرطية في ResponseCache
+"""
+
+import sys
+import time
+from pathlib import Path
+
+from flask import Flask
+from werkzeug.http import http_date
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.response_cache import ResponseCache  # noqa: E402
+
+
+def make_app():
+    app = Flask(__name__)
+    cache = ResponseCache()
+    version = {'value': 1}
+
+    @app.route('/data')
+    def data():
+        return cache.respond(version['value'], lambda: {'version': version['value']})
+
+    return app, version
+
+
+def test_echoed_last_modified_gets_304(monkeypatch):
+    clock = {'now': 1_700_000_000.2}
+    monkeypatch.setattr(time, 'time', lambda: clock['now'])
+    app, version = make_app()
+    client = app.test_client()
+
+    # أثناء ثانية التعديل لا يُرسل Last-Modified
+    assert 'Last-Modified' not in client.get('/data').headers
+
+    clock['now'] += 1.0
+    last_modified = client.get('/data').headers['Last-Modified']
+    assert last_modified == http_date(1_700_000_000)
+    response = client.get('/data', headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 304
+
+
+def test_same_second_versions_share_no_validator(monkeypatch):
+    """نسختان في الثانية نفسها: لا تحمل أي منهما Last-Modified قبل انتهاء الثانية"""
+    clock = {'now': 1_700_000_000.2}
+    monkeypatch.setattr(time, 'time', lambda: clock['now'])
+    app, version = make_app()
+    client = app.test_client()
+
+    assert 'Last-Modified' not in client.get('/data').headers
+    clock['now'] += 0.5
+    version['value'] = 2
+    assert 'Last-Modified' not in client.get('/data').headers
+
+    clock['now'] += 1.0
+    response = client.get('/data')
+    assert response.get_json() == {'version': 2}
+    assert response.headers['Last-Modified'] == http_date(1_700_000_000)
@@ -0,0 +1,216 @@
+"""
+استعلامات تجميع زمنية بدلاء ثابتة العرض
+كل استعلام يُترجم إلى إحدى خطط التنفيذ:
+- rollup: إعادة تجميع ملخصات الدقيقة متجهياً (دلو من مضاعفات 60 ث وبدون مئينات)
+- sql: تجميع مدفوع إلى SQLite على القراءات الخام (GROUP BY)
+- numpy: قراءة الأعمدة الخام وفرزها مرة واحدة لكل حقل (عند طلب مئينات)
+والنتيجة أعمدة JSON مع زمن كل مرحلة
+"""
+
+import re
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from utils.data_logger import DataLogger
+from utils.rollups import ROLLUP_SECONDS, MinuteRollups
+
+AGGREGATES = ('avg', 'min', 'max', 'sum', 'count')
+PERCENTILE = re.compile(r'^p(\d+(?:\.\d+)?)$')
+MAX_BUCKETS = 100000
+
+
+@dataclass
+class Aggregate:
+    """تجميع واحد (حقل، دالة)؛ q هو المئين (0-100) لدوال pNN"""
+    field: str
+    func: str
+    q: Optional[float] = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.field}_{self.func}"
+
+    @classmethod
+    def parse(cls, spec: str) -> 'Aggregate':
+        """تحليل 'field:func' مثل temperature:avg أو water_level:p95"""
+        field, _, func = spec.strip().partition(':')
+        func = func.strip().lower() or 'avg'
+        DataLogger.check_fields([field])
+        match = PERCENTILE.match(func)
+        if match:
+            q = float(match.group(1))
+            if q > 100:
+                raise ValueError(f"Percentile out of range: {func}")
+            return cls(field, func, q)
+        if func not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate: {func}")
+        return cls(field, func)
+
+
+def run_aggregate_query(data_logger: DataLogger, rollups: Optional[MinuteRollups],
+                        bucket: int, aggregates: List[Aggregate],
+                        start=None, end=None) -> Dict[str, Any]:
+    """تنفيذ استعلام التجميع وإرجاع {buckets, columns, plan, timing_ms, ...}
+
+    الدلاء محاذاة لمضاعفات العرض من epoch (UTC)، والدلاء الفارغة تُحذف.
+    """
+    started = time.perf_counter()
+    if bucket < 1:
+        raise ValueError("bucket must be a positive number of seconds")
+    if not aggregates:
+        raise ValueError("At least one aggregate is required")
+    start, end = DataLogger.to_epoch(start), DataLogger.to_epoch(end)
+    if start is not None and end is not None and (end - start) / bucket > MAX_BUCKETS:
+        raise ValueError(f"Too many buckets (max {MAX_BUCKETS})")
+
+    fields = list(dict.fromkeys(agg.field for agg in aggregates))
+    has_percentiles = any(agg.q is not None for agg in aggregates)
+    if rollups is not None and not has_percentiles and bucket % ROLLUP_SECONDS == 0:
+        plan = f'rollup_{ROLLUP_SECONDS}s'
+        buckets, columns, scanned, timing = _from_rollups(rollups, bucket, aggregates, fields, start, end)
+    elif not has_percentiles:
+        plan = 'sql'
+        buckets, columns, scanned, timing = _from_sql(data_logger, bucket, aggregates, start, end)
+    else:
+        plan = 'numpy'
+        buckets, columns, scanned, timing = _from_raw(data_logger, bucket, aggregates, fields, start, end)
+
+    timing['total'] = round((time.perf_counter() - started) * 1000, 3)
+    return {
+        'bucket_seconds': bucket,
+        'buckets': [DataLogger._db_time(b) for b in buckets],
+        'columns': columns,
+        'plan': plan,
+        'rows_scanned': scanned,
+        'timing_ms': timing
+    }
+
+
+def _from_rollups(rollups, bucket, aggregates, fields, start, end):
+    """إعادة تجميع ملخصات الدقيقة إلى دلاء أعرض بـ reduceat"""
+    t0 = time.perf_counter()
+    minutes = rollups.read(start, end, fields)
+    t1 = time.perf_counter()
+
+    keys = minutes['bucket'] // bucket * bucket
+    starts = np.flatnonzero(np.r_[True, np.diff(keys) != 0]) if len(keys) else np.array([], dtype=np.intp)
+    counts = np.add.reduceat(minutes['count'], starts) if len(starts) else np.array([])
+    columns = {}
+    for agg in aggregates:
+        if agg.func == 'count':
+            values = counts
+        elif agg.func == 'min':
+            values = np.minimum.reduceat(minutes[f"{agg.field}_min"], starts) if len(starts) else counts
+        elif agg.func == 'max':
+            values = np.maximum.reduceat(minutes[f"{agg.field}_max"], starts) if len(starts) else counts
+        else:
+            values = np.add.reduceat(minutes[f"{agg.field}_sum"], starts) if len(starts) else counts
+            if agg.func == 'avg':
+                values = values / np.maximum(counts, 1)
+        columns[agg.name] = _to_list(values, agg)
+    t2 = time.perf_counter()
+    return keys[starts].tolist(), columns, len(keys), _timing(t0, t1, t2)
+
+
+def _from_sql(data_logger, bucket, aggregates, start, end):
+    """تجميع مدفوع إلى SQLite على القراءات الخام"""
+    t0 = time.perf_counter()
+    selects = []
+    for agg in aggregates:
+        if agg.func == 'count':
+            selects.append(f"COUNT({agg.field})")
+        else:
+            selects.append(f"{agg.func.upper()}({agg.field})")
+    conditions, params = ['timestamp IS NOT NULL'], []
+    if start is not None:
+        conditions.append('timestamp >= ?')
+        params.append(DataLogger._db_time(start))
+    if end is not None:
+        conditions.append('timestamp <= ?')
+        params.append(DataLogger._db_time(end))
+
+    conn = sqlite3.connect(data_logger.db_path)
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT CAST(strftime('%s', timestamp) AS INTEGER) / ? * ? AS b, COUNT(*), {', '.join(selects)}
+        FROM tank_readings
+        WHERE {' AND '.join(conditions)}
+        GROUP BY b
+        ORDER BY b
+    ''', [bucket, bucket] + params)
+    rows = cursor.fetchall()
+    conn.close()
+    t1 = time.perf_counter()
+
+    columns = {}
+    for i, agg in enumerate(aggregates):
+        columns[agg.name] = _to_list([row[2 + i] for row in rows], agg)
+    t2 = time.perf_counter()
+    return [row[0] for row in rows], columns, sum(row[1] for row in rows), _timing(t0, t1, t2)
+
+
+def _from_raw(data_logger, bucket, aggregates, fields, start, end):
+    """قراءة الأعمدة الخام وتجميعها متجهياً (فرز واحد لكل حقل يغطي كل الدوال)"""
+    t0 = time.perf_counter()
+    raw = data_logger.read_columns(start, end, fields)
+    t1 = time.perf_counter()
+
+    keys, inverse = np.unique(raw['timestamp'] // bucket * bucket, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    columns = {}
+    for field in fields:
+        values = raw[field]
+        valid = ~np.isnan(values)
+        ids, values = inverse[valid], values[valid]
+        order = np.lexsort((values, ids))
+        ids, values = ids[order], values[order]
+        starts = np.searchsorted(ids, np.arange(len(keys)))
+        counts = np.searchsorted(ids, np.arange(len(keys)), side='right') - starts
+        filled = counts > 0
+        last = np.maximum(starts + counts - 1, 0)
+
+        for agg in aggregates:
+            if agg.field != field:
+                continue
+            if agg.func == 'count':
+                result = counts.astype(float)
+            elif not len(values):
+                result = np.full(len(keys), np.nan)
+            elif agg.func == 'min':
+                result = np.where(filled, values[np.minimum(starts, len(values) - 1)], np.nan)
+            elif agg.func == 'max':
+                result = np.where(filled, values[last], np.nan)
+            elif agg.func in ('sum', 'avg'):
+                result = np.bincount(ids, weights=values, minlength=len(keys))
+                if agg.func == 'avg':
+                    result = np.where(filled, result / np.maximum(counts, 1), np.nan)
+            else:
+                # مئين بالاستيفاء الخطي بين أقرب رتبتين (مثل np.percentile)
+                position = starts + agg.q / 100.0 * np.maximum(counts - 1, 0)
+                low = np.minimum(np.floor(position).astype(np.intp), len(values) - 1)
+                high = np.minimum(np.ceil(position).astype(np.intp), len(values) - 1)
+                fraction = position - np.floor(position)
+                result = values[low] + (values[high] - values[low]) * fraction
+                result = np.where(filled, result, np.nan)
+            columns[agg.name] = _to_list(result, agg)
+    t2 = time.perf_counter()
+    return keys.tolist(), {agg.name: columns[agg.name] for agg in aggregates}, len(inverse), _timing(t0, t1, t2)
+
+
+def _to_list(values, agg: Aggregate) -> List[Any]:
+    """عمود JSON: أعداد صحيحة للعد، و None بدلاً من NaN"""
+    values = np.asarray(values, dtype=float)
+    if agg.func == 'count':
+        return values.astype(np.int64).tolist()
+    return [None if v != v else round(v, 6) for v in values.tolist()]
+
+
+def _timing(t0: float, t1: float, t2: float) -> Dict[str, float]:
+    return {
+        'query': round((t1 - t0) * 1000, 3),
+        'reduce': round((t2 - t1) * 1000, 3)
+    }
@@ -0,0 +1,93 @@
+"""
+فهرس التنبيهات النشطة في الذاكرة
+المصدر المعتمد للتنبيهات غير المحلولة: يُهيّأ من قاعدة البيانات عند البدء
+ويُحدّث بالكتابة المتزامنة، فلا يحتاج العرض والتصفية والتعرّف إلى مسح الجدول
+"""
+
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class ActiveAlertIndex:
+    """تنبيهات نشطة مفهرسة بالمعرّف والخطورة والنوع
+
+    الفهارس الثانوية مجموعات مرتبة (قواميس بقيم None) حتى يكون
+    الحذف O(1). كل الاستعلامات O(k) في عدد التنبيهات النشطة.
+    """
+
+    def __init__(self):
+        self.by_id: Dict[int, Dict[str, Any]] = {}
+        self.by_severity: Dict[str, Dict[int, None]] = defaultdict(dict)
+        self.by_type: Dict[str, Dict[int, None]] = defaultdict(dict)
+        self.revision = 0  # يزيد مع كل تغيير (لوسوم ETag)
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def __contains__(self, alert_id: int) -> bool:
+        return alert_id in self.by_id
+
+    def load(self, rows: Iterable[Dict[str, Any]]):
+        """تهيئة الفهرس من صفوف جدول alerts غير المحلولة"""
+        self.by_id.clear()
+        self.by_severity.clear()
+        self.by_type.clear()
+        for row in rows:
+            self.add(row)
+
+    def add(self, alert: Dict[str, Any]):
+        """إضافة تنبيه (بعد إدراجه في قاعدة البيانات)"""
+        alert_id = alert['id']
+        self.by_id[alert_id] = alert
+        self.by_severity[alert['severity']][alert_id] = None
+        self.by_type[alert['alert_type']][alert_id] = None
+        self.revision += 1
+
+    def update(self, alert_id: int, **fields):
+        """تحديث حقول تنبيه نشط (لا شيء إذا لم يكن نشطاً)"""
+        alert = self.by_id.get(alert_id)
+        if alert is not None:
+            alert.update(fields)
+            self.revision += 1
+
+    def remove(self, alert_ids: Iterable[int]) -> List[int]:
+        """إزالة تنبيهات وإرجاع المعرّفات التي كانت نشطة فعلاً"""
+        removed = []
+        for alert_id in alert_ids:
+            alert = self.by_id.pop(alert_id, None)
+            if alert is None:
+                continue
+            self.by_severity[alert['severity']].pop(alert_id, None)
+            self.by_type[alert['alert_type']].pop(alert_id, None)
+            removed.append(alert_id)
+        if removed:
+            self.revision += 1
+        return removed
+
+    def list(self, limit: Optional[int] = 50, severity: Optional[str] = None,
+             alert_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """التنبيهات النشطة من الأحدث للأقدم مع تصفية اختيارية"""
+        buckets = []
+        if severity:
+            buckets.append(self.by_severity.get(severity, {}))
+        if alert_type:
+            buckets.append(self.by_type.get(alert_type, {}))
+
+        if buckets:
+            smallest = min(buckets, key=len)
+            ids = [i for i in smallest if all(i in bucket for bucket in buckets)]
+        else:
+            ids = list(self.by_id)
+
+        # المعرّفات تتزايد مع زمن الإدراج
+        ids.sort(reverse=True)
+        if limit is not None and limit >= 0:
+            ids = ids[:limit]
+        return [dict(self.by_id[i]) for i in ids]
+
+    def counts(self) -> Dict[str, Any]:
+        """عدد التنبيهات النشطة إجمالاً ولكل خطورة"""
+        return {
+            'total': len(self.by_id),
+            'by_severity': {severity: len(ids) for severity, ids in self.by_severity.items() if ids}
+        }
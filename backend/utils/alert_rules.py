@@ -0,0 +1,206 @@
+"""
+قواعد تنبيه معرّفة في alert_rules.yaml ومُجمّعة إلى مقيّم متجه
+كل القواعد لكل الخزانات تُقيّم في تمريرة NumPy واحدة على مصفوفات الأعمدة،
+وتنسيق الرسائل مؤجل حتى إطلاق التنبيه فعلاً
+"""
+
+import logging
+import math
+from dataclasses import dataclass
+from pathlib import Path
+from string import Formatter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import yaml
+
+from utils.sliding_window import WINDOW_TYPES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = Path(__file__).parent.parent / "alert_rules.yaml"
+
+OPERATORS = ('<', '<=', '>', '>=', 'outside', 'inside', 'true')
+
+
+@dataclass
+class AlertRule:
+    """قاعدة تنبيه واحدة"""
+    name: str
+    field: str
+    op: str
+    threshold: Any = None
+    severity: str = "medium"
+    message: str = ""
+    clear_threshold: Any = None  # حد الإلغاء (None = نفس حد الإطلاق)
+    hold: float = 0.0  # ثوانٍ
+    renotify: float = 0.0  # ثوانٍ (0 = بدون إعادة إشعار)
+    type: str = "threshold"  # threshold أو نوع نافذة من WINDOW_TYPES
+    window: float = 0.0  # طول النافذة (ثوانٍ)
+    above: Optional[float] = None  # حد duration_above
+    unless: Optional[str] = None  # حقل منطقي يعطّل القاعدة عندما يكون صحيحاً
+
+    @property
+    def windowed(self) -> bool:
+        return self.type != "threshold"
+
+    @property
+    def source(self) -> str:
+        """العمود الذي يُقارن بالحد: الحقل نفسه أو العمود المشتق للنافذة"""
+        return f"{self.name}@{self.type}" if self.windowed else self.field
+
+    @property
+    def template_fields(self) -> Tuple[str, ...]:
+        """الحقول المستخدمة في قالب الرسالة"""
+        return tuple(name for _, name, _, _ in Formatter().parse(self.message) if name)
+
+    def format(self, values: Dict[str, Any]) -> str:
+        """تنسيق الرسالة (يُستدعى فقط عند الإطلاق)"""
+        try:
+            return self.message.format(**values)
+        except (KeyError, IndexError, ValueError):
+            return self.message
+
+    def bounds(self, clear: bool = False) -> Tuple[float, float, bool]:
+        """تحويل الشرط إلى (حد أدنى، حد أعلى، عكس): يُطلق عند v < lo أو v > hi
+
+        مع clear=True تُستخدم حدود الإلغاء، فيكون الشرط "ما زال قائماً".
+        """
+        t = self.clear_threshold if clear and self.clear_threshold is not None else self.threshold
+        if self.op == '<':
+            return float(t), np.inf, False
+        if self.op == '<=':
+            return float(np.nextafter(t, np.inf)), np.inf, False
+        if self.op == '>':
+            return -np.inf, float(t), False
+        if self.op == '>=':
+            return -np.inf, float(np.nextafter(t, -np.inf)), False
+        if self.op in ('outside', 'inside'):
+            low, high = t
+            return float(low), float(high), self.op == 'inside'
+        # true: القيم المنطقية تُخزن 0/1
+        return -np.inf, 0.5, False
+
+
+def load_rules(path=None) -> List[AlertRule]:
+    """قراءة القواعد من YAML مع التحقق منها"""
+    path = Path(path) if path else DEFAULT_RULES_PATH
+    with open(path, 'r', encoding='utf-8') as f:
+        spec = yaml.safe_load(f) or {}
+
+    defaults = spec.get('defaults', {})
+    rules = []
+    for entry in spec.get('rules', []):
+        entry = dict(defaults, **entry)
+        rule = AlertRule(**{k: entry[k] for k in AlertRule.__dataclass_fields__ if k in entry})
+        if rule.type != "threshold" and rule.type not in WINDOW_TYPES:
+            raise ValueError(f"Rule {rule.name}: unknown type {rule.type!r}")
+        if rule.type == "duration_above":
+            if not isinstance(rule.above, (int, float)):
+                raise ValueError(f"Rule {rule.name}: duration_above needs a numeric above")
+        elif rule.windowed and not rule.window > 0:
+            raise ValueError(f"Rule {rule.name}: {rule.type} needs a positive window")
+        if rule.op not in OPERATORS:
+            raise ValueError(f"Rule {rule.name}: unknown op {rule.op!r}")
+        if rule.op in ('outside', 'inside'):
+            if not isinstance(rule.threshold, (list, tuple)) or len(rule.threshold) != 2:
+                raise ValueError(f"Rule {rule.name}: {rule.op} needs [low, high]")
+        elif rule.op != 'true' and not isinstance(rule.threshold, (int, float)):
+            raise ValueError(f"Rule {rule.name}: numeric threshold required")
+        if rule.clear_threshold is not None and \
+                isinstance(rule.clear_threshold, (list, tuple)) != isinstance(rule.threshold, (list, tuple)):
+            raise ValueError(f"Rule {rule.name}: clear_threshold must match threshold shape")
+        rules.append(rule)
+    return rules
+
+
+class CompiledRules:
+    """مقيّم متجه لمجموعة قواعد
+
+    كل قاعدة تتحول إلى صف في مصفوفة حدود (lo, hi, negate)، فيصبح التقييم
+    مقارنتين على مصفوفة (قواعد × خزانات) مأخوذة من أعمدة الحقول.
+    حدود الإلغاء تُجمّع بالطريقة نفسها لتقييم التخلف في التمريرة ذاتها.
+    قواعد النوافذ تُقارن أعمدة مشتقة يحسبها WindowedAggregates قبل التقييم.
+    الحقول المفقودة (NaN) لا تطلق أي قاعدة.
+    """
+
+    def __init__(self, rules: List[AlertRule]):
+        self.rules = rules
+        self.fields = sorted({rule.source for rule in rules})
+        self.windowed = [rule for rule in rules if rule.windowed]
+        self._unless = [(i, rule.unless) for i, rule in enumerate(rules) if rule.unless]
+        self.inputs = sorted(
+            {rule.field for rule in rules}
+            .union(name for _, name in self._unless)
+            .union(*(rule.template_fields for rule in rules))
+            - {'value'}
+        )
+        self._templates = [rule.template_fields for rule in rules]
+        self.index = {rule.name: i for i, rule in enumerate(rules)}
+
+        index = {name: i for i, name in enumerate(self.fields)}
+        self._rows = np.array([index[rule.source] for rule in rules], dtype=np.intp)
+        bounds = np.array([rule.bounds() for rule in rules], dtype=float).reshape(-1, 3)
+        self._low = bounds[:, 0:1]
+        self._high = bounds[:, 1:2]
+        self._negate = bounds[:, 2:3].astype(bool)
+        clear = np.array([rule.bounds(clear=True) for rule in rules], dtype=float).reshape(-1, 3)
+        self._clear_low = clear[:, 0:1]
+        self._clear_high = clear[:, 1:2]
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    @staticmethod
+    def columns_from_state(state: Dict[str, Any], names: Sequence[str]) -> Dict[str, np.ndarray]:
+        """أعمدة بطول 1 من حالة خزان واحد"""
+        return {name: np.array([state[name]]) for name in names if state.get(name) is not None}
+
+    def evaluate(self, columns: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """فهارس (القاعدة، الخزان) المُطلقة لجميع القواعد وجميع الخزانات"""
+        return np.nonzero(self.evaluate_masks(columns)[0])
+
+    def evaluate_masks(self, columns: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """مصفوفتا (قواعد × خزانات): تحقق شرط الإطلاق، واستمرار الشرط ضمن حدود الإلغاء"""
+        size = max((len(col) for col in columns.values()), default=0)
+        matrix = np.full((len(self.fields), size), np.nan)
+        for i, name in enumerate(self.fields):
+            column = columns.get(name)
+            if column is not None:
+                matrix[i] = column
+
+        values = matrix[self._rows]
+        valid = ~np.isnan(values)
+        raised = (((values < self._low) | (values > self._high)) ^ self._negate) & valid
+        holding = (((values < self._clear_low) | (values > self._clear_high)) ^ self._negate) & valid
+        holding |= raised
+
+        for i, name in self._unless:
+            column = columns.get(name)
+            if column is not None:
+                suppressed = np.asarray(column, dtype=bool)
+                raised[i] &= ~suppressed
+                holding[i] &= ~suppressed
+        return raised, holding
+
+    def value(self, rule_index: int, columns: Dict[str, np.ndarray], tank_index: int) -> Any:
+        """قيمة مصدر القاعدة لخزان واحد (None إذا غاب العمود أو كانت القيمة NaN)"""
+        column = columns.get(self.rules[rule_index].source)
+        if column is None:
+            return None
+        value = column[tank_index]
+        value = value.item() if hasattr(value, 'item') else value
+        return None if isinstance(value, float) and math.isnan(value) else value
+
+    def message(self, rule_index: int, columns: Dict[str, np.ndarray], tank_index: int) -> str:
+        """تنسيق رسالة قاعدة مُطلقة لخزان واحد (القيم الغائبة تُبقي القالب بلا تنسيق)"""
+        values = {}
+        for name in self._templates[rule_index]:
+            if name == 'value':
+                value = self.value(rule_index, columns, tank_index)
+                if value is not None:
+                    values[name] = value
+            elif name in columns:
+                value = columns[name][tank_index]
+                values[name] = value.item() if hasattr(value, 'item') else value
+        return self.rules[rule_index].format(values)
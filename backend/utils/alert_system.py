@@ -1,122 +1,235 @@
+from dataclasses import dataclass, asdict
 from datetime import datetime
-from typing import Dict, Any, List
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Sequence
 import logging
-import sqlite3
+import time
+import numpy as np
 from .data_logger import DataLogger
+from .alert_rules import AlertRule, CompiledRules, load_rules, DEFAULT_RULES_PATH
+from .alert_index import ActiveAlertIndex
+from .sliding_window import WindowedAggregates
 
 logger = logging.getLogger(__name__)
 
+@dataclass
+class AlertState:
+    """حالة تنبيه واحد (قاعدة × خزان) في آلة الحالة"""
+    active: bool = False
+    pending_since: Optional[float] = None  # بداية تحقق شرط الإطلاق
+    clear_since: Optional[float] = None  # بداية زوال الشرط ضمن حدود الإلغاء
+    first_seen: Optional[float] = None
+    last_seen: Optional[float] = None
+    last_notified: Optional[float] = None
+    count: int = 0  # عدد مرات رصد الشرط خلال هذه الحادثة
+    alert_id: Optional[int] = None
+
 class AlertSystem:
-    def __init__(self, data_logger: DataLogger):
+    def __init__(self, data_logger: DataLogger, rules_path: Optional[str] = None):
         self.data_logger = data_logger
+        self.rules_path = Path(rules_path) if rules_path else DEFAULT_RULES_PATH
         self.alert_rules = self._load_alert_rules()
+        self.states: Dict[tuple, AlertState] = {}
+        self.windows = WindowedAggregates()
+        
+        # فهرس التنبيهات غير المحلولة (مصدر القراءة المعتمد)
+        self.active = ActiveAlertIndex()
+        self.active.load(self.data_logger.get_alerts(unresolved_only=True, limit=-1))
     
-    def _load_alert_rules(self) -> List[Dict]:
-        """تحميل قواعد التنبيه"""
-        return [
-            {
-                "name": "low_water_level",
-                "condition": lambda state: state['water_level'] < 20,
-                "severity": "high",
-                "message": "مستوى المياه منخفض جداً!"
-            },
-            {
-                "name": "high_water_level",
-                "condition": lambda state: state['water_level'] > 90,
-                "severity": "high",
-                "message": "مستوى المياه مرتفع جداً!"
-            },
-            {
-                "name": "high_temperature",
-                "condition": lambda state: state['temperature'] > 40,
-                "severity": "medium",
-                "message": f"درجة حرارة عالية: {{temperature}}°C"
-            },
-            {
-                "name": "low_temperature",
-                "condition": lambda state: state['temperature'] < 5,
-                "severity": "medium",
-                "message": f"درجة حرارة منخفضة: {{temperature}}°C"
-            },
-            {
-                "name": "high_pressure",
-                "condition": lambda state: state['pressure'] > 2.0,
-                "severity": "high",
-                "message": f"ضغط عالٍ: {{pressure}} بار"
-            },
-            {
-                "name": "ph_out_of_range",
-                "condition": lambda state: state['ph_level'] < 6.5 or state['ph_level'] > 8.5,
-                "severity": "medium",
-                "message": f"الأس الهيدروجيني خارج النطاق: {{ph_level}}"
-            },
-            {
-                "name": "leak_detected",
-                "condition": lambda state: state['leak_detected'],
-                "severity": "critical",
-                "message": "تسرب مياه مكتشف!"
-            }
-        ]
+    def _load_alert_rules(self) -> CompiledRules:
+        """تحميل قواعد التنبيه من YAML وتجميعها"""
+        return CompiledRules(load_rules(self.rules_path))
+    
+    def reload_rules(self) -> int:
+        """إعادة تحميل القواعد أثناء التشغيل (تبقى القواعد الحالية إذا فشل التحميل)"""
+        self.alert_rules = self._load_alert_rules()
+        self.windows.prune(self.alert_rules.windowed)
+        logger.info(f"🔁 Reloaded {len(self.alert_rules)} alert rules from {self.rules_path}")
+        return len(self.alert_rules)
+    
+    def get_rules(self) -> List[Dict[str, Any]]:
+        """القواعد الحالية"""
+        return [asdict(rule) for rule in self.alert_rules.rules]
     
     def check_alerts(self, tank_state: Dict[str, Any]) -> List[Dict]:
         """فحص حالة الخزان مقابل قواعد التنبيه"""
-        triggered_alerts = []
+        rules = self.alert_rules
+        return self.check_alerts_batch(CompiledRules.columns_from_state(tank_state, rules.inputs), rules=rules)
+    
+    def check_alerts_batch(self, columns: Dict[str, Any], tank_ids: Optional[Sequence] = None,
+                           rules: Optional[CompiledRules] = None, now: Optional[float] = None) -> List[Dict]:
+        """فحص جميع القواعد لجميع الخزانات في تمريرة واحدة وإرجاع انتقالات الحالة فقط
+
+        كل تنبيه يمر بآلة حالة: يُطلق بعد استمرار الشرط hold ثانية، ويبقى قائماً
+        حتى يعود المقاس خلف حد الإلغاء لمدة hold، ويُعاد الإشعار كل renotify ثانية.
+        الحفظ في قاعدة البيانات والبث يحدثان عند الانتقالات فقط.
+        """
+        # مرجع واحد للقواعد حتى لا تتأثر التمريرة بإعادة التحميل
+        rules = rules or self.alert_rules
+        now = time.time() if now is None else now
+        transitions = []
+        
+        size = max((len(column) for column in columns.values()), default=0)
+        keys = list(tank_ids) if tank_ids is not None else (["main"] if size == 1 else list(range(size)))
+        positions = {key: j for j, key in enumerate(keys)}
+        
+        try:
+            # قواعد النوافذ: تحديث المجمّعات التزايدية ثم تقييم أعمدتها المشتقة
+            if rules.windowed:
+                columns = dict(columns, **self.windows.update(rules.windowed, columns, keys, now))
+            raised, holding = rules.evaluate_masks(columns)
+        except Exception as e:
+            logger.error(f"Error evaluating alert rules: {e}")
+            return transitions
+        
+        # المرشحون: القواعد المُطلقة الآن وكل حالة قيد المتابعة لخزانات هذه الدفعة
+        candidates = set(zip(*(axis.tolist() for axis in np.nonzero(raised))))
+        for name, key in list(self.states):
+            if key not in positions:
+                continue
+            if name not in rules.index:
+                del self.states[(name, key)]  # قاعدة أزيلت بإعادة التحميل
+                continue
+            candidates.add((rules.index[name], positions[key]))
+        
+        for r, j in sorted(candidates):
+            rule = rules.rules[r]
+            key = (rule.name, keys[j])
+            state = self.states.setdefault(key, AlertState())
+            transition = self._advance(state, rule, bool(raised[r, j]), bool(holding[r, j]), now)
+            
+            if transition:
+                transitions.append(self._record_transition(
+                    transition, state, rule, rules.message(r, columns, j), rules.value(r, columns, j),
+                    keys[j] if tank_ids is not None else None, now
+                ))
+            if transition == "cleared" or (not state.active and state.pending_since is None):
+                del self.states[key]
         
-        for rule in self.alert_rules:
-            try:
-                if rule['condition'](tank_state):
-                    # تنسيق الرسالة
-                    message = rule['message'].format(**tank_state)
-                    
-                    alert = {
-                        "type": rule['name'],
-                        "severity": rule['severity'],
-                        "message": message,
-                        "timestamp": datetime.now().isoformat(),
-                        "data": tank_state
-                    }
-                    
-                    triggered_alerts.append(alert)
-                    
-                    # تسجيل التنبيه في قاعدة البيانات
-                    self.data_logger.log_alert(
-                        rule['name'],
-                        rule['severity'],
-                        message
-                    )
-                    
-                    logger.warning(f"Alert triggered: {rule['name']} - {message}")
-            except Exception as e:
-                logger.error(f"Error checking alert rule {rule['name']}: {e}")
+        return transitions
+    
+    @staticmethod
+    def _advance(state: AlertState, rule: AlertRule, raised: bool, holding: bool, now: float) -> Optional[str]:
+        """خطوة واحدة في آلة الحالة: raised أو renotified أو cleared أو None"""
+        if not state.active:
+            if not raised:
+                state.pending_since = None
+                state.count = 0
+                return None
+            if state.pending_since is None:
+                state.pending_since = now
+            state.count += 1
+            if now - state.pending_since < rule.hold:
+                return None
+            state.active = True
+            state.first_seen = state.pending_since
+            state.last_seen = state.last_notified = now
+            return "raised"
+        
+        if holding:
+            state.count += 1
+            state.last_seen = now
+            state.clear_since = None
+            if rule.renotify and now - state.last_notified >= rule.renotify:
+                state.last_notified = now
+                return "renotified"
+            return None
+        
+        if state.clear_since is None:
+            state.clear_since = now
+        if now - state.clear_since < rule.hold:
+            return None
+        return "cleared"
+    
+    def _record_transition(self, transition: str, state: AlertState, rule: AlertRule, message: str,
+                           value: Any, tank_id: Any, now: float) -> Dict[str, Any]:
+        """حفظ الانتقال في قاعدة البيانات وبناء رسالة البث"""
+        # الكتابة في قاعدة البيانات أولاً ثم في الفهرس
+        db_time = self.data_logger._db_time
+        if transition == "raised":
+            state.alert_id = self.data_logger.log_alert(
+                rule.name, rule.severity, message, state.count, state.first_seen, state.last_seen,
+                timestamp=now
+            )
+            if state.alert_id is not None:
+                self.active.add({
+                    "id": state.alert_id,
+                    "timestamp": db_time(now),
+                    "alert_type": rule.name,
+                    "severity": rule.severity,
+                    "message": message,
+                    "resolved": 0,
+                    "count": state.count,
+                    "first_seen": db_time(state.first_seen),
+                    "last_seen": db_time(state.last_seen),
+                    "cleared_at": None
+                })
+            logger.warning(f"Alert raised: {rule.name} - {message}")
+        elif transition == "renotified":
+            self.data_logger.update_alert_occurrence(state.alert_id, state.count, state.last_seen)
+            self.active.update(state.alert_id, count=state.count, last_seen=db_time(state.last_seen))
+            logger.warning(f"Alert still active: {rule.name} - {message} (x{state.count})")
+        else:
+            self.data_logger.update_alert_occurrence(state.alert_id, state.count, state.last_seen, cleared_at=now)
+            self.active.update(state.alert_id, count=state.count, last_seen=db_time(state.last_seen),
+                               cleared_at=db_time(now))
+            logger.info(f"Alert cleared: {rule.name} after {state.count} occurrences")
         
-        return triggered_alerts
+        alert = {
+            "id": state.alert_id,
+            "type": rule.name,
+            "severity": rule.severity,
+            "state": transition,
+            "message": message,
+            "timestamp": datetime.now().isoformat(),
+            "field": rule.field,
+            "value": value.item() if hasattr(value, 'item') else value,
+            "count": state.count,
+            "first_seen": datetime.fromtimestamp(state.first_seen).isoformat(),
+            "last_seen": datetime.fromtimestamp(state.last_seen).isoformat()
+        }
+        if tank_id is not None:
+            alert["tank_id"] = tank_id
+        return alert
     
-    def get_active_alerts(self) -> List[Dict]:
-        """الحصول على التنبيهات النشطة (غير المحلولة)"""
-        return self.data_logger.get_alerts(unresolved_only=True)
+    def get_active_alerts(self, limit: Optional[int] = 50, severity: Optional[str] = None,
+                          alert_type: Optional[str] = None) -> List[Dict]:
+        """الحصول على التنبيهات النشطة (غير المحلولة) من الفهرس"""
+        return self.active.list(limit, severity, alert_type)
     
     def acknowledge_alert(self, alert_id: int) -> bool:
         """التعرف على تنبيه (تعليمه كمقروء)"""
-        try:
-            self.data_logger.resolve_alert(alert_id)
-            return True
-        except Exception as e:
-            logger.error(f"Error acknowledging alert {alert_id}: {e}")
-            return False
+        return self.acknowledge_alerts([alert_id]) == 1
     
-    def clear_all_alerts(self):
-        """حذف جميع التنبيهات"""
-        try:
-            conn = sqlite3.connect(self.data_logger.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('UPDATE alerts SET resolved = TRUE')
-            
-            conn.commit()
-            conn.close()
-            
-            logger.info("All alerts cleared")
-            return True
-        except Exception as e:
-            logger.error(f"Error clearing all alerts: {e}")
-            return False
\ No newline at end of file
+    def acknowledge_alerts(self, alert_ids: Sequence[int]) -> int:
+        """التعرف على عدة تنبيهات نشطة بعبارة واحدة وإرجاع عددها"""
+        ids = [alert_id for alert_id in dict.fromkeys(alert_ids) if alert_id in self.active]
+        if not ids:
+            return 0
+        if not self.data_logger.resolve_alerts(ids):
+            logger.error(f"Error acknowledging alerts {ids}")
+            return 0
+        return len(self.active.remove(ids))
+    
+    def export_state(self) -> Dict[str, Any]:
+        """تصدير حالة آلة التنبيهات حتى لا تُعاد التنبيهات القائمة بعد الاستئناف"""
+        return {
+            'states': [
+                dict(asdict(state), rule=name, tank=key)
+                for (name, key), state in self.states.items()
+            ]
+        }
+    
+    def load_state(self, state: Dict[str, Any]):
+        """استعادة حالة نظام التنبيهات"""
+        fields = AlertState.__dataclass_fields__
+        self.states = {
+            (entry['rule'], entry['tank']): AlertState(**{k: v for k, v in entry.items() if k in fields})
+            for entry in state.get('states', [])
+        }
+    
+    def clear_all_alerts(self) -> int:
+        """التعرف على جميع التنبيهات النشطة"""
+        count = self.acknowledge_alerts(list(self.active.by_id))
+        logger.info(f"{count} alerts cleared")
+        return count
@@ -0,0 +1,180 @@
+"""
+طبقة بث بتسلسل واحد وطوابير محدودة لكل عميل
+كل حدث يُحوّل إلى حزم Engine.IO مرة واحدة وتُشارك بايتاتها بين جميع
+المستلمين. كل عميل له طابور صادر محدود: إذا تراكمت حزم لم يرسلها نقل
+العميل (رابط بطيء) تبقى الحزم الجديدة في الطابور ويُسقط الأقدم عند
+امتلائه (drop-to-latest)، فلا تنتظر حلقة المحاكاة أي عميل ولا تنمو
+الذاكرة بلا حد. عملاء الدلتا يكتشفون الإطارات المسقطة بفجوة الترقيم.
+
+الطوابير تعتمد على واجهات داخلية في python-socketio/python-engineio
+(_send_eio_packet أو eio.send_packet، وeio.sockets[sid].queue)؛ تُفحص عند
+الإنشاء وإذا غابت يعود الموزّع إلى socketio.emit العادي.
+"""
+
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Union
+
+from engineio import packet as eio_packet
+from engineio import socket as eio_socket
+from socketio import packet as sio_packet
+
+logger = logging.getLogger(__name__)
+
+
+class ClientQueue:
+    """طابور عميل واحد وعداداته"""
+
+    def __init__(self, eio_sid: str, max_size: int):
+        self.eio_sid = eio_sid
+        self.pending = deque(maxlen=max_size)
+        self.sent = 0
+        self.dropped = 0
+
+
+class BroadcastHub:
+    """موزّع أحداث Socket.IO بواجهة emit(event, data, to=...)"""
+
+    def __init__(self, socketio, namespace: str = '/', max_queue: int = 8, max_inflight: int = 16):
+        self.socketio = socketio
+        self.namespace = namespace
+        self.max_queue = max_queue
+        self.max_inflight = max_inflight  # حد حزم النقل غير المرسلة قبل الحجز في الطابور
+        self.clients: Dict[str, ClientQueue] = {}
+        self.stats = {'events': 0, 'encodes': 0, 'deliveries': 0, 'dropped': 0, 'encode_ms': 0.0}
+        self.capabilities = self.check_capabilities()
+        self.direct = all(self.capabilities.values())
+        if not self.direct:
+            missing = ', '.join(name for name, ok in self.capabilities.items() if not ok)
+            logger.warning(f"⚠️ Broadcast hub falling back to socketio.emit (missing: {missing})")
+
+    @property
+    def server(self):
+        return self.socketio.server
+
+    def check_capabilities(self) -> Dict[str, bool]:
+        """فحص الواجهات الداخلية التي يحتاجها الإرسال المباشر في النسخ المثبتة"""
+        server = self.server
+        eio = getattr(server, 'eio', None)
+        manager = getattr(server, 'manager', None)
+        send = getattr(server, '_send_eio_packet', None) or getattr(eio, 'send_packet', None)
+        try:
+            # المقبس يُنشئ طابوره الصادر في __init__، فيُفحص بمقبس تجريبي غير مسجل
+            queue = eio_socket.Socket(eio, 'capability-probe').queue
+            has_queue = callable(getattr(queue, 'qsize', None))
+        except Exception:
+            has_queue = False
+        return {
+            'server': server is not None,
+            'get_participants': callable(getattr(manager, 'get_participants', None)),
+            'send_eio_packet': callable(send),
+            'eio_sockets': isinstance(getattr(eio, 'sockets', None), dict),
+            'socket_queue': has_queue,
+        }
+
+    def encode(self, event: str, data: Any) -> List[eio_packet.Packet]:
+        """تحويل الحدث إلى حزم Engine.IO (مرة واحدة لكل الأحداث المرسلة)"""
+        started = time.perf_counter()
+        packet_class = getattr(self.server, 'packet_class', sio_packet.Packet)
+        pkt = packet_class(sio_packet.EVENT, namespace=self.namespace, data=[event, data])
+        encoded = pkt.encode()
+        if not isinstance(encoded, list):
+            encoded = [encoded]
+        self.stats['encodes'] += 1
+        self.stats['encode_ms'] += (time.perf_counter() - started) * 1000
+        return [eio_packet.Packet(eio_packet.MESSAGE, part) for part in encoded]
+
+    def emit(self, event: str, data: Any, to: Union[str, Iterable[str], None] = None):
+        """ترميز الحدث مرة واحدة ووضعه في طابور كل مستلم (بدون انتظار)"""
+        if self.server is None:
+            return
+        if not self.direct:
+            self.stats['events'] += 1
+            self.socketio.emit(event, data, to=to, namespace=self.namespace)
+            return
+        rooms = [to] if to is None or isinstance(to, str) else list(to)
+        recipients = {}
+        for room in rooms:
+            for sid, eio_sid in self.server.manager.get_participants(self.namespace, room):
+                recipients[sid] = eio_sid
+        self.stats['events'] += 1
+        if not recipients:
+            return
+
+        packets = self.encode(event, data)
+        for sid, eio_sid in recipients.items():
+            client = self.clients.get(sid)
+            if client is None:
+                client = self.clients[sid] = ClientQueue(eio_sid, self.max_queue)
+            if len(client.pending) == client.pending.maxlen:
+                client.dropped += 1
+                self.stats['dropped'] += 1
+            client.pending.append(packets)
+            self.flush(client)
+
+    def flush(self, client: ClientQueue):
+        """تسليم ما يسمح به نقل العميل من طابوره"""
+        inflight = self._inflight(client.eio_sid)
+        while client.pending and inflight < self.max_inflight:
+            packets = client.pending.popleft()
+            try:
+                for pkt in packets:
+                    self._send(client.eio_sid, pkt)
+            except Exception as e:
+                logger.debug(f"Dropping frame for disconnected client: {e}")
+                client.pending.clear()
+                return
+            inflight += len(packets)
+            client.sent += 1
+            self.stats['deliveries'] += 1
+
+    def flush_all(self):
+        """محاولة تفريغ الطوابير المحجوزة (بعد تعافي الروابط البطيئة)"""
+        for client in list(self.clients.values()):
+            if client.pending:
+                self.flush(client)
+
+    def discard(self, sid: str):
+        """إزالة طابور عميل عند قطع الاتصال"""
+        self.clients.pop(sid, None)
+
+    def _send(self, eio_sid: str, pkt: eio_packet.Packet):
+        send = getattr(self.server, '_send_eio_packet', None)
+        if send is not None:
+            send(eio_sid, pkt)
+        else:
+            self.server.eio.send_packet(eio_sid, pkt)
+
+    def _inflight(self, eio_sid: str) -> int:
+        """عدد حزم Engine.IO التي تنتظر الكتابة إلى مقبس العميل"""
+        socket = getattr(self.server.eio, 'sockets', {}).get(eio_sid)
+        queue = getattr(socket, 'queue', None)
+        try:
+            return queue.qsize() if queue is not None else 0
+        except NotImplementedError:
+            return 0
+
+    def get_metrics(self, top: int = 5) -> Dict[str, Any]:
+        """أعماق الطوابير والإطارات المسقطة"""
+        depths = {sid: len(client.pending) for sid, client in self.clients.items()}
+        slowest = sorted(self.clients.items(), key=lambda item: (len(item[1].pending), item[1].dropped),
+                         reverse=True)[:top]
+        encodes = self.stats['encodes']
+        return {
+            'mode': 'direct' if self.direct else 'emit',
+            'clients': len(self.clients),
+            'max_queue': self.max_queue,
+            'max_inflight': self.max_inflight,
+            'queued_frames': sum(depths.values()),
+            'max_queue_depth': max(depths.values(), default=0),
+            'events': self.stats['events'],
+            'encodes': encodes,
+            'deliveries': self.stats['deliveries'],
+            'dropped': self.stats['dropped'],
+            'avg_encode_ms': round(self.stats['encode_ms'] / encodes, 4) if encodes else 0.0,
+            'slowest_clients': [
+                {'sid': sid, 'queue_depth': len(client.pending), 'sent': client.sent, 'dropped': client.dropped}
+                for sid, client in slowest if client.pending or client.dropped
+            ]
+        }
@@ -0,0 +1,27 @@
+"""
+تحميل ملف التكوين config.yaml
+"""
+
+import logging
+from pathlib import Path
+from typing import Any, Dict
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_PATH = Path(__file__).parent.parent / "config.yaml"
+
+
+def load_config(path=None) -> Dict[str, Any]:
+    """قراءة ملف التكوين (قاموس فارغ إذا لم يوجد)"""
+    path = Path(path) if path else DEFAULT_CONFIG_PATH
+    if not path.exists():
+        logger.warning(f"Config file not found: {path}")
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return yaml.safe_load(f) or {}
+    except Exception as e:
+        logger.error(f"Error loading config {path}: {e}")
+        return {}
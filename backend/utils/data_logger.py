@@ -1,17 +1,61 @@
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
+import base64
 import json
 import logging
+import time
+
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# أعمدة القراءات المسموح بإسقاطها في استعلامات التاريخ
+READING_FIELDS = (
+    'water_level', 'water_volume', 'temperature', 'pressure', 'ph_level', 'turbidity',
+    'is_filling', 'is_draining', 'leak_detected', 'flow_rate'
+)
+
+def encode_cursor(state):
+    """مؤشر صفحات معتم (JSON مرمّز base64)"""
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """فك مؤشر الصفحات والتحقق من بنيته: {after, until: معرّفان صحيحان، fields: أسماء حقول}"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(state, dict):
+        raise ValueError("Invalid cursor")
+    after, until, fields = state.get('after'), state.get('until'), state.get('fields')
+    ids_valid = all(isinstance(value, int) and not isinstance(value, bool) and value >= 0
+                    for value in (after, until))
+    fields_valid = isinstance(fields, list) and fields and all(name in READING_FIELDS for name in fields)
+    if not ids_valid or not fields_valid:
+        raise ValueError("Invalid cursor")
+    return state
+
 class DataLogger:
     def __init__(self, db_path="data/historical_data.db"):
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.listeners = []
+        self.alerts_revision = 0  # يزيد مع كل كتابة في جدول التنبيهات (لوسوم ETag)
         self.init_database()
     
+    def add_listener(self, callback):
+        """تسجيل مستمع يُستدعى بعد كل كتابة ناجحة: callback(table, row, timestamp)"""
+        self.listeners.append(callback)
+    
+    def _notify(self, table, row, timestamp):
+        for callback in self.listeners:
+            try:
+                callback(table, row, timestamp)
+            except Exception as e:
+                logger.error(f"Error in data listener: {e}")
+    
     def init_database(self):
         """تهيئة قاعدة البيانات"""
         conn = sqlite3.connect(self.db_path)
@@ -45,6 +89,9 @@ class DataLogger:
                 details TEXT
             )
         ''')
+        
+        # فهرس الزمن لتحويل نطاقات الوقت إلى نطاقات معرّفات
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tank_readings_timestamp ON tank_readings(timestamp)')
 
 
         # جدول التنبيهات
@@ -59,22 +106,63 @@ class DataLogger:
             )
         ''')
         
+        # أعمدة إزالة التكرار في التنبيهات (للقواعد القديمة عبر ALTER TABLE)
+        existing = {row[1] for row in cursor.execute('PRAGMA table_info(alerts)')}
+        for column, definition in (
+            ('count', 'INTEGER DEFAULT 1'),
+            ('first_seen', 'DATETIME'),
+            ('last_seen', 'DATETIME'),
+            ('cleared_at', 'DATETIME'),
+        ):
+            if column not in existing:
+                cursor.execute(f'ALTER TABLE alerts ADD COLUMN {column} {definition}')
+        
         conn.commit()
         conn.close()
         logger.info("✅ Database initialized successfully")
     
+    @staticmethod
+    def to_epoch(value):
+        """تحويل زمن (epoch أو ISO 8601؛ بدون منطقة = UTC) إلى ثواني epoch"""
+        if value is None or value == '':
+            return None
+        if isinstance(value, (int, float)):
+            return float(value)
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+    
+    @staticmethod
+    def to_db_time(value):
+        """تحويل زمن (epoch أو ISO 8601) إلى صيغة قاعدة البيانات"""
+        return DataLogger._db_time(DataLogger.to_epoch(value))
+    
+    @staticmethod
+    def _db_time(epoch):
+        """تحويل زمن epoch إلى صيغة CURRENT_TIMESTAMP (UTC)"""
+        if epoch is None:
+            return None
+        return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    
     def log_tank_data(self, tank_state):
         """تسجيل بيانات الخزان"""
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
+            now = time.time()
             cursor.execute('''
                 INSERT INTO tank_readings 
-                (water_level, water_volume, temperature, pressure, ph_level, turbidity, 
+                (timestamp, water_level, water_volume, temperature, pressure, ph_level, turbidity, 
                  is_filling, is_draining, leak_detected, flow_rate)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
+                self._db_time(now),
                 tank_state['water_level'],
                 tank_state['water_volume'],
                 tank_state['temperature'],
@@ -89,6 +177,7 @@ class DataLogger:
             
             conn.commit()
             conn.close()
+            self._notify('tank_readings', tank_state, now)
         except Exception as e:
             logger.error(f"Error logging tank data: {e}")
     
@@ -108,24 +197,51 @@ class DataLogger:
             
             conn.commit()
             conn.close()
+            self._notify('ai_logs', {'message': message, 'log_type': log_type}, time.time())
         except Exception as e:
             logger.error(f"Error logging AI message: {e}")
     
-    def log_alert(self, alert_type, severity, message):
-        """تسجيل تنبيه"""
+    def log_alert(self, alert_type, severity, message, count=1, first_seen=None, last_seen=None,
+                  timestamp=None):
+        """تسجيل تنبيه وإرجاع معرّفه"""
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
-                INSERT INTO alerts (alert_type, severity, message)
-                VALUES (?, ?, ?)
-            ''', (alert_type, severity, message))
+                INSERT INTO alerts (timestamp, alert_type, severity, message, count, first_seen, last_seen)
+                VALUES (COALESCE(?, CURRENT_TIMESTAMP), ?, ?, ?, ?,
+                        COALESCE(?, CURRENT_TIMESTAMP), COALESCE(?, CURRENT_TIMESTAMP))
+            ''', (self._db_time(timestamp), alert_type, severity, message, count,
+                  self._db_time(first_seen), self._db_time(last_seen)))
+            alert_id = cursor.lastrowid
             
             conn.commit()
             conn.close()
+            self.alerts_revision += 1
+            return alert_id
         except Exception as e:
             logger.error(f"Error logging alert: {e}")
+            return None
+    
+    def update_alert_occurrence(self, alert_id, count, last_seen, cleared_at=None):
+        """تحديث عدد التكرارات وآخر ظهور لتنبيه قائم (وزمن زواله عند الإلغاء)"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                UPDATE alerts SET count = ?, last_seen = ?, cleared_at = COALESCE(?, cleared_at)
+                WHERE id = ?
+            ''', (count, self._db_time(last_seen), self._db_time(cleared_at), alert_id))
+            
+            conn.commit()
+            conn.close()
+            self.alerts_revision += 1
+            return True
+        except Exception as e:
+            logger.error(f"Error updating alert {alert_id}: {e}")
+            return False
     
     def get_tank_data(self, limit=1000, start_time=None, end_time=None):
         """الحصول على بيانات الخزان التاريخية"""
@@ -226,7 +342,130 @@ class DataLogger:
             
             conn.commit()
             conn.close()
+            self.alerts_revision += 1
             return True
         except Exception as e:
             logger.error(f"Error resolving alert: {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    def resolve_alerts(self, alert_ids, batch_size=500):
+        """تعليم عدة تنبيهات كمحلولة بعبارة UPDATE واحدة لكل دفعة ضمن معاملة واحدة"""
+        alert_ids = list(alert_ids)
+        if not alert_ids:
+            return 0
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            updated = 0
+            for start in range(0, len(alert_ids), batch_size):
+                batch = alert_ids[start:start + batch_size]
+                cursor.execute(
+                    f"UPDATE alerts SET resolved = TRUE WHERE id IN ({','.join('?' * len(batch))})",
+                    batch
+                )
+                updated += cursor.rowcount
+            
+            conn.commit()
+            conn.close()
+            self.alerts_revision += 1
+            return updated
+        except Exception as e:
+            logger.error(f"Error resolving alerts: {e}")
+            return 0
+    
+    @staticmethod
+    def check_fields(fields):
+        """التحقق من أسماء الحقول المطلوبة (الافتراضي: جميع الحقول)"""
+        fields = list(fields) if fields else list(READING_FIELDS)
+        unknown = [name for name in fields if name not in READING_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return fields
+    
+    def query_readings(self, start=None, end=None, fields=None, limit=500, cursor=None):
+        """صفحة من القراءات بترقيم keyset وإرجاع (الصفوف، مؤشر الصفحة التالية)
+
+        نطاق الوقت يُحوّل مرة واحدة إلى نطاق معرّفات عبر فهرس الزمن (المعرّفات
+        تتبع ترتيب الإدراج الزمني)، ثم تُقرأ كل صفحة بمسح نطاق من المفتاح
+        الأساسي فتكون تكلفتها ثابتة مهما كان موقعها. المؤشر يحفظ النطاق
+        والحقول، فتبقى الصفحات متسقة حتى مع وصول قراءات جديدة.
+        """
+        if cursor:
+            state = decode_cursor(cursor)
+            after, until, fields = state['after'], state['until'], state['fields']
+        else:
+            after, until = None, None
+        fields = self.check_fields(fields)
+        
+        conn = sqlite3.connect(self.db_path)
+        db = conn.cursor()
+        try:
+            if not cursor:
+                after, until = self._id_range(db, self.to_db_time(start), self.to_db_time(end))
+            
+            db.execute(f'''
+                SELECT id, timestamp, {', '.join(fields)}
+                FROM tank_readings
+                WHERE id > ? AND id <= ?
+                ORDER BY id
+                LIMIT ?
+            ''', (after, until, limit + 1))
+            rows = db.fetchall()
+        finally:
+            conn.close()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor({'after': rows[-1][0], 'until': until, 'fields': fields})
+        
+        columns = ['timestamp'] + fields
+        return [dict(zip(columns, row[1:])) for row in rows], next_cursor
+    
+    @staticmethod
+    def _id_range(db, start, end):
+        """تحويل نطاق زمني إلى (آخر معرّف قبل البداية، آخر معرّف ضمن النهاية)"""
+        after = 0
+        if start:
+            db.execute('''
+                SELECT id FROM tank_readings WHERE timestamp >= ?
+                ORDER BY timestamp, id LIMIT 1
+            ''', (start,))
+            row = db.fetchone()
+            if row is None:
+                return 0, 0
+            after = row[0] - 1
+        if end:
+            db.execute('''
+                SELECT id FROM tank_readings WHERE timestamp <= ?
+                ORDER BY timestamp DESC, id DESC LIMIT 1
+            ''', (end,))
+        else:
+            db.execute('SELECT MAX(id) FROM tank_readings')
+        row = db.fetchone()
+        until = row[0] if row and row[0] is not None else 0
+        return after, until
+    
+    def read_columns(self, start=None, end=None, fields=None):
+        """القراءات الخام في نطاق زمني كأعمدة NumPy (الوقت 'timestamp' بثواني epoch)"""
+        fields = self.check_fields(fields)
+        conn = sqlite3.connect(self.db_path)
+        db = conn.cursor()
+        try:
+            after, until = self._id_range(db, self.to_db_time(start), self.to_db_time(end))
+            db.execute(f'''
+                SELECT CAST(strftime('%s', timestamp) AS INTEGER), {', '.join(fields)}
+                FROM tank_readings
+                WHERE id > ? AND id <= ?
+                ORDER BY id
+            ''', (after, until))
+            rows = db.fetchall()
+        finally:
+            conn.close()
+        
+        data = np.array(rows, dtype=float).reshape(-1, 1 + len(fields))
+        columns = {'timestamp': data[:, 0]}
+        for i, name in enumerate(fields):
+            columns[name] = data[:, 1 + i]
+        return columns
@@ -0,0 +1,65 @@
+"""
+ترميز دلتا لتدفق tank_update
+كل نبضة بث تنتج إطاراً واحداً مرقّماً يُشارك بين جميع عملاء وضع الدلتا:
+إطار مفتاحي (الحالة كاملة) كل N إطار، وبينها الحقول المتغيرة فقط.
+العميل يطبّق الإطار n على حالة الإطار n-1؛ أي فجوة في الترقيم تعني
+إطاراً مفقوداً فيطلب resync ويتلقى الإطار المفتاحي الحالي.
+"""
+
+from typing import Any, Dict, Optional
+
+
+class DeltaEncoder:
+    """مولّد إطارات دلتا/مفتاحية لحالة واحدة"""
+
+    def __init__(self, keyframe_interval: int = 30):
+        if keyframe_interval < 1:
+            raise ValueError("keyframe_interval must be positive")
+        self.keyframe_interval = keyframe_interval
+        self.sequence = 0
+        self.last_keyframe = 0
+        self.last: Optional[Dict[str, Any]] = None
+        self.stats = {'keyframes': 0, 'deltas': 0, 'fields_sent': 0, 'fields_total': 0}
+
+    def next(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """إطار النبضة التالية"""
+        self.sequence += 1
+        previous = self.last
+        self.last = dict(state)
+        self.stats['fields_total'] += len(state)
+
+        if previous is None or self.sequence - self.last_keyframe >= self.keyframe_interval:
+            self.last_keyframe = self.sequence
+            self.stats['keyframes'] += 1
+            self.stats['fields_sent'] += len(state)
+            return {'seq': self.sequence, 'key': True, 'data': dict(state)}
+
+        changed = {name: value for name, value in state.items()
+                   if name not in previous or previous[name] != value}
+        frame = {'seq': self.sequence, 'key': False, 'data': changed}
+        removed = [name for name in previous if name not in state]
+        if removed:
+            frame['removed'] = removed
+        self.stats['deltas'] += 1
+        self.stats['fields_sent'] += len(changed)
+        return frame
+
+    def keyframe(self, state: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """الإطار المفتاحي الحالي (للاشتراك الجديد و resync) دون تقديم التسلسل
+
+        الحالة المُرجعة هي حالة آخر إطار مرسل حتى تتسق مع رقم التسلسل؛
+        state تُستخدم فقط قبل أول إطار.
+        """
+        if self.last is None and state is not None:
+            self.last = dict(state)
+        return {'seq': self.sequence, 'key': True, 'data': dict(self.last or {})}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """إحصائيات نسبة الحقول المرسلة"""
+        total = self.stats['fields_total']
+        return dict(
+            self.stats,
+            sequence=self.sequence,
+            keyframe_interval=self.keyframe_interval,
+            sent_ratio=round(self.stats['fields_sent'] / total, 4) if total else 0.0
+        )
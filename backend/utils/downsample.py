@@ -0,0 +1,79 @@
+"""
+تقليل دقة السلاسل الزمنية للرسوم البيانية
+كل خوارزمية تُرجع فهارس النقاط المختارة (مرتبة)، فتُطبّق على جميع الأعمدة
+بفهرسة واحدة ويبقى شكل الصفوف كما هو
+"""
+
+from typing import Callable, Dict
+
+import numpy as np
+
+
+def lttb(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: يحافظ على الشكل البصري للمنحنى
+
+    النقطة الأولى والأخيرة ثابتتان، والباقي يُقسم إلى max_points - 2 دلواً؛
+    من كل دلو تُختار النقطة التي تصنع أكبر مثلث مع النقطة المختارة قبلها
+    ومتوسط الدلو التالي. المساحات محسوبة متجهياً داخل كل دلو.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if max_points >= n:
+        return np.arange(n)
+    if max_points < 3:
+        return np.linspace(0, n - 1, max_points).astype(np.intp)
+
+    # حدود الدلاء الداخلية (بدون النقطتين الطرفيتين)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.intp)
+    # متوسط كل دلو (والنقطة الأخيرة كدلو أخير) مسبقاً بمجاميع تراكمية
+    cx = np.concatenate(([0.0], np.cumsum(x)))
+    cy = np.concatenate(([0.0], np.cumsum(y)))
+    widths = np.diff(edges)
+    mean_x = np.append((cx[edges[1:]] - cx[edges[:-1]]) / widths, x[-1])
+    mean_y = np.append((cy[edges[1:]] - cy[edges[:-1]]) / widths, y[-1])
+
+    selected = np.empty(max_points, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(max_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        bx, by = x[lo:hi], y[lo:hi]
+        area = np.abs((x[a] - mean_x[i + 1]) * (by - y[a]) - (x[a] - bx) * (mean_y[i + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """أدنى وأعلى نقطة في كل دلو (يحافظ على القمم والقيعان)
+
+    النقاط تُرتب مرة واحدة حسب (الدلو، القيمة) بـ lexsort، فيكون أول وآخر
+    عنصر لكل دلو هما الأدنى والأعلى.
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if max_points >= n:
+        return np.arange(n)
+    buckets = max(max_points // 2, 1)
+    bucket = np.arange(n) * buckets // n
+    order = np.lexsort((y, bucket))
+    starts = np.searchsorted(bucket[order], np.arange(buckets))
+    ends = np.append(starts[1:], n)
+    return np.unique(np.concatenate((order[starts], order[ends - 1])))
+
+
+METHODS: Dict[str, Callable[[np.ndarray, np.ndarray, int], np.ndarray]] = {
+    'lttb': lttb,
+    'minmax': minmax,
+}
+
+
+def downsample(x: np.ndarray, y: np.ndarray, max_points: int, method: str = 'lttb') -> np.ndarray:
+    """فهارس النقاط المختارة بالطريقة المطلوبة"""
+    if method not in METHODS:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    if max_points < 1:
+        raise ValueError("max_points must be positive")
+    # القيم المفقودة لا تصلح للمقارنة، فتُعامل كأصفار في الاختيار فقط
+    return METHODS[method](x, np.nan_to_num(np.asarray(y, dtype=float)), max_points)
@@ -0,0 +1,264 @@
+"""
+ضبط تلقائي لمعاملات AIConfig بمحاكاة دفعية بدون واجهة
+يقيّم شبكة من نقاط المعاملات على سيناريوهات الطلب والتسرب بالتوازي عبر مجمع عمليات،
+ويخزن نتيجة كل نقطة مؤقتاً، ويُخرج مجموعة باريتو بين الاستقرار واهتراء الصمامات
+"""
+
+import hashlib
+import itertools
+import json
+import logging
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.replay_evaluator import ReplayTrace, ReplayEvaluator
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS_DIR = Path(__file__).parent.parent.parent / "simulation" / "scenarios"
+
+DEFAULT_GRID = {
+    'target_level': [70, 80],
+    'tolerance': [0.5, 1.0, 2.0, 3.0, 5.0],
+    'prediction_horizon': [5, 10, 20],
+    'leak_threshold': [0.01, 0.02, 0.06],  # %/ث: تسرب السيناريو ~0.017-0.025، وذروة الطلب ~0.05
+    'decision_mode': ['threshold', 'mpc'],
+}
+
+# المعاملات القابلة للضبط: (النوع، الحد الأدنى، الحد الأعلى) أو القيم المسموحة
+TUNABLE_PARAMETERS = {
+    'target_level': (float, 0.0, 100.0),
+    'tolerance': (float, 0.01, 50.0),
+    'leak_threshold': (float, 0.0, 10.0),
+    'prediction_horizon': (int, 1, 100),
+    'decision_interval': (float, 0.1, 3600.0),
+    'decision_mode': ('threshold', 'mpc'),
+}
+MAX_GRID_POINTS = 500
+MAX_WORKERS = os.cpu_count() or 1
+
+# مسارات المحاكاة لكل عملية عاملة (تُبنى مرة واحدة لكل عملية)
+_TRACES: Dict[Tuple[str, float], ReplayTrace] = {}
+
+
+def scenario_path(name: str) -> Path:
+    """مسار سيناريو مسجل؛ الأسماء مقيدة بملفات مجلد السيناريوهات"""
+    if not isinstance(name, str) or name not in {p.stem for p in SCENARIOS_DIR.glob("*.yaml")}:
+        raise ValueError(f"Unknown scenario: {name}")
+    return SCENARIOS_DIR / f"{name}.yaml"
+
+
+def check_parameter(name: str, value: Any) -> Any:
+    """التحقق من قيمة معامل قابل للضبط وإرجاعها بنوعها الصحيح"""
+    spec = TUNABLE_PARAMETERS.get(name)
+    if spec is None:
+        raise ValueError(f"Unknown tuning parameter: {name}")
+    if not isinstance(spec[0], type):
+        if value not in spec:
+            raise ValueError(f"{name} must be one of: {', '.join(spec)}")
+        return value
+    kind, low, high = spec
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) \
+            or (kind is int and value != int(value)):
+        raise ValueError(f"{name} must be a finite {kind.__name__}")
+    value = kind(value)
+    if not low <= value <= high:
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return value
+
+
+def check_grid(grid: Any) -> Dict[str, List[Any]]:
+    """التحقق من شبكة الضبط: معاملات معروفة، قيم صالحة، وعدد نقاط محدود"""
+    if not isinstance(grid, dict) or not grid:
+        raise ValueError("grid must be a non-empty object")
+    checked, points = {}, 1
+    for name, values in grid.items():
+        if not isinstance(values, list) or not values:
+            raise ValueError(f"grid.{name} must be a non-empty array")
+        checked[name] = [check_parameter(name, value) for value in values]
+        points *= len(values)
+    if points > MAX_GRID_POINTS:
+        raise ValueError(f"Grid has {points} points (max {MAX_GRID_POINTS})")
+    return checked
+
+
+def effective_point(point: Dict[str, Any]) -> Dict[str, Any]:
+    """إسقاط المعاملات التي لا تؤثر في المحاكاة حتى تتشارك النقاط المتكافئة نتيجة واحدة"""
+    # أفق التنبؤ لا يستخدمه إلا وضع MPC
+    ignored = set()
+    if point.get('decision_mode', 'threshold') != 'mpc':
+        ignored.add('prediction_horizon')
+    return {k: point[k] for k in sorted(point) if k not in ignored}
+
+
+def _evaluate_point(point: Dict[str, Any], scenario_paths: List[str],
+                    capacity: float) -> Dict[str, Any]:
+    """تقييم نقطة واحدة على جميع السيناريوهات (تعمل داخل عملية عاملة)"""
+    results = []
+    for path in scenario_paths:
+        key = (path, capacity)
+        if key not in _TRACES:
+            _TRACES[key] = ReplayTrace.from_scenario(path, capacity)
+        results.append(ReplayEvaluator(_TRACES[key]).evaluate_policy(point))
+
+    count = len(results)
+    return {
+        'mean_abs_error': round(sum(r['mean_abs_error'] for r in results) / count, 4),
+        'band_adherence': round(sum(r['band_adherence'] for r in results) / count, 4),
+        'switches_per_hour': round(sum(r['switches_per_hour'] for r in results) / count, 3),
+        'scenarios': {Path(p).stem: r for p, r in zip(scenario_paths, results)}
+    }
+
+
+def pareto_front(results: List[Dict[str, Any]], objectives=('mean_abs_error', 'switches_per_hour')) -> List[Dict[str, Any]]:
+    """النقاط غير المهيمَن عليها عند تصغير هدفين"""
+    first, second = objectives
+    ordered = sorted(results, key=lambda r: (r['metrics'][first], r['metrics'][second]))
+    front = []
+    best_second = float('inf')
+    for result in ordered:
+        if result['metrics'][second] < best_second:
+            front.append(result)
+            best_second = result['metrics'][second]
+    return front
+
+
+class PolicyTuner:
+    """مهمة ضبط شبكية لمعاملات AIConfig"""
+
+    def __init__(self, scenarios: Optional[List[str]] = None, capacity: float = 1000.0,
+                 workers: Optional[int] = None, cache_path: Optional[str] = "data/tuning_cache.json"):
+        names = scenarios or [p.stem for p in sorted(SCENARIOS_DIR.glob("*.yaml"))]
+        self.scenario_paths = [str(scenario_path(name)) for name in names]
+        self.capacity = capacity
+        if workers is None:
+            workers = MAX_WORKERS
+        if isinstance(workers, bool) or not isinstance(workers, int) or workers < 1:
+            raise ValueError("workers must be a positive integer")
+        self.workers = min(workers, MAX_WORKERS)
+        self.cache_path = cache_path
+        self.fingerprint = self._fingerprint()
+        self.cache: Dict[str, Dict[str, Any]] = self._load_cache()
+        self.stats = {'evaluated': 0, 'cache_hits': 0}
+
+    def _fingerprint(self) -> str:
+        """بصمة السيناريوهات والسعة: أي تعديل فيها يبطل النتائج المخزنة"""
+        digest = hashlib.sha1(str(self.capacity).encode())
+        for path in self.scenario_paths:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        return digest.hexdigest()[:16]
+
+    def _cache_key(self, point: Dict[str, Any]) -> str:
+        return self.fingerprint + ":" + json.dumps(effective_point(point), sort_keys=True)
+
+    def _load_cache(self) -> Dict[str, Dict[str, Any]]:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Ignoring unreadable tuning cache: {e}")
+            return {}
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.cache, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+
+    @staticmethod
+    def expand_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+        """حاصل الضرب الديكارتي لقيم الشبكة"""
+        keys = sorted(grid)
+        return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+    def run(self, grid: Optional[Dict[str, List[Any]]] = None) -> Dict[str, Any]:
+        """تقييم الشبكة كاملة وإرجاع النتائج ومجموعة باريتو"""
+        started = time.perf_counter()
+        points = self.expand_grid(check_grid(grid or DEFAULT_GRID))
+
+        # النقاط المتكافئة تُقيّم مرة واحدة، والمخزنة لا تُعاد
+        pending: Dict[str, Dict[str, Any]] = {}
+        for point in points:
+            key = self._cache_key(point)
+            if key in self.cache:
+                self.stats['cache_hits'] += 1
+            elif key not in pending:
+                pending[key] = effective_point(point)
+
+        # فشل نقطة واحدة لا يُسقط المهمة: تُسجل وتُستبعد من النتائج ولا تُخزن
+        failed: Dict[str, str] = {}
+        if pending:
+            keys = list(pending)
+            if self.workers > 1 and len(keys) > 1:
+                with ProcessPoolExecutor(max_workers=min(self.workers, len(keys))) as pool:
+                    futures = {
+                        k: pool.submit(_evaluate_point, pending[k], self.scenario_paths, self.capacity)
+                        for k in keys
+                    }
+                    for key, future in futures.items():
+                        try:
+                            self.cache[key] = future.result()
+                        except Exception as e:
+                            failed[key] = str(e)
+            else:
+                for key in keys:
+                    try:
+                        self.cache[key] = _evaluate_point(pending[key], self.scenario_paths, self.capacity)
+                    except Exception as e:
+                        failed[key] = str(e)
+
+            for key, error in failed.items():
+                logger.warning(f"⚠️ Tuning point {pending[key]} failed: {error}")
+            self.stats['evaluated'] += len(keys) - len(failed)
+            self._save_cache()
+
+        results = []
+        seen = set()
+        for point in points:
+            key = self._cache_key(point)
+            if key in seen or key in failed:
+                continue
+            seen.add(key)
+            metrics = self.cache[key]
+            results.append({
+                'config': effective_point(point),
+                'metrics': {k: v for k, v in metrics.items() if k != 'scenarios'}
+            })
+
+        front = pareto_front(results)
+        return {
+            'points': len(points),
+            'unique_points': len(results),
+            'evaluated': len(pending) - len(failed),
+            'failed': [{'config': pending[key], 'error': error} for key, error in failed.items()],
+            'scenarios': [Path(p).stem for p in self.scenario_paths],
+            'pareto': front,
+            'recommended': self.knee(front),
+            'results': results,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+        }
+
+    @staticmethod
+    def knee(front: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """النقطة الأقرب للمثالي بعد تطبيع الهدفين على مجموعة باريتو"""
+        if not front:
+            return None
+        errors = [r['metrics']['mean_abs_error'] for r in front]
+        wear = [r['metrics']['switches_per_hour'] for r in front]
+
+        def scale(value, values):
+            span = max(values) - min(values)
+            return (value - min(values)) / span if span > 0 else 0.0
+
+        return min(front, key=lambda r: scale(r['metrics']['mean_abs_error'], errors) ** 2
+                   + scale(r['metrics']['switches_per_hour'], wear) ** 2)
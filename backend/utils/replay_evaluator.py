@@ -0,0 +1,351 @@
+"""
+مقيّم إعادة تشغيل سريع لسياسات الذكاء الاصطناعي على البيانات التاريخية
+يمرر القراءات (أو سيناريو مسجل) عبر AIDecisionMaker بوضع مضاد للواقع
+مع محاكاة استجابة الخزان، ويقارن السياسات بعدد التبديلات والالتزام بنطاق الهدف وزمن الاستجابة.
+صانع القرار لا يرى علم التسرب المسجل: يكتشف التسرب من اتجاه الانخفاض غير المفسر
+بالصمامات مقارنة بـ leak_threshold، والعلم المسجل يُستخدم للمقاييس فقط
+"""
+
+import logging
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+import numpy as np
+import yaml
+
+from models.ai_decision import AIDecisionMaker, AIConfig, ACTION_CODES, AIAction
+from utils.data_logger import DataLogger
+
+logger = logging.getLogger(__name__)
+
+FILL = ACTION_CODES[AIAction.FILL]
+DRAIN = ACTION_CODES[AIAction.DRAIN]
+STOP = ACTION_CODES[AIAction.STOP]
+
+
+@dataclass
+class ReplayTrace:
+    """مسار قابل لإعادة التشغيل: خطوات زمنية وطلب خارجي لا تفسره الصمامات"""
+    dt: np.ndarray  # مدة كل خطوة (ث)
+    demand: np.ndarray  # تغير المستوى في كل خطوة غير الناتج عن الصمامات (%)
+    flow_rate: np.ndarray  # معدل تدفق الصمام في كل خطوة (لتر/دقيقة)
+    leak: np.ndarray  # علم التسرب الفعلي بعد كل خطوة (للمقاييس)
+    initial_level: float
+    capacity: float = 1000.0
+
+    def __len__(self) -> int:
+        return len(self.dt)
+
+    @classmethod
+    def from_database(cls, db_path="data/historical_data.db", start_time=None, end_time=None,
+                      capacity: float = 1000.0, max_gap: float = 60.0,
+                      chunk_size: int = 50000) -> "ReplayTrace":
+        """بناء المسار من جدول tank_readings على دفعات بترتيب المعرّف
+
+        الحدود تقبل epoch أو ISO 8601 وتُحوّل إلى صيغة قاعدة البيانات قبل المقارنة.
+        """
+        start_time, end_time = DataLogger.to_db_time(start_time), DataLogger.to_db_time(end_time)
+        conditions, params = [], []
+        if start_time:
+            conditions.append("timestamp >= ?")
+            params.append(start_time)
+        if end_time:
+            conditions.append("timestamp <= ?")
+            params.append(end_time)
+        where = (" AND " + " AND ".join(conditions)) if conditions else ""
+
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        chunks = []
+        last_id = 0
+        while True:
+            cursor.execute(f'''
+                SELECT id, (julianday(timestamp) - 2440587.5) * 86400.0,
+                       water_level, is_filling, is_draining, leak_detected, flow_rate
+                FROM tank_readings
+                WHERE id > ?{where}
+                ORDER BY id
+                LIMIT ?
+            ''', [last_id] + params + [chunk_size])
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=float))
+            last_id = int(rows[-1][0])
+        conn.close()
+
+        if not chunks:
+            raise ValueError("No readings in the requested range")
+        data = np.concatenate(chunks)
+        if len(data) < 2:
+            raise ValueError("At least two readings are required for replay")
+
+        t, level = data[:, 1], data[:, 2]
+        filling, draining, leak, flow = data[:, 3] > 0, data[:, 4] > 0, data[:, 5] > 0, data[:, 6]
+        dt = np.diff(t)
+
+        # الطلب = التغير الملاحظ ناقص مساهمة الصمامات التاريخية
+        valve = np.where(filling[:-1], 1.0, np.where(draining[:-1], -1.0, 0.0))
+        demand = np.diff(level) - valve * flow[:-1] / 60 / capacity * 100 * dt
+
+        # الفجوات (توقف التوأم) تصبح خطوات فارغة؛ الطوابع بدقة الثانية
+        # فالخطوات الصفرية تحتفظ بتغير المستوى وتعوضها الخطوة التالية
+        gap = (dt < 0) | (dt > max_gap)
+        dt = np.where(gap, 0.0, dt)
+        demand = np.where(gap, 0.0, demand)
+
+        return cls(dt, demand, flow[:-1], leak[1:], float(level[0]), capacity)
+
+    @classmethod
+    def from_scenario(cls, path, capacity: float = 1000.0, dt: float = 1.0,
+                      base_demand: float = 5.0) -> "ReplayTrace":
+        """بناء المسار من ملف سيناريو YAML (الطلب بوحدة لتر/دقيقة)"""
+        with open(path, 'r', encoding='utf-8') as f:
+            scenario = yaml.safe_load(f)
+
+        params = scenario.get('parameters', {})
+        steps = int(scenario.get('duration', 300) / dt)
+        demand_lpm = np.full(steps, float(params.get('base_demand', base_demand)))
+        leak_lpm = np.zeros(steps)
+
+        leak_rate = float(params.get('leak_rate', 5))
+        for event in sorted(scenario.get('events', []), key=lambda e: e.get('time', 0)):
+            k = min(steps, int(event.get('time', 0) / dt))
+            action = event.get('action')
+            if action in ('increase_demand', 'decrease_demand'):
+                demand_lpm[k:] = float(event.get('value', demand_lpm[k - 1] if k else base_demand))
+            elif action == 'activate_leak':
+                leak_lpm[k:] = leak_rate
+            elif action == 'increase_leak':
+                leak_lpm[k:] = leak_lpm[k - 1] * 2 if k else leak_rate
+            elif action == 'emergency_shutdown':
+                leak_lpm[k:] = 0.0
+
+        demand = -(demand_lpm + leak_lpm) / 60 / capacity * 100 * dt
+        return cls(
+            np.full(steps, dt),
+            demand,
+            np.full(steps, float(params.get('flow_rate', 20))),
+            leak_lpm > 0,
+            float(params.get('initial_level', 60)),
+            capacity
+        )
+
+
+class ReplayEvaluator:
+    """تقييم سياسات AIConfig على مسار مسجل"""
+
+    LEAK_WINDOW = 10.0  # ثوانٍ يُحسب عليها متوسط الانخفاض لكشف التسرب
+
+    def __init__(self, trace: ReplayTrace):
+        self.trace = trace
+        self.elapsed = np.concatenate([[0.0], np.cumsum(trace.dt)])
+        self.valve_step = trace.flow_rate / 60 / trace.capacity * 100 * trace.dt
+        positive = trace.dt[trace.dt > 0]
+        self.median_dt = float(np.median(positive)) if positive.size else 1.0
+
+        # معدل الانخفاض غير المفسر بالصمامات (%/ث) على نافذة متحركة؛ لا يعتمد على السياسة
+        window = max(1, int(round(self.LEAK_WINDOW / self.median_dt)))
+        drop = np.concatenate([[0.0], np.cumsum(-trace.demand)])
+        lo = np.maximum(np.arange(1, len(trace) + 1) - window, 0)
+        span = self.elapsed[1:] - self.elapsed[lo]
+        self.drop_rate = np.divide(drop[1:] - drop[lo], span, out=np.zeros(len(trace)), where=span > 0)
+
+    def detected_leaks(self, leak_threshold: float) -> np.ndarray:
+        """التسرب كما يكتشفه صانع القرار بعد كل خطوة"""
+        return self.drop_rate > leak_threshold
+
+    def evaluate(self, policies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """تقييم عدة سياسات (كل منها تعديلات على AIConfig)"""
+        return [self.evaluate_policy(policy) for policy in policies]
+
+    def evaluate_policy(self, overrides: Dict[str, Any]) -> Dict[str, Any]:
+        """تقييم سياسة واحدة"""
+        fields = AIConfig.__dataclass_fields__
+        config = AIConfig(**{k: v for k, v in overrides.items() if k in fields})
+        ai = AIDecisionMaker(config)
+        stride = max(1, int(round(config.decision_interval / self.median_dt)))
+
+        started = time.perf_counter()
+        leaks = self.detected_leaks(config.leak_threshold)
+        if config.decision_mode == "threshold":
+            result = self._replay_vectorized(ai, stride, leaks)
+        else:
+            result = self._replay_stepwise(ai, stride, leaks)
+        elapsed = time.perf_counter() - started
+
+        steps = len(self.trace)
+        total_time = float(self.elapsed[-1]) or 1.0
+        reactions = result.pop('reactions')
+        dt, actual = self.trace.dt, self.trace.leak
+        leak_time, dry_time = float(dt[actual].sum()), float(dt[~actual].sum())
+        return {
+            'config': {k: v for k, v in overrides.items() if k in fields},
+            'engine': result.pop('engine'),
+            'steps': steps,
+            'switches': result['switches'],
+            'switches_per_hour': round(float(result['switches'] / total_time * 3600), 3),
+            'band_adherence': round(float(result['in_band_time'] / total_time), 4),
+            'mean_abs_error': round(float(result['abs_error_time'] / total_time), 4),
+            'fill_time_fraction': round(float(result['fill_time'] / total_time), 4),
+            'drain_time_fraction': round(float(result['drain_time'] / total_time), 4),
+            'reaction_time': {
+                'count': len(reactions),
+                'mean': round(float(np.mean(reactions)), 2) if reactions else None,
+                'max': round(float(np.max(reactions)), 2) if reactions else None
+            },
+            'leak_detection': {
+                'missed': round(float(dt[actual & ~leaks].sum() / leak_time), 4) if leak_time else None,
+                'false_alarm': round(float(dt[~actual & leaks].sum() / dry_time), 4) if dry_time else None
+            },
+            'final_level': round(float(result['final_level']), 3),
+            'steps_per_second': round(steps / elapsed) if elapsed > 0 else None
+        }
+
+    def _segment_metrics(self, acc: Dict[str, Any], path: np.ndarray, start: int,
+                         action: int, target: float, tolerance: float):
+        """تجميع المقاييس لمقطع بإجراء ثابت"""
+        dt = self.trace.dt[start:start + len(path)]
+        error = np.abs(path - target)
+        acc['in_band_time'] += float(np.dot(error <= tolerance, dt))
+        acc['abs_error_time'] += float(np.dot(error, dt))
+        if action == FILL:
+            acc['fill_time'] += float(dt.sum())
+        elif action == DRAIN:
+            acc['drain_time'] += float(dt.sum())
+
+        # بداية انحراف عن النطاق لا يعالجه الإجراء الحالي
+        if acc['pending'] is None:
+            below = (path < target - tolerance) & (action != FILL)
+            above = (path > target + tolerance) & (action != DRAIN)
+            unattended = np.flatnonzero((below | above) & ~self.trace.leak[start:start + len(path)])
+            if unattended.size:
+                acc['pending'] = self.elapsed[start + unattended[0] + 1]
+
+    def _replay_vectorized(self, ai: AIDecisionMaker, stride: int, leaks: np.ndarray) -> Dict[str, Any]:
+        """إعادة تشغيل وضع العتبات بحلقة عددية على نقاط القرار فقط
+
+        زيادة المستوى لكل فترة قرار ولكل إجراء تُحسب مسبقاً من cumsum، فتكلف
+        الفترة عملية جمع ومقارنة واحدة مهما قصرت المقاطع بين التبديلات. الفترات
+        التي قد تبلغ الفراغ أو الامتلاء تُمرر خطوة بخطوة، ثم يُبنى المسار الكامل
+        وتُحسب المقاييس متجهياً مرة واحدة.
+        """
+        trace = self.trace
+        target, tolerance = ai.config.target_level, ai.config.tolerance
+        n = len(trace)
+
+        # تغير المستوى لكل خطوة تحت كل إجراء؛ الصف = رمز الإجراء
+        signs = np.zeros(len(ACTION_CODES))
+        signs[FILL], signs[DRAIN] = 1.0, -1.0
+        steps = trace.demand + signs[:, None] * self.valve_step
+        cumulative = np.concatenate((np.zeros((len(signs), 1)), np.cumsum(steps, axis=1)), axis=1)
+
+        # فترات القرار: القرار بعد آخر خطوة في كل فترة كاملة
+        starts = np.arange(0, n, stride)
+        ends = np.append(starts[1:], n)
+        offsets = cumulative[:, starts]
+        increments = (cumulative[:, ends] - offsets).tolist()
+        highs = (np.maximum.reduceat(cumulative[:, 1:], starts, axis=1) - offsets).tolist()
+        lows = (np.minimum.reduceat(cumulative[:, 1:], starts, axis=1) - offsets).tolist()
+        leak_at = leaks[ends - 1].tolist()
+        decisions = n // stride
+
+        level, action = float(trace.initial_level), STOP
+        start_levels, actions, switch_steps, clipped = [], [], [], {}
+        for j in range(len(starts)):
+            start_levels.append(level)
+            actions.append(action)
+            if level + lows[action][j] < 0 or level + highs[action][j] > 100:
+                path = []
+                for change in steps[action, starts[j]:ends[j]].tolist():
+                    level = min(100.0, max(0.0, level + change))
+                    path.append(level)
+                clipped[j] = path
+            else:
+                level += increments[action][j]
+
+            if j < decisions:
+                # نفس قاعدة decide_batch: تسرب أو ضمن التسامح -> توقف، أقل -> ملء، أعلى -> تفريغ
+                diff = level - target
+                code = STOP if leak_at[j] or abs(diff) <= tolerance else FILL if diff < 0 else DRAIN
+                if code != action:
+                    switch_steps.append(int(ends[j]))
+                    action = code
+
+        # المسار الكامل: مستوى بداية كل فترة + التغير التراكمي داخلها
+        lengths = ends - starts
+        actions = np.asarray(actions, dtype=np.intp)
+        step_actions = np.repeat(actions, lengths)
+        base = np.asarray(start_levels) - cumulative[actions, starts]
+        path = np.repeat(base, lengths) + cumulative[step_actions, np.arange(1, n + 1)]
+        for j, values in clipped.items():
+            path[starts[j]:ends[j]] = values
+
+        dt = trace.dt
+        error = np.abs(path - target)
+        acc = {
+            'switches': len(switch_steps),
+            'in_band_time': float(np.dot(error <= tolerance, dt)),
+            'abs_error_time': float(np.dot(error, dt)),
+            'fill_time': float(dt[step_actions == FILL].sum()),
+            'drain_time': float(dt[step_actions == DRAIN].sum()),
+        }
+
+        # زمن الاستجابة: أول انحراف غير معالج بين كل تبديلين حتى التبديل التالي
+        below = (path < target - tolerance) & (step_actions != FILL)
+        above = (path > target + tolerance) & (step_actions != DRAIN)
+        unattended = np.flatnonzero((below | above) & ~trace.leak)
+        switches = np.asarray(switch_steps, dtype=np.intp)
+        previous = np.concatenate(([0], switches[:-1])) if switches.size else switches
+        first = np.searchsorted(unattended, previous)
+        valid = first < len(unattended)
+        valid[valid] = unattended[first[valid]] < switches[valid]
+        reactions = self.elapsed[switches[valid]] - self.elapsed[unattended[first[valid]] + 1]
+
+        acc['reactions'] = reactions.tolist()
+        acc['final_level'] = float(path[-1])
+        acc['engine'] = 'vectorized'
+        return acc
+
+    def _replay_stepwise(self, ai: AIDecisionMaker, stride: int, leaks: np.ndarray) -> Dict[str, Any]:
+        """إعادة تشغيل خطوة بخطوة عبر analyze (للأوضاع غير القابلة للتجهيز مثل MPC)"""
+        trace = self.trace
+        target, tolerance = ai.config.target_level, ai.config.tolerance
+        acc = {'switches': 0, 'in_band_time': 0.0, 'abs_error_time': 0.0,
+               'fill_time': 0.0, 'drain_time': 0.0, 'pending': None, 'reactions': []}
+        level, action, flow_override = trace.initial_level, STOP, None
+
+        for k in range(len(trace)):
+            flow = flow_override or trace.flow_rate[k]
+            sign = 1.0 if action == FILL else -1.0 if action == DRAIN else 0.0
+            level += trace.demand[k] + sign * flow / 60 / trace.capacity * 100 * trace.dt[k]
+            level = min(100.0, max(0.0, level))
+            self._segment_metrics(acc, np.array([level]), k, action, target, tolerance)
+
+            if (k + 1) % stride:
+                continue
+            state = {
+                'water_level': level,
+                'is_filling': action == FILL,
+                'is_draining': action == DRAIN,
+                'leak_detected': bool(leaks[k]),
+                'flow_rate': float(flow),
+                'capacity': trace.capacity
+            }
+            decided, _, details = ai.analyze(state, [])
+            code = ACTION_CODES.get(decided, STOP)
+            if details.get('mode') == 'mpc' and code != STOP:
+                flow_override = details['flow_rate']
+            if code != action:
+                acc['switches'] += 1
+                if acc['pending'] is not None:
+                    acc['reactions'].append(float(self.elapsed[k + 1] - acc['pending']))
+                    acc['pending'] = None
+                action = code
+
+        acc['final_level'] = level
+        acc['engine'] = 'stepwise'
+        acc.pop('pending')
+        return acc
@@ -0,0 +1,90 @@
+"""
+ذاكرة استجابات JSON مُرقّمة بالنسخ مع دعم الطلبات الشرطية (ETag / Last-Modified)
+الطلب الذي يحمل If-None-Match مطابقاً للنسخة الحالية يُجاب بـ 304 دون بناء الاستجابة،
+وجسم كل نسخة يُسلسل مرة واحدة ويُشارك بين جميع المستطلعين
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from flask import current_app, json, request
+
+
+@dataclass
+class CacheEntry:
+    etag: str
+    body: bytes
+    mimetype: str
+    modified: float
+
+
+class ResponseCache:
+    """آخر استجابة لكل مفتاح (المسار + المعاملات) مع وسم نسختها"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'not_modified': 0}
+        # معرّف تشغيل العملية: أرقام النسخ قد تتكرر بعد إعادة التشغيل فلا تصح الوسوم القديمة
+        self.boot = time.time_ns()
+
+    def make_etag(self, key: str, version: Any) -> str:
+        return hashlib.sha1(f"{self.boot}|{key}|{version}".encode()).hexdigest()[:20]
+
+    def respond(self, version: Any, build: Callable[[], Any], key: Optional[str] = None,
+                mimetype: str = 'application/json'):
+        """استجابة شرطية: build() تُستدعى فقط عند تغير النسخة ولأول طالب"""
+        key = key or request.full_path
+        etag = self.make_etag(key, version)
+
+        # 304 مبكر: لا نلمس النموذج أو قاعدة البيانات
+        if request.if_none_match and request.if_none_match.contains(etag):
+            self.stats['not_modified'] += 1
+            return self._not_modified(etag, self.entries.get(key))
+
+        entry = self.entries.get(key)
+        if entry is None or entry.etag != etag:
+            self.stats['misses'] += 1
+            payload = build()
+            body = payload if isinstance(payload, (bytes, str)) else json.dumps(payload)
+            entry = CacheEntry(
+                etag,
+                body.encode('utf-8') if isinstance(body, str) else body,
+                mimetype,
+                time.time()
+            )
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        else:
+            self.stats['hits'] += 1
+
+        # RFC 9110 §13.1.3: غير معدل إذا لم تكن النسخة أحدث من If-Modified-Since
+        # (الثانية نفسها تطابق لأن Last-Modified لا يُرسل قبل انتهاء ثانيته؛ انظر _set_validators)
+        if not request.if_none_match and request.if_modified_since \
+                and int(entry.modified) <= request.if_modified_since.timestamp():
+            self.stats['not_modified'] += 1
+            return self._not_modified(etag, entry)
+
+        response = current_app.response_class(entry.body, mimetype=entry.mimetype)
+        self._set_validators(response, etag, entry)
+        return response
+
+    def _not_modified(self, etag: str, entry: Optional[CacheEntry]):
+        response = current_app.response_class(status=304)
+        self._set_validators(response, etag, entry)
+        return response
+
+    @staticmethod
+    def _set_validators(response, etag: str, entry: Optional[CacheEntry]):
+        response.set_etag(etag)
+        # Last-Modified بدقة الثانية: لا يُرسل ما دامت ثانية التعديل جارية، لأن نسخة
+        # أحدث في الثانية نفسها ستحمل القيمة ذاتها؛ العميل يحصل عليه في طلب لاحق
+        if entry is not None and int(time.time()) > int(entry.modified):
+            response.last_modified = entry.modified
+        # يجب على العميل إعادة التحقق في كل طلب
+        response.cache_control.no_cache = True
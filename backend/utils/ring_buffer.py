@@ -0,0 +1,78 @@
+"""
+مخزن حلقي ثابت السعة مبني على مصفوفة NumPy مهيكلة
+الإضافة O(1) ونوافذ القراءة عروض (views) بدون نسخ
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List
+
+import numpy as np
+
+
+class RingBuffer:
+    """مخزن حلقي بمصفوفة مهيكلة مسبقة التخصيص
+
+    كل سجل يُكتب مرتين (في الموضع i و i + capacity)، لذلك آخر n سجل
+    تقع دائماً في شريحة متصلة ويمكن إرجاعها كعرض بدون نسخ.
+    """
+
+    def __init__(self, dtype, capacity: int = 1000):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        self._data = np.zeros(2 * capacity, dtype=self.dtype)
+        self._head = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __bool__(self) -> bool:
+        return self._count > 0
+
+    def append(self, record: tuple):
+        """إضافة سجل (بترتيب حقول النوع)"""
+        head = self._head
+        self._data[head] = record
+        self._data[head + self.capacity] = record
+        self._head = (head + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+
+    def extend(self, records: np.ndarray):
+        """إضافة مجموعة سجلات دفعة واحدة"""
+        records = np.asarray(records, dtype=self.dtype)[-self.capacity:]
+        for record in records:
+            self.append(record)
+
+    def window(self, limit: int = None) -> np.ndarray:
+        """آخر limit سجل بالترتيب الزمني (عرض للقراءة فقط)"""
+        n = self._count if limit is None else max(0, min(limit, self._count))
+        end = self._head + self.capacity
+        view = self._data[end - n:end]
+        view.flags.writeable = False
+        return view
+
+    def latest(self):
+        """آخر سجل أو None"""
+        if not self._count:
+            return None
+        return self._data[self._head + self.capacity - 1]
+
+    def clear(self):
+        """تفريغ المخزن"""
+        self._head = 0
+        self._count = 0
+
+
+def to_dicts(window: np.ndarray, time_field: str = 'timestamp') -> List[Dict[str, Any]]:
+    """تحويل نافذة إلى قائمة قواميس (عند حدود JSON فقط)"""
+    names = window.dtype.names
+    rows = []
+    for values in window.tolist():
+        row = dict(zip(names, values))
+        if time_field in row:
+            row[time_field] = datetime.fromtimestamp(row[time_field]).isoformat()
+        rows.append(row)
+    return rows
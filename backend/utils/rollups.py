@@ -0,0 +1,239 @@
+"""
+ملخصات دقيقة لجدول القراءات (tank_readings_1m)
+كل صف يحمل العدد والمجموع والأدنى والأعلى لكل حقل في دقيقة واحدة، فتُقرأ
+الرسوم والتجميعات الطويلة من 1/60 من الصفوف. الدقيقة الجارية تُجمّع في
+الذاكرة وتُكتب عند انتهائها بـ UPSERT تجميعي، وتُدمج عند القراءة.
+"""
+
+import logging
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from utils.data_logger import READING_FIELDS, DataLogger
+from utils.downsample import downsample
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_SECONDS = 60
+ROLLUP_TABLE = 'tank_readings_1m'
+ROLLUP_STATS = ('sum', 'min', 'max')
+
+
+class MinuteRollups:
+    """ملخصات الدقيقة مع مستمع DataLogger لتحديثها"""
+
+    def __init__(self, data_logger: DataLogger):
+        self.data_logger = data_logger
+        self.columns = [f"{field}_{stat}" for field in READING_FIELDS for stat in ROLLUP_STATS]
+        self.open_bucket: Optional[int] = None
+        self.open_row: Dict[str, float] = {}
+
+        self.init_table()
+        self.backfill()
+        data_logger.add_listener(self.on_write)
+
+    def init_table(self):
+        """إنشاء جدول الملخصات"""
+        conn = sqlite3.connect(self.data_logger.db_path)
+        columns = ', '.join(f"{name} REAL" for name in self.columns)
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+                bucket INTEGER PRIMARY KEY,
+                count INTEGER,
+                {columns}
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def backfill(self):
+        """بناء الملخصات الناقصة من القراءات الخام (آخر دقيقة محفوظة تُعاد دائماً)"""
+        started = time.perf_counter()
+        conn = sqlite3.connect(self.data_logger.db_path)
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT MAX(bucket) FROM {ROLLUP_TABLE}')
+        last = cursor.fetchone()[0]
+        since = DataLogger._db_time(last) if last is not None else None
+
+        bucket = f"CAST(strftime('%s', timestamp) AS INTEGER) / {ROLLUP_SECONDS} * {ROLLUP_SECONDS}"
+        aggregates = ', '.join(
+            f"{stat.upper()}({field})" for field in READING_FIELDS for stat in ROLLUP_STATS
+        )
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO {ROLLUP_TABLE} (bucket, count, {', '.join(self.columns)})
+            SELECT {bucket} AS b, COUNT(*), {aggregates}
+            FROM tank_readings
+            WHERE timestamp IS NOT NULL {'AND timestamp >= ?' if since else ''}
+            GROUP BY b
+        ''', (since,) if since else ())
+        rows = cursor.rowcount
+        conn.commit()
+        conn.close()
+        logger.info(f"📈 Rollups backfilled in {(time.perf_counter() - started) * 1000:.1f} ms "
+                    f"({max(rows, 0)} minutes)")
+
+    def on_write(self, table: str, row: Dict[str, Any], timestamp: float):
+        """مستمع DataLogger: تجميع القراءة في دقيقتها"""
+        if table != 'tank_readings':
+            return
+        bucket = int(timestamp // ROLLUP_SECONDS) * ROLLUP_SECONDS
+        if self.open_bucket is not None and bucket != self.open_bucket:
+            self.flush()
+        if self.open_bucket is None:
+            self.open_bucket = bucket
+            self.open_row = {'count': 0}
+            for field in READING_FIELDS:
+                self.open_row.update({f"{field}_sum": 0.0, f"{field}_min": np.inf, f"{field}_max": -np.inf})
+
+        open_row = self.open_row
+        open_row['count'] += 1
+        for field in READING_FIELDS:
+            value = float(row[field])
+            open_row[f"{field}_sum"] += value
+            open_row[f"{field}_min"] = min(open_row[f"{field}_min"], value)
+            open_row[f"{field}_max"] = max(open_row[f"{field}_max"], value)
+
+    def flush(self):
+        """كتابة الدقيقة المفتوحة (تُدمج مع أي ملخص موجود لنفس الدقيقة)"""
+        if self.open_bucket is None:
+            return
+        updates = ['count = count + excluded.count']
+        for field in READING_FIELDS:
+            updates += [
+                f"{field}_sum = {field}_sum + excluded.{field}_sum",
+                f"{field}_min = MIN({field}_min, excluded.{field}_min)",
+                f"{field}_max = MAX({field}_max, excluded.{field}_max)",
+            ]
+        names = ['bucket', 'count'] + self.columns
+        values = [self.open_bucket, self.open_row['count']] + [self.open_row[name] for name in self.columns]
+        try:
+            conn = sqlite3.connect(self.data_logger.db_path)
+            conn.execute(f'''
+                INSERT INTO {ROLLUP_TABLE} ({', '.join(names)})
+                VALUES ({', '.join('?' * len(names))})
+                ON CONFLICT(bucket) DO UPDATE SET {', '.join(updates)}
+            ''', values)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Error flushing rollup: {e}")
+            return
+        self.open_bucket = None
+        self.open_row = {}
+
+    def read(self, start: Optional[float], end: Optional[float],
+             fields: List[str]) -> Dict[str, np.ndarray]:
+        """ملخصات الدقائق في نطاق (epoch) كأعمدة: bucket، count، و{field}_{sum,min,max}
+
+        الدقائق الواقعة بالكامل داخل [start, end] تُقرأ من الملخصات، والدقيقتان
+        الطرفيتان الجزئيتان تُجمّعان من القراءات الخام بنفس حدود الاستعلام الخام
+        (بدقة الثانية)، فلا تدخل قراءات من خارج النطاق.
+        """
+        names = [f"{field}_{stat}" for field in fields for stat in ROLLUP_STATS]
+        first = last = None  # أول وآخر دقيقة كاملة داخل النطاق
+        edges = []  # نطاقات خام جزئية (ثوانٍ شاملة)
+        if start is not None:
+            start = int(start // 1)
+            first = -(-start // ROLLUP_SECONDS) * ROLLUP_SECONDS
+            if first > start:
+                edges.append((start, first - 1))
+        if end is not None:
+            end = int(end // 1)
+            last = (end + 1) // ROLLUP_SECONDS * ROLLUP_SECONDS - ROLLUP_SECONDS
+            if last + ROLLUP_SECONDS - 1 < end:
+                edges.append((last + ROLLUP_SECONDS, end))
+        if first is not None and last is not None and first > last:
+            # النطاق أقصر من دقيقة كاملة: كله من القراءات الخام
+            edges = [(start, end)] if start <= end else []
+
+        conn = sqlite3.connect(self.data_logger.db_path)
+        cursor = conn.cursor()
+        rows = []
+        if first is None or last is None or first <= last:
+            conditions, params = [], []
+            if first is not None:
+                conditions.append('bucket >= ?')
+                params.append(first)
+            if last is not None:
+                conditions.append('bucket <= ?')
+                params.append(last)
+            cursor.execute(f'''
+                SELECT bucket, count, {', '.join(names)}
+                FROM {ROLLUP_TABLE}
+                {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+                ORDER BY bucket
+            ''', params)
+            rows = [list(row) for row in cursor.fetchall()]
+
+            # دمج الدقيقة المفتوحة (غير المكتوبة بعد) إن كانت كاملة داخل النطاق
+            bucket = self.open_bucket
+            if bucket is not None and (first is None or bucket >= first) \
+                    and (last is None or bucket <= last):
+                row = self.open_row
+                if rows and rows[-1][0] == bucket:
+                    merged = rows[-1]
+                    merged[1] += row['count']
+                    for i, field in enumerate(fields):
+                        base = 2 + i * len(ROLLUP_STATS)
+                        merged[base] += row[f"{field}_sum"]
+                        merged[base + 1] = min(merged[base + 1], row[f"{field}_min"])
+                        merged[base + 2] = max(merged[base + 2], row[f"{field}_max"])
+                else:
+                    rows.append([bucket, row['count']] + [row[name] for name in names])
+
+        bucket_expr = f"CAST(strftime('%s', timestamp) AS INTEGER) / {ROLLUP_SECONDS} * {ROLLUP_SECONDS}"
+        aggregates = ', '.join(f"{stat.upper()}({field})" for field in fields for stat in ROLLUP_STATS)
+        for lo, hi in edges:
+            cursor.execute(f'''
+                SELECT {bucket_expr} AS b, COUNT(*), {aggregates}
+                FROM tank_readings
+                WHERE timestamp >= ? AND timestamp <= ?
+                GROUP BY b
+            ''', (DataLogger._db_time(lo), DataLogger._db_time(hi)))
+            rows += [list(row) for row in cursor.fetchall()]
+        conn.close()
+
+        rows.sort(key=lambda row: row[0])
+        data = np.array(rows, dtype=float).reshape(-1, 2 + len(names))
+        columns = {'bucket': data[:, 0], 'count': data[:, 1]}
+        for i, name in enumerate(names):
+            columns[name] = data[:, 2 + i]
+        return columns
+
+
+def downsampled_readings(data_logger: DataLogger, rollups: Optional[MinuteRollups], start=None, end=None,
+                         fields: Optional[List[str]] = None, max_points: int = 1000,
+                         method: str = 'lttb') -> Dict[str, Any]:
+    """قراءات نطاق زمني مقللة إلى max_points نقطة على الأكثر
+
+    إذا غطّت كل نقطة ناتجة دقيقة أو أكثر تُقرأ ملخصات الدقائق (متوسطاتها)
+    بدلاً من القراءات الخام. اختيار النقاط يعتمد على الحقل الأول.
+    """
+    fields = DataLogger.check_fields(fields)
+    start, end = DataLogger.to_epoch(start), DataLogger.to_epoch(end)
+
+    source = 'raw'
+    columns = None
+    if rollups is not None:
+        minutes = rollups.read(start, end, fields)
+        if len(minutes['bucket']) >= max_points:
+            source = f'rollup_{ROLLUP_SECONDS}s'
+            count = np.maximum(minutes['count'], 1)
+            columns = {'timestamp': minutes['bucket']}
+            columns.update({field: minutes[f"{field}_sum"] / count for field in fields})
+    if columns is None:
+        columns = data_logger.read_columns(start, end, fields)
+
+    total = len(columns['timestamp'])
+    selected = downsample(columns['timestamp'], columns[fields[0]], max_points, method)
+    times = [DataLogger._db_time(t) for t in columns['timestamp'][selected].tolist()]
+    values = [columns[field][selected].tolist() for field in fields]
+    return {
+        'data': [dict(zip(['timestamp'] + fields, row)) for row in zip(times, *values)],
+        'source': source,
+        'method': method,
+        'source_points': total
+    }
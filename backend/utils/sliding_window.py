@@ -0,0 +1,118 @@
+"""
+مجمّعات نوافذ منزلقة تزايدية لقواعد التنبيه المعتمدة على الزمن
+كل دفعة قراءة تكلف O(1) مطفأة مهما كان طول النافذة (مجاميع جارية وطوابير رتيبة)
+"""
+
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+class WindowChange:
+    """التغير خلال النافذة: القيمة الحالية ناقص أقدم قيمة ضمن النافذة"""
+
+    def __init__(self, window: float):
+        self.window = window
+        self.samples = deque()
+
+    def push(self, t: float, value: float) -> float:
+        self.samples.append((t, value))
+        while self.samples[0][0] < t - self.window:
+            self.samples.popleft()
+        return value - self.samples[0][1]
+
+
+class WindowMean:
+    """المتوسط المتحرك بمجموع جارٍ"""
+
+    def __init__(self, window: float):
+        self.window = window
+        self.samples = deque()
+        self.total = 0.0
+
+    def push(self, t: float, value: float) -> float:
+        self.samples.append((t, value))
+        self.total += value
+        while self.samples[0][0] < t - self.window:
+            self.total -= self.samples.popleft()[1]
+        if len(self.samples) == 1:
+            self.total = value  # إعادة ضبط الخطأ التراكمي للفاصلة العائمة
+        return self.total / len(self.samples)
+
+
+class WindowExtreme:
+    """أدنى/أعلى قيمة في النافذة بطابور رتيب"""
+
+    def __init__(self, window: float, mode: str = "min"):
+        self.window = window
+        self.sign = 1.0 if mode == "min" else -1.0
+        self.samples = deque()  # قيم (موقّعة) رتيبة تصاعدياً
+
+    def push(self, t: float, value: float) -> float:
+        signed = self.sign * value
+        while self.samples and self.samples[-1][1] >= signed:
+            self.samples.pop()
+        self.samples.append((t, signed))
+        while self.samples[0][0] < t - self.window:
+            self.samples.popleft()
+        return self.sign * self.samples[0][1]
+
+
+class DurationAbove:
+    """الزمن المتصل (ثوانٍ) الذي بقيت فيه القيمة فوق حد معين"""
+
+    def __init__(self, level: float):
+        self.level = level
+        self.since: Optional[float] = None
+
+    def push(self, t: float, value: float) -> float:
+        if value <= self.level:
+            self.since = None
+            return 0.0
+        if self.since is None:
+            self.since = t
+        return t - self.since
+
+
+WINDOW_TYPES = {
+    'change': lambda rule: WindowChange(rule.window),
+    'moving_average': lambda rule: WindowMean(rule.window),
+    'window_min': lambda rule: WindowExtreme(rule.window, "min"),
+    'window_max': lambda rule: WindowExtreme(rule.window, "max"),
+    'duration_above': lambda rule: DurationAbove(rule.above),
+}
+
+
+class WindowedAggregates:
+    """حالة المجمّعات لكل (قاعدة × خزان) وحساب أعمدتها المشتقة"""
+
+    def __init__(self):
+        self.aggregators: Dict[tuple, Any] = {}
+
+    def update(self, rules: List[Any], columns: Dict[str, Any], keys: List[Any],
+               now: float) -> Dict[str, np.ndarray]:
+        """دفع القراءات الحالية وإرجاع عمود مشتق لكل قاعدة نافذة"""
+        derived = {}
+        for rule in rules:
+            column = columns.get(rule.field)
+            if column is None:
+                continue
+            values = np.full(len(keys), np.nan)
+            for j, key in enumerate(keys):
+                value = column[j]
+                if value is None or value != value:
+                    continue
+                # المفتاح يتضمن تعريف النافذة فتبدأ من جديد إذا تغيرت بإعادة التحميل
+                agg_key = (rule.name, rule.type, rule.window, rule.above, key)
+                aggregator = self.aggregators.get(agg_key)
+                if aggregator is None:
+                    aggregator = self.aggregators[agg_key] = WINDOW_TYPES[rule.type](rule)
+                values[j] = aggregator.push(now, float(value))
+            derived[rule.source] = values
+        return derived
+
+    def prune(self, rules: List[Any]):
+        """حذف مجمّعات القواعد التي أزيلت أو تغير تعريفها"""
+        current = {(rule.name, rule.type, rule.window, rule.above) for rule in rules}
+        self.aggregators = {k: v for k, v in self.aggregators.items() if k[:4] in current}
@@ -0,0 +1,157 @@
+"""
+لقطات ثنائية مضغوطة لحالة التوأم الرقمي (الخزان، الذكاء الاصطناعي، التنبيهات)
+تسمح بالاستئناف الفوري بعد إعادة التشغيل وباستنساخ الحالة الحية لتشغيل السيناريوهات
+"""
+
+import copy
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'WTSN'
+FORMAT_VERSION = 2
+
+# رأس الملف: المعرّف، الإصدار، وقت الالتقاط، طول الحمولة، CRC32
+HEADER = struct.Struct('<4sHdII')
+# رأس كل قسم: الوسم وطول البيانات
+SECTION = struct.Struct('<4sI')
+
+
+def pack_sections(sections: Dict[bytes, bytes]) -> bytes:
+    """دمج الأقسام الثنائية في حمولة واحدة"""
+    parts = []
+    for tag, data in sections.items():
+        parts.append(SECTION.pack(tag, len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+
+def unpack_sections(payload: bytes) -> Dict[bytes, bytes]:
+    """تفكيك الحمولة إلى أقسامها"""
+    sections = {}
+    offset = 0
+    while offset < len(payload):
+        tag, length = SECTION.unpack_from(payload, offset)
+        offset += SECTION.size
+        sections[tag] = payload[offset:offset + length]
+        offset += length
+    return sections
+
+
+class StateSnapshotter:
+    """حفظ واستعادة لقطات حالة التوأم الرقمي"""
+
+    def __init__(self, path="data/twin_state.snap", interval: float = 30.0,
+                 history_window: int = 1000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.interval = interval
+        self.history_window = history_window
+        self.last_saved = 0.0
+        self.last_size = 0
+
+    def capture(self, tank, ai, alerts=None) -> bytes:
+        """التقاط الحالة الحالية كبيانات ثنائية"""
+        tank_state = tank.export_state(self.history_window)
+        history = np.ascontiguousarray(tank_state.pop('history'))
+        meta = {
+            'tank': tank_state,
+            'ai': ai.export_state(),
+            'alerts': alerts.export_state() if alerts is not None else {},
+            'history_dtype': history.dtype.descr
+        }
+        sections = {
+            b'META': json.dumps(meta, separators=(',', ':')).encode('utf-8'),
+            # التاريخ يُخزن كبايتات المصفوفة المهيكلة مباشرة
+            b'HIST': history.tobytes()
+        }
+        payload = zlib.compress(pack_sections(sections), 6)
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, time.time(), len(payload), zlib.crc32(payload))
+        return header + payload
+
+    def restore(self, blob: bytes, tank, ai, alerts=None) -> Dict[str, Any]:
+        """استعادة الحالة من بيانات ثنائية"""
+        magic, version, created_at, length, crc = HEADER.unpack_from(blob, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a twin snapshot")
+        if version > FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot version: {version}")
+
+        payload = blob[HEADER.size:HEADER.size + length]
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            raise ValueError("Corrupted snapshot")
+
+        sections = unpack_sections(zlib.decompress(payload))
+        meta = json.loads(sections[b'META'].decode('utf-8'))
+
+        tank_state = meta['tank']
+        if b'HIST' in sections:
+            dtype = np.dtype([tuple(field) for field in meta['history_dtype']])
+            tank_state['history'] = np.frombuffer(sections[b'HIST'], dtype=dtype)
+        else:
+            tank_state.pop('history', None)
+        tank.load_state(tank_state)
+        ai.load_state(meta['ai'])
+        if alerts is not None:
+            alerts.load_state(meta.get('alerts', {}))
+
+        return {
+            'created_at': created_at,
+            'age_seconds': round(time.time() - created_at, 3),
+            'size_bytes': len(blob)
+        }
+
+    def save(self, tank, ai, alerts=None) -> int:
+        """كتابة لقطة على القرص بشكل ذري"""
+        blob = self.capture(tank, ai, alerts)
+        tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp_path, self.path)
+
+        self.last_saved = time.monotonic()
+        self.last_size = len(blob)
+        return len(blob)
+
+    def maybe_save(self, tank, ai, alerts=None) -> bool:
+        """حفظ لقطة إذا انقضت الفترة المحددة"""
+        if time.monotonic() - self.last_saved < self.interval:
+            return False
+        try:
+            self.save(tank, ai, alerts)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving snapshot: {e}")
+            return False
+
+    def load(self, tank, ai, alerts=None) -> Optional[Dict[str, Any]]:
+        """استعادة آخر لقطة محفوظة إن وجدت"""
+        if not self.path.exists():
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                info = self.restore(f.read(), tank, ai, alerts)
+            self.last_saved = time.monotonic()
+            logger.info(f"✅ State restored from snapshot ({info['size_bytes']} bytes, "
+                        f"{info['age_seconds']}s old)")
+            return info
+        except Exception as e:
+            logger.error(f"Error restoring snapshot: {e}")
+            return None
+
+    def clone(self, tank, ai) -> Tuple[Any, Any]:
+        """استنساخ الحالة الحية في نسخ مستقلة (لتشغيل السيناريوهات)"""
+        blob = self.capture(tank, ai)
+        tank_copy = type(tank)(copy.deepcopy(tank.config))
+        ai_copy = type(ai)(copy.deepcopy(ai.config))
+        self.restore(blob, tank_copy, ai_copy)
+        return tank_copy, ai_copy
@@ -0,0 +1,119 @@
+"""
+خدمة إحصائيات تزايدية لـ /api/system/stats
+تُهيّأ من قاعدة البيانات مرة واحدة عند البدء ثم تُحدّث من مستمعي DataLogger،
+ومتوسط آخر 24 ساعة يُحفظ في دلاء دقيقة بمجموع جارٍ
+"""
+
+import logging
+import sqlite3
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from utils.data_logger import DataLogger
+
+logger = logging.getLogger(__name__)
+
+BUCKET_SECONDS = 60
+WINDOW_SECONDS = 24 * 3600
+
+
+class StatsService:
+    """عدادات قاعدة البيانات في الذاكرة"""
+
+    def __init__(self, data_logger: DataLogger):
+        self.data_logger = data_logger
+        self.tank_readings_count = 0
+        self.ai_logs_count = 0
+        self.first_reading: Optional[str] = None
+        self.last_reading: Optional[str] = None
+
+        # دلاء الدقيقة: [بداية الدقيقة (epoch)، مجموع المستوى، العدد]
+        self.buckets = deque()
+        self.window_sum = 0.0
+        self.window_count = 0
+
+        self.seed()
+        data_logger.add_listener(self.on_write)
+
+    def seed(self):
+        """تهيئة العدادات من قاعدة البيانات (مرة واحدة عند البدء)"""
+        started = time.perf_counter()
+        conn = sqlite3.connect(self.data_logger.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT COUNT(*) FROM tank_readings')
+        self.tank_readings_count = cursor.fetchone()[0]
+        cursor.execute('SELECT COUNT(*) FROM ai_logs')
+        self.ai_logs_count = cursor.fetchone()[0]
+
+        # المعرّفات تتبع ترتيب الإدراج، فأول/آخر قراءة تُقرأ من طرفي الفهرس الأساسي
+        cursor.execute('SELECT timestamp FROM tank_readings ORDER BY id ASC LIMIT 1')
+        row = cursor.fetchone()
+        self.first_reading = row[0] if row else None
+        cursor.execute('SELECT timestamp FROM tank_readings ORDER BY id DESC LIMIT 1')
+        row = cursor.fetchone()
+        self.last_reading = row[0] if row else None
+
+        since = time.time() - WINDOW_SECONDS
+        cursor.execute('''
+            SELECT CAST((julianday(timestamp) - 2440587.5) * 86400 / ? AS INTEGER) * ? AS bucket,
+                   SUM(water_level), COUNT(*)
+            FROM tank_readings
+            WHERE timestamp >= ?
+            GROUP BY bucket
+            ORDER BY bucket
+        ''', (BUCKET_SECONDS, BUCKET_SECONDS, DataLogger._db_time(since)))
+        self.buckets = deque([bucket, total or 0.0, count] for bucket, total, count in cursor.fetchall())
+        self.window_sum = sum(b[1] for b in self.buckets)
+        self.window_count = sum(b[2] for b in self.buckets)
+        conn.close()
+
+        logger.info(f"📊 Stats seeded in {(time.perf_counter() - started) * 1000:.1f} ms "
+                    f"({self.tank_readings_count} readings)")
+
+    def on_write(self, table: str, row: Dict[str, Any], timestamp: float):
+        """مستمع DataLogger: تحديث العدادات بعد كل كتابة"""
+        if table == 'tank_readings':
+            self.tank_readings_count += 1
+            self.last_reading = DataLogger._db_time(timestamp)
+            if self.first_reading is None:
+                self.first_reading = self.last_reading
+
+            bucket = int(timestamp // BUCKET_SECONDS) * BUCKET_SECONDS
+            if self.buckets and self.buckets[-1][0] == bucket:
+                self.buckets[-1][1] += row['water_level']
+                self.buckets[-1][2] += 1
+            else:
+                self.buckets.append([bucket, row['water_level'], 1])
+            self.window_sum += row['water_level']
+            self.window_count += 1
+            self._evict(timestamp)
+        elif table == 'ai_logs':
+            self.ai_logs_count += 1
+
+    def _evict(self, now: float):
+        """إخراج الدلاء الأقدم من 24 ساعة"""
+        cutoff = now - WINDOW_SECONDS
+        while self.buckets and self.buckets[0][0] + BUCKET_SECONDS <= cutoff:
+            _, total, count = self.buckets.popleft()
+            self.window_sum -= total
+            self.window_count -= count
+        if not self.buckets:
+            self.window_sum, self.window_count = 0.0, 0
+
+    def avg_water_level_24h(self) -> float:
+        """متوسط المستوى في آخر 24 ساعة"""
+        self._evict(time.time())
+        return self.window_sum / self.window_count if self.window_count else 0.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """العدادات الحالية (من الذاكرة)"""
+        avg = self.avg_water_level_24h()
+        return {
+            'tank_readings_count': self.tank_readings_count,
+            'first_reading': self.first_reading,
+            'last_reading': self.last_reading,
+            'ai_logs_count': self.ai_logs_count,
+            'avg_water_level_24h': round(avg, 2) if avg else 0
+        }
@@ -0,0 +1,152 @@
+"""
+اشتراكات Socket.IO بالمواضيع عبر الغرف
+كل عميل يشترك في خزانات وأنواع أحداث وحد أدنى لخطورة التنبيهات، مع صيغة
+نقل ووضع دلتا. الاشتراك يتحول إلى غرف مسماة بتركيبة (الموضوع، الخزان،
+[الخطورة]، الصيغة، [الدلتا])، فيُرمّز كل حدث مرة واحدة لكل تركيبة ويُرسل
+إلى غرفها غير الفارغة فقط، ولا يصل العميل إلا ما اشترك فيه.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from utils.wire_format import DEFAULT_FORMAT, available_formats, encode_event
+
+DEFAULT_TANK = "main"
+SEVERITY_LEVELS = ('low', 'medium', 'high', 'critical')
+
+# نوع الحدث المُرسل ← موضوع الاشتراك
+EVENT_TOPICS = {
+    'tank_update': 'tank_update',
+    'alert': 'alert',
+    'alert_cleared': 'alert',
+    'ai_log': 'ai_log',
+}
+TOPICS = ('tank_update', 'alert', 'ai_log')
+
+
+@dataclass
+class ClientSubscription:
+    """اشتراك عميل واحد"""
+    fmt: str = DEFAULT_FORMAT
+    delta: bool = False  # لا ينطبق على struct (تخطيطها الثابت أصغر من إطار دلتا)
+    tanks: Set[str] = field(default_factory=lambda: {DEFAULT_TANK})
+    events: Set[str] = field(default_factory=lambda: set(TOPICS))
+    min_severity: str = SEVERITY_LEVELS[0]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'format': self.fmt,
+            'delta': self.delta,
+            'tanks': sorted(self.tanks),
+            'events': sorted(self.events),
+            'min_severity': self.min_severity
+        }
+
+
+class Subscriptions:
+    """سجل الاشتراكات وعدد أعضاء كل غرفة"""
+
+    def __init__(self):
+        self.clients: Dict[str, ClientSubscription] = {}
+        self.members: Dict[str, int] = defaultdict(int)
+
+    @staticmethod
+    def room(topic: str, tank: str, fmt: str, delta: bool = False,
+             severity: Optional[str] = None) -> str:
+        name = f"{topic}:{tank}"
+        if severity is not None:
+            name += f":{severity}"
+        name += f"|{fmt}"
+        return name + ":delta" if delta else name
+
+    def rooms_for(self, sub: ClientSubscription) -> Set[str]:
+        """الغرف التي ينتمي إليها اشتراك"""
+        rooms = set()
+        for tank in sub.tanks:
+            for topic in sub.events:
+                if topic == 'alert':
+                    rooms.add(self.room(topic, tank, sub.fmt, severity=sub.min_severity))
+                else:
+                    rooms.add(self.room(topic, tank, sub.fmt, delta=sub.delta and topic == 'tank_update'))
+        return rooms
+
+    def get(self, sid: str) -> ClientSubscription:
+        return self.clients.get(sid) or ClientSubscription()
+
+    def update(self, sid: str, fmt: Optional[str] = None, delta: Optional[bool] = None,
+               tanks: Optional[Iterable[str]] = None, events: Optional[Iterable[str]] = None,
+               min_severity: Optional[str] = None) -> Tuple[Set[str], Set[str], ClientSubscription]:
+        """تعديل اشتراك عميل (None = بدون تغيير)؛ يُرجع (غرف للمغادرة، غرف للانضمام، الاشتراك)"""
+        current = self.clients.get(sid)
+        sub = ClientSubscription(**vars(current)) if current else ClientSubscription()
+        if fmt is not None:
+            sub.fmt = fmt
+        if delta is not None:
+            sub.delta = delta
+        if tanks is not None:
+            sub.tanks = {str(tank) for tank in tanks}
+        if events is not None:
+            unknown = set(events) - set(TOPICS)
+            if unknown:
+                raise ValueError(f"Unknown events: {', '.join(sorted(unknown))}")
+            sub.events = set(events)
+        if min_severity is not None:
+            if min_severity not in SEVERITY_LEVELS:
+                raise ValueError(f"Unknown severity: {min_severity}")
+            sub.min_severity = min_severity
+        sub.delta = sub.delta and sub.fmt != 'struct'
+
+        before = self.rooms_for(current) if current else set()
+        after = self.rooms_for(sub)
+        for room in before - after:
+            self.members[room] -= 1
+            if self.members[room] <= 0:
+                del self.members[room]
+        for room in after - before:
+            self.members[room] += 1
+        self.clients[sid] = sub
+        return before - after, after - before, sub
+
+    def discard(self, sid: str):
+        """إزالة عميل عند قطع الاتصال (Socket.IO يُخرجه من غرفه تلقائياً)"""
+        sub = self.clients.pop(sid, None)
+        if sub is None:
+            return
+        for room in self.rooms_for(sub):
+            self.members[room] -= 1
+            if self.members[room] <= 0:
+                del self.members[room]
+
+    def targets(self, event: str, tank: str = DEFAULT_TANK,
+                severity: Optional[str] = None) -> List[Tuple[str, str, bool]]:
+        """الغرف غير الفارغة التي يجب أن تتلقى الحدث: (الغرفة، الصيغة، دلتا)"""
+        topic = EVENT_TOPICS[event]
+        targets = []
+        for fmt in available_formats():
+            if topic == 'alert':
+                # التنبيه يصل إلى كل غرف الحد الأدنى التي لا تتجاوز خطورته
+                rank = SEVERITY_LEVELS.index(severity) if severity in SEVERITY_LEVELS else 0
+                for level in SEVERITY_LEVELS[:rank + 1]:
+                    targets.append((self.room(topic, tank, fmt, severity=level), fmt, False))
+            else:
+                targets.append((self.room(topic, tank, fmt), fmt, False))
+                if topic == 'tank_update' and fmt != 'struct':
+                    targets.append((self.room(topic, tank, fmt, delta=True), fmt, True))
+        return [target for target in targets if self.members.get(target[0])]
+
+    def emit(self, emitter, event: str, payload: Any, tank: str = DEFAULT_TANK,
+             severity: Optional[str] = None, delta: Optional[Dict[str, Any]] = None) -> int:
+        """إرسال حدث لمشتركيه بترميز واحد لكل (صيغة، وضع)؛ يُرجع عدد الغرف
+
+        emitter هو socketio أو BroadcastHub (emit(event, data, to=rooms)).
+        إذا مُرر delta تتلقى غرف الدلتا الحدث {event}_delta بدلاً من الحمولة الكاملة.
+        """
+        groups = defaultdict(list)
+        targets = self.targets(event, tank, severity)
+        for room, fmt, is_delta in targets:
+            name = f"{event}_delta" if is_delta and delta is not None else event
+            groups[(name, fmt)].append(room)
+        for (name, fmt), rooms in groups.items():
+            emitter.emit(name, encode_event(name, delta if name != event else payload, fmt), to=rooms)
+        return len(targets)
@@ -0,0 +1,76 @@
+"""
+نافذة قياسات مشتركة داخل العملية بين مراحل المحاكاة
+تكتب فيها مرحلة الفيزياء وتقرأ منها مراحل الذكاء الاصطناعي والتنبيهات والبث
+"""
+
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from utils.ring_buffer import RingBuffer
+
+TELEMETRY_DTYPE = np.dtype([
+    ('timestamp', 'f8'),
+    ('tick', 'i8'),
+    ('water_level', 'f8'),
+    ('water_volume', 'f8'),
+    ('temperature', 'f8'),
+    ('pressure', 'f8'),
+    ('ph_level', 'f8'),
+    ('turbidity', 'f8'),
+    ('is_filling', '?'),
+    ('is_draining', '?'),
+    ('leak_detected', '?'),
+    ('flow_rate', 'f8'),
+])
+
+
+class TelemetryWindow:
+    """نافذة قياسات بكاتب واحد وعدة قرّاء بدون أقفال
+
+    الكاتب يكتب السجل أولاً ثم يزيد رقم التسلسل ويستبدل مرجع آخر حالة،
+    فيرى القارئ إما النشر السابق كاملاً أو الجديد كاملاً. النوافذ المُرجعة
+    عروض بدون نسخ وتبقى صالحة حتى (capacity - limit) عملية نشر لاحقة؛
+    استخدم window(...).copy() للاحتفاظ بها لفترة أطول.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self._buffer = RingBuffer(TELEMETRY_DTYPE, capacity)
+        self._latest: Optional[Dict[str, Any]] = None
+        self.sequence = 0
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def publish(self, state: Dict[str, Any], tick: int = 0, timestamp: float = None):
+        """نشر قراءة جديدة (من مرحلة الفيزياء فقط)"""
+        self._buffer.append((
+            timestamp if timestamp is not None else time.time(),
+            tick,
+            state['water_level'],
+            state['water_volume'],
+            state['temperature'],
+            state['pressure'],
+            state['ph_level'],
+            state['turbidity'],
+            state['is_filling'],
+            state['is_draining'],
+            state['leak_detected'],
+            state['flow_rate'],
+        ))
+        self._latest = state
+        self.sequence += 1
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """آخر حالة منشورة"""
+        return self._latest
+
+    def window(self, limit: int = None) -> np.ndarray:
+        """آخر limit قراءة بالترتيب الزمني (عرض بدون نسخ)"""
+        return self._buffer.window(limit)
+
+    def read(self, limit: int = None) -> Tuple[int, np.ndarray]:
+        """رقم التسلسل مع النافذة المقابلة له"""
+        sequence = self.sequence
+        return sequence, self._buffer.window(limit)
@@ -0,0 +1,140 @@
+"""
+مجدول متعدد المعدلات لحلقة المحاكاة مبني على مؤقتات gevent
+كل مرحلة تعمل بمعدلها الخاص وفق مواعيد مطلقة فلا يتراكم الانحراف
+"""
+
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import gevent
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StageStats:
+    """إحصائيات مرحلة واحدة"""
+    runs: int = 0
+    errors: int = 0
+    overruns: int = 0  # مرات تجاوز الموعد التالي
+    skipped_ticks: int = 0  # نبضات فائتة تم تخطيها
+    last_duration: float = 0.0  # ثانية
+    max_duration: float = 0.0
+    total_duration: float = 0.0
+    max_lateness: float = 0.0  # أقصى تأخر عن الموعد
+
+
+@dataclass
+class Stage:
+    """مرحلة مجدولة"""
+    name: str
+    interval: float
+    callback: Callable[[float], Any]
+    offset: float = 0.0
+    stats: StageStats = field(default_factory=StageStats)
+
+
+class TickScheduler:
+    """مجدول مراحل بمواعيد مطلقة
+
+    الموعد رقم k لكل مرحلة هو epoch + offset + k·interval، لذلك زمن
+    المعالجة لا يضاف إلى الدورة. إذا تجاوزت المرحلة موعدها التالي تُحسب
+    النبضات الفائتة وتُتخطى، وتتلقى الاستدعاءة التالية dt يغطي الزمن كاملاً.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Stage] = {}
+        self.running = False
+        self.started_at: Optional[float] = None
+        self._greenlets: List[gevent.Greenlet] = []
+
+    def add_stage(self, name: str, interval: float, callback: Callable[[float], Any],
+                  offset: float = 0.0) -> Stage:
+        """تسجيل مرحلة تُستدعى كل interval ثانية مع dt المنقضي"""
+        if interval <= 0:
+            raise ValueError(f"Stage {name}: interval must be positive")
+        stage = Stage(name, interval, callback, offset)
+        self.stages[name] = stage
+        return stage
+
+    def start(self):
+        """بدء جميع المراحل"""
+        if self.running:
+            return
+        self.running = True
+        epoch = time.monotonic()
+        self.started_at = time.time()
+        self._greenlets = [
+            gevent.spawn(self._run_stage, stage, epoch) for stage in self.stages.values()
+        ]
+
+    def stop(self):
+        """إيقاف جميع المراحل"""
+        self.running = False
+        greenlets, self._greenlets = self._greenlets, []
+        current = gevent.getcurrent()
+        gevent.killall([g for g in greenlets if g is not current], block=False)
+
+    def _run_stage(self, stage: Stage, epoch: float):
+        """حلقة مرحلة واحدة"""
+        stats = stage.stats
+        tick = 0
+        ticks_elapsed = 1
+
+        while self.running:
+            deadline = epoch + stage.offset + tick * stage.interval
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                gevent.sleep(delay)
+            if not self.running:
+                break
+
+            started = time.monotonic()
+            stats.max_lateness = max(stats.max_lateness, started - deadline)
+            try:
+                stage.callback(stage.interval * ticks_elapsed)
+            except Exception as e:
+                stats.errors += 1
+                logger.error(f"❌ Error in stage {stage.name}: {e}")
+
+            duration = time.monotonic() - started
+            stats.runs += 1
+            stats.last_duration = duration
+            stats.total_duration += duration
+            stats.max_duration = max(stats.max_duration, duration)
+
+            # حساب الموعد التالي وتخطي النبضات الفائتة عند التجاوز
+            tick += 1
+            ticks_elapsed = 1
+            now = time.monotonic()
+            next_deadline = epoch + stage.offset + tick * stage.interval
+            if now > next_deadline:
+                missed = int((now - next_deadline) // stage.interval) + 1
+                stats.overruns += 1
+                stats.skipped_ticks += missed
+                tick += missed
+                ticks_elapsed += missed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """إحصائيات جميع المراحل"""
+        stages = {}
+        for name, stage in self.stages.items():
+            stats = stage.stats
+            stages[name] = {
+                'interval': stage.interval,
+                'runs': stats.runs,
+                'errors': stats.errors,
+                'overruns': stats.overruns,
+                'skipped_ticks': stats.skipped_ticks,
+                'last_duration_ms': round(stats.last_duration * 1000, 3),
+                'max_duration_ms': round(stats.max_duration * 1000, 3),
+                'avg_duration_ms': round(stats.total_duration / stats.runs * 1000, 3) if stats.runs else 0,
+                'max_lateness_ms': round(stats.max_lateness * 1000, 3)
+            }
+        return {
+            'running': self.running,
+            'started_at': self.started_at,
+            'stages': stages
+        }
@@ -0,0 +1,115 @@
+"""
+صيغ نقل قابلة للتفاوض لأحداث Socket.IO واستجابات التاريخ
+- json: الافتراضي (قواميس يسلسلها Socket.IO/Flask)
+- msgpack: ثنائي عام لكل الأحداث (اختياري: يتطلب حزمة msgpack)
+- struct: تخطيط ثابت لـ tank_update (42 بايتاً بدلاً من ~350)؛ بقية الأحداث
+  تُرسل بـ msgpack إن توفر وإلا JSON
+كل حمولة تُرمّز مرة واحدة لكل صيغة مستخدمة، لا لكل عميل
+"""
+
+import struct
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # الصيغة الثنائية العامة اختيارية
+    msgpack = None
+
+DEFAULT_FORMAT = 'json'
+
+# تخطيط tank_update: الإصدار، أعلام (ملء/تصريف/تسرب)، الزمن (epoch)، ثم 8 قيم float32
+TANK_STATE_VERSION = 1
+TANK_STATE_STRUCT = struct.Struct('<BBd8f')
+TANK_STATE_FLOATS = (
+    'water_level', 'water_volume', 'temperature', 'pressure',
+    'ph_level', 'turbidity', 'flow_rate', 'capacity'
+)
+TANK_STATE_FLAGS = ('is_filling', 'is_draining', 'leak_detected')
+
+HTTP_MIMETYPES = {
+    'json': 'application/json',
+    'msgpack': 'application/msgpack',
+    'struct': 'application/octet-stream',
+}
+
+
+def available_formats() -> tuple:
+    """الصيغ المدعومة في هذه البيئة"""
+    return ('json', 'msgpack', 'struct') if msgpack is not None else ('json', 'struct')
+
+
+def negotiate(requested: Optional[str]) -> str:
+    """الصيغة المطلوبة إن كانت مدعومة وإلا JSON"""
+    requested = (requested or '').strip().lower()
+    return requested if requested in available_formats() else DEFAULT_FORMAT
+
+
+def negotiate_http(accept) -> str:
+    """اختيار صيغة استجابة HTTP من ترويسة Accept (MIMEAccept في Flask)"""
+    offers = [HTTP_MIMETYPES[fmt] for fmt in available_formats()]
+    best = accept.best_match(offers, default=HTTP_MIMETYPES[DEFAULT_FORMAT])
+    return next(fmt for fmt, mimetype in HTTP_MIMETYPES.items() if mimetype == best)
+
+
+def _default(value):
+    """أنواع NumPy داخل الحمولات"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def packb(payload: Any) -> bytes:
+    """ترميز MessagePack"""
+    if msgpack is None:
+        raise ValueError("msgpack format is not available")
+    return msgpack.packb(payload, use_bin_type=True, default=_default)
+
+
+def pack_tank_state(state: Dict[str, Any]) -> bytes:
+    """ترميز حالة الخزان بالتخطيط الثابت"""
+    timestamp = state.get('last_update')
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp).timestamp()
+    flags = 0
+    for bit, name in enumerate(TANK_STATE_FLAGS):
+        if state.get(name):
+            flags |= 1 << bit
+    return TANK_STATE_STRUCT.pack(
+        TANK_STATE_VERSION, flags, float(timestamp or 0.0),
+        *(float(state.get(name) or 0.0) for name in TANK_STATE_FLOATS)
+    )
+
+
+def unpack_tank_state(data: bytes) -> Dict[str, Any]:
+    """فك التخطيط الثابت (مرجع للعملاء)"""
+    version, flags, timestamp, *values = TANK_STATE_STRUCT.unpack(data)
+    if version != TANK_STATE_VERSION:
+        raise ValueError(f"Unsupported tank state version {version}")
+    state = dict(zip(TANK_STATE_FLOATS, values))
+    state.update({name: bool(flags & (1 << bit)) for bit, name in enumerate(TANK_STATE_FLAGS)})
+    state['last_update'] = timestamp
+    return state
+
+
+def encode_event(event: str, payload: Any, fmt: str) -> Any:
+    """ترميز حمولة حدث بصيغة معينة (الحمولات الثنائية تُرسل كمرفقات Socket.IO)"""
+    if fmt == 'struct' and event == 'tank_update':
+        return pack_tank_state(payload)
+    if fmt in ('msgpack', 'struct') and msgpack is not None:
+        return packb(payload)
+    return payload
+
+
+def encode_records(window: np.ndarray) -> bytes:
+    """نافذة مهيكلة كبايتات خام (little-endian بترتيب حقول النوع)"""
+    return np.ascontiguousarray(window, dtype=window.dtype.newbyteorder('<')).tobytes()
+
+
+def record_layout(dtype: np.dtype) -> str:
+    """وصف تخطيط السجلات لترويسة X-Record-Layout"""
+    return ','.join(f"{name}:{dtype.fields[name][0].str.lstrip('<>|=')}" for name in dtype.names)